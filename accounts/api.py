@@ -1,35 +1,41 @@
 from typing import List
 
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.db.models import Q
 from ninja import Router
 from ninja.pagination import paginate
 
 from accounts.models import User
-from accounts.schema import UserSchema, PatchUserSchema, CreateUserSchema
+from accounts.schema import (
+    UserSchema,
+    PatchUserSchema,
+    CreateUserSchema,
+    UserBulkImportResponseSchema,
+)
+from accounts.user_service import import_users, search_users
+from heats.models import HeatRoster
+from jobs.job_service import queue_import_job
+from jobs.models import ImportJob
+from jobs.schema import ImportJobSchema
 from locations.models import Location
-from participants.models import Participant, RelayParticipant
+from participants.models import Participant, Participation
 from participants.schema.particiapnt import (
     ParticipantSchema,
     ParticipationSchema,
     CreateParticipantSchema,
 )
-from tridu_server.schemas import BulkCreateResponseSchema, ErrorObjectSchema
+from tridu_server.pagination import CursorPagination
+from tridu_server.schemas import ErrorObjectSchema, get_import_message
 
 router = Router()
 
 
 @router.get("/active/non-staff", tags=["user"], response=List[UserSchema])
-@paginate
+@paginate(CursorPagination)
 def get_active_non_staff_users(request, name: str = ""):
     if name != "":
-        queryset = User.objects.filter(is_staff=False, is_active=True)
-        for term in name.split():
-            queryset = queryset.filter(
-                Q(first_name__icontains=term) | Q(last_name__icontains=term)
-            )
-        users = queryset.order_by("first_name", "last_name").all()
-        return users
+        return search_users(User.objects.filter(is_staff=False, is_active=True), name)
     users = (
         User.objects.exclude(Q(is_staff=True) | Q(is_active=False))
         .order_by("first_name", "last_name")
@@ -39,69 +45,34 @@ def get_active_non_staff_users(request, name: str = ""):
 
 
 @router.post(
-    "/import", tags=["user", "import"], response={201: BulkCreateResponseSchema}
+    "/import",
+    tags=["user", "import"],
+    response={201: UserBulkImportResponseSchema},
 )
-def create_users_bulk(request, userSchemas: List[CreateUserSchema]):
-
-    created = 0
-    duplicates = 0
-    errors = []
-    user_datas = []
-
-    for userSchema in userSchemas:
-        user_data = userSchema.dict()
+def create_users_bulk(request, userSchemas: List[CreateUserSchema], full: bool = False):
+    """Responds with the ids of the imported users, set full to also get every imported user."""
+    result = import_users([userSchema.dict() for userSchema in userSchemas])
+
+    return 201, UserBulkImportResponseSchema(
+        created=result.created,
+        duplicates=result.duplicates,
+        errors=result.errors,
+        message=get_import_message(
+            "users", result.created, result.duplicates, result.errors
+        ),
+        ids=[user.id for user in result.users],
+        items=result.users if full else None,
+    )
 
-        # create username
-        username = (
-            user_data.get("first_name", "").replace(" ", "").lower()
-            + "."
-            + user_data.get("last_name", "").replace(" ", "").lower()
-        )
 
-        try:
-            try:
-                user = User.objects.get(username=username, email=user_data.get("email"))
-                user.phone_number = user_data.get("phone_number", "")
-                user.date_of_birth = user_data.get("date_of_birth", "")
-                user.gender = user_data.get("gender", None)
-                user.save()
-                is_new = False
-            except User.DoesNotExist:
-                user = User.objects.create(
-                    username=username,
-                    email=user_data.get("email", ""),
-                    first_name=user_data.get("first_name", ""),
-                    last_name=user_data.get("last_name", ""),
-                    phone_number=user_data.get("phone_number", ""),
-                    date_of_birth=user_data.get("date_of_birth", ""),
-                    gender=user_data.get("gender", None),
-                )
-                is_new = True
-
-            if is_new:
-                created += 1
-            else:
-                duplicates += 1
-
-            user_datas.append(UserSchema.from_orm(user).model_dump_json())
-        except Exception as e:
-            errors.append(e.__str__())
-
-    return 201, {
-        "created": created,
-        "duplicates": duplicates,
-        "errors": errors,
-        "items": user_datas,
-        "message": (
-            "{} users created, {} were already found, no errors encountered.".format(
-                created, duplicates
-            )
-            if len(errors) == 0
-            else "{} participants created, {} were already found but {} errors encountered!".format(
-                created, duplicates, len(errors)
-            )
-        ),
-    }
+@router.post("/import/jobs", tags=["user", "import"], response={201: ImportJobSchema})
+def create_users_bulk_job(request, userSchemas: List[CreateUserSchema]):
+    """Queues the import for a background worker, poll the job for its progress and result."""
+    return 201, queue_import_job(
+        kind=ImportJob.Kinds.USERS,
+        rows=[userSchema.dict() for userSchema in userSchemas],
+        created_by=request.user,
+    )
 
 
 @router.post(
@@ -119,12 +90,19 @@ def admin_action_clean_gender(request):
 
     num_updated = 0
 
-    num_updated += User.objects.filter(gender__in=["W", "Woman", "Female"]).update(
-        gender="F"
-    )
-    num_updated += User.objects.filter(gender__in=["Man", "Male", "Man"]).update(
-        gender="M"
-    )
+    with transaction.atomic():
+        # update skips the roster receivers
+        HeatRoster.objects.mark_stale(
+            Participant.objects.filter(
+                user__gender__in=["W", "Woman", "Female", "Man", "Male"]
+            ).values("heat_id")
+        )
+        num_updated += User.objects.filter(gender__in=["W", "Woman", "Female"]).update(
+            gender="F"
+        )
+        num_updated += User.objects.filter(gender__in=["Man", "Male", "Man"]).update(
+            gender="M"
+        )
 
     return 200, "Action complete, {} instances updated".format(num_updated)
 
@@ -135,31 +113,18 @@ def admin_action_clean_gender(request):
     response={200: List[ParticipationSchema]},
 )
 def get_user_participations(request, user_id: int):
-    participations = []
-
-    participant: Participant
-    for participant in Participant.objects.of_user(user_id).all():
-        participations.append(
-            ParticipationSchema(
-                id=participant.id,
-                race=participant.race,
-                type=ParticipationSchema.ParticipationTypes.PARTICIPANT,
-                user=participant.user,
-                bib_number=participant.bib_number,
-            )
-        )
-
-    relay_participant: RelayParticipant
-    for relay_participant in RelayParticipant.objects.of_user(user_id):
-        participations.append(
-            ParticipationSchema(
-                id=relay_participant.id,
-                race=relay_participant.team.race,
-                type=ParticipationSchema.ParticipationTypes.RELAY_PARTICIPANT,
-                user=relay_participant.user,
-                bib_number=relay_participant.team.bib_number,
-            )
+    participations = [
+        ParticipationSchema(
+            id=participation.participation_id,
+            race=participation.race,
+            type=participation.kind,
+            user=participation.user,
+            bib_number=participation.bib_number,
         )
+        for participation in Participation.objects.of_user(user_id)
+        .select_related("race", "user")
+        .order_by("kind", "id")
+    ]
 
     return 200, participations
 
@@ -216,7 +181,7 @@ def create_user_participant(
     response={200: List[ParticipantSchema]},
 )
 def get_user_participants(request, user_id: int):
-    participants = Participant.objects.of_user(user_id).select_all_related()
+    participants = Participant.objects.of_user(user_id).prefetch_all_related()
     return 200, participants
 
 
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:00
+
+from django.db import migrations
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS accounts_user_first_name_trgm_idx "
+    "ON accounts_user USING gin (UPPER(first_name::text) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS accounts_user_last_name_trgm_idx "
+    "ON accounts_user USING gin (UPPER(last_name::text) gin_trgm_ops)",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS accounts_user_first_name_trgm_idx",
+    "DROP INDEX IF EXISTS accounts_user_last_name_trgm_idx",
+]
+
+# an external content FTS5 table over the user names, kept in sync by triggers
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE accounts_user_fts USING fts5("
+    "first_name, last_name, content='accounts_user', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER accounts_user_fts_insert AFTER INSERT ON accounts_user BEGIN "
+    "INSERT INTO accounts_user_fts(rowid, first_name, last_name) "
+    "VALUES (new.id, new.first_name, new.last_name); END",
+    "CREATE TRIGGER accounts_user_fts_delete AFTER DELETE ON accounts_user BEGIN "
+    "INSERT INTO accounts_user_fts(accounts_user_fts, rowid, first_name, last_name) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name); END",
+    "CREATE TRIGGER accounts_user_fts_update AFTER UPDATE OF first_name, last_name ON accounts_user BEGIN "
+    "INSERT INTO accounts_user_fts(accounts_user_fts, rowid, first_name, last_name) "
+    "VALUES ('delete', old.id, old.first_name, old.last_name); "
+    "INSERT INTO accounts_user_fts(rowid, first_name, last_name) "
+    "VALUES (new.id, new.first_name, new.last_name); END",
+    "INSERT INTO accounts_user_fts(accounts_user_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS accounts_user_fts_insert",
+    "DROP TRIGGER IF EXISTS accounts_user_fts_delete",
+    "DROP TRIGGER IF EXISTS accounts_user_fts_update",
+    "DROP TABLE IF EXISTS accounts_user_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0003_alter_user_gender"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(
+                {"postgresql": POSTGRESQL_FORWARD, "sqlite": SQLITE_FORWARD}
+            ),
+            run_for_vendor(
+                {"postgresql": POSTGRESQL_BACKWARD, "sqlite": SQLITE_BACKWARD}
+            ),
+        ),
+    ]
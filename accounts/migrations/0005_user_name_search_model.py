@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0004_user_name_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserNameSearch",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        db_column="rowid",
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="name_search",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("query", models.TextField(db_column="accounts_user_fts")),
+                ("rank", models.FloatField()),
+            ],
+            options={
+                "db_table": "accounts_user_fts",
+                "managed": False,
+            },
+        ),
+    ]
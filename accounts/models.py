@@ -28,3 +28,25 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.username
+
+
+class UserNameSearch(models.Model):
+    """
+    The SQLite FTS5 table over the user names created by the accounts 0004 migration, see user_service.search_users.
+    Only queried on SQLite, where the table exists, and never written, triggers on accounts_user keep it in sync.
+    """
+
+    user = models.OneToOneField(
+        to=User,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="name_search",
+    )
+    # the hidden column named after the table, comparing it to an FTS5 query string matches rows against it
+    query = models.TextField(db_column="accounts_user_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "accounts_user_fts"
@@ -1,6 +1,9 @@
+from typing import List
+
 from ninja import ModelSchema
 
 from accounts.models import User
+from tridu_server.schemas import BulkImportResponseSchema
 
 
 class UserSchema(ModelSchema):
@@ -48,6 +51,16 @@ class PatchUserSchema(ModelSchema):
         fields_optional = "__all__"
 
 
+class CompactUserSchema(ModelSchema):
+    class Meta:
+        model = User
+        fields = (
+            "id",
+            "first_name",
+            "last_name",
+        )
+
+
 class DownloadUserSchema(ModelSchema):
 
     class Meta:
@@ -59,3 +72,7 @@ class DownloadUserSchema(ModelSchema):
             "date_of_birth",
             "gender",
         )
+
+
+class UserBulkImportResponseSchema(BulkImportResponseSchema):
+    items: List[UserSchema] | None = None
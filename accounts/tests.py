@@ -0,0 +1,210 @@
+import unittest
+
+from django.db import connection
+from django.test import TestCase
+
+from accounts.api import get_active_non_staff_users
+from accounts.models import User
+from accounts.user_service import (
+    UserImportResult,
+    import_users,
+    save_imported_users,
+    search_users,
+)
+from tridu_server.pagination import CursorPagination
+
+
+class SearchUsersTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create(
+            [
+                User(username="john.smith", first_name="John", last_name="Smith"),
+                User(username="jane.johnson", first_name="Jane", last_name="Johnson"),
+                User(username="maria.garcia", first_name="Maria", last_name="Garcia"),
+                User(username="li.ng", first_name="Li", last_name="Ng"),
+            ]
+        )
+
+    def search(self, name: str) -> list:
+        return list(
+            search_users(User.objects.all(), name).values_list("username", flat=True)
+        )
+
+    def test_search(self):
+        self.assertEqual(self.search("john smith"), ["john.smith"])
+        self.assertEqual(sorted(self.search("joh")), ["jane.johnson", "john.smith"])
+        self.assertEqual(self.search("li ng"), ["li.ng"])
+        self.assertEqual(self.search('ma"r'), [])
+        self.assertEqual(self.search("xyz"), [])
+
+    def test_created_users_are_found(self):
+        User.objects.create(
+            username="zelda.brown", first_name="Zelda", last_name="Brown"
+        )
+
+        self.assertEqual(self.search("zelda"), ["zelda.brown"])
+
+    def test_renamed_users_are_found_by_their_new_name(self):
+        user = User.objects.get(username="maria.garcia")
+        user.first_name = "Mariana"
+        user.last_name = "Lopez"
+        user.save()
+        User.objects.filter(username="li.ng").update(last_name="Nguyen")
+
+        self.assertEqual(self.search("garcia"), [])
+        self.assertEqual(self.search("lopez"), ["maria.garcia"])
+        self.assertEqual(self.search("nguyen"), ["li.ng"])
+
+    def test_deleted_users_are_not_found(self):
+        User.objects.filter(username="john.smith").delete()
+
+        self.assertEqual(self.search("smith"), [])
+        self.assertEqual(self.search("joh"), ["jane.johnson"])
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "The FTS5 table is SQLite only")
+    def test_name_search_triggers_exist(self):
+        """A migration rebuilding accounts_user drops them, and search_users silently stops finding changed users."""
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'accounts_user'"
+            )
+            triggers = {row[0] for row in cursor.fetchall()}
+
+        self.assertLessEqual(
+            {
+                "accounts_user_fts_insert",
+                "accounts_user_fts_delete",
+                "accounts_user_fts_update",
+            },
+            triggers,
+        )
+
+
+class ActiveNonStaffUsersPaginationTestCase(TestCase):
+
+    def test_ranked_search_pages(self):
+        User.objects.bulk_create(
+            [
+                User(
+                    username="user{}".format(index),
+                    first_name=("Ann", "Anna", "Joanna", "Hannah")[index % 4],
+                    last_name="Last{}".format(index % 5),
+                )
+                for index in range(40)
+            ]
+        )
+
+        for name in ("", "ann", "anna last1"):
+            users = search_users(
+                User.objects.filter(is_staff=False, is_active=True), name
+            )
+            # the pagination breaks ties by pk
+            expected = list(
+                users.order_by(*users.query.order_by, "pk").values_list("id", flat=True)
+            )
+            items = []
+            cursor = None
+            while True:
+                page = get_active_non_staff_users(
+                    None,
+                    name=name,
+                    ninja_pagination=CursorPagination.Input(cursor=cursor, limit=3),
+                )
+                items += page["items"]
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+
+            self.assertEqual([user.id for user in items], expected, name)
+
+
+class ImportUsersTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.existing = User.objects.create(
+            username="john.smith",
+            email="john@example.com",
+            first_name="John",
+            last_name="Smith",
+        )
+
+    def get_row(self, first_name: str, last_name: str, **data) -> dict:
+        return {
+            "first_name": first_name,
+            "last_name": last_name,
+            "email": "{}@example.com".format(first_name.lower()),
+            "phone_number": "555-0100",
+            "gender": User.Genders.UNDEFINED,
+            **data,
+        }
+
+    def test_rows_are_created_and_matched(self):
+        result = import_users(
+            [
+                self.get_row("Jane", "Johnson"),
+                self.get_row("John", "Smith", phone_number="555-0199"),
+            ]
+        )
+
+        self.assertEqual((result.created, result.duplicates), (1, 1))
+        self.assertEqual(result.errors, [])
+        self.assertEqual(
+            [user.username for user in result.users], ["jane.johnson", "john.smith"]
+        )
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.phone_number, "555-0199")
+
+    def test_duplicates_within_a_batch(self):
+        result = import_users(
+            [
+                self.get_row("Mary Ann", "Lee"),
+                self.get_row("Mary Ann", "Lee", phone_number="555-0199"),
+            ]
+        )
+
+        self.assertEqual((result.created, result.duplicates), (1, 1))
+        self.assertEqual(
+            User.objects.get(username="maryann.lee").phone_number, "555-0199"
+        )
+
+    def test_username_with_another_email(self):
+        result = import_users(
+            [
+                self.get_row("John", "Smith", email="other@example.com"),
+                self.get_row("Jane", "Johnson"),
+            ],
+            first_row_number=5,
+        )
+
+        self.assertEqual((result.created, result.duplicates), (1, 0))
+        self.assertEqual(
+            result.errors,
+            [
+                "For row 5, error A user with username john.smith already exists with another email"
+            ],
+        )
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.email, "john@example.com")
+
+    def test_failed_batch_is_saved_row_by_row(self):
+        result = UserImportResult()
+        row_errors = []
+        to_create = [
+            (2, User(username="jane.johnson")),
+            # taken since the rows were matched
+            (3, User(username="john.smith")),
+            (4, User(username="li.ng")),
+        ]
+
+        save_imported_users([], to_create, result, row_errors)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual([row_number for row_number, _ in row_errors], [3])
+        self.assertEqual(
+            set(User.objects.values_list("username", flat=True)),
+            {"jane.johnson", "john.smith", "li.ng"},
+        )
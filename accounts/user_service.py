@@ -0,0 +1,213 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q, QuerySet, Value
+from django.db.models.functions import Concat
+
+from accounts.models import User
+from heats.models import HeatRoster
+from participants.models import Participant
+from participants.participant_service import BULK_BATCH_SIZE, FIRST_ROW_NUMBER
+
+# the sqlite FTS5 trigram tokenizer only matches terms of at least 3 characters
+MIN_FTS_TERM_LENGTH = 3
+
+
+@dataclass
+class UserImportResult:
+    """The outcome of a user import, errors are already formatted with their row number."""
+
+    created: int = 0
+    duplicates: int = 0
+    errors: List[str] = field(default_factory=list)
+    users: List[User] = field(default_factory=list)
+
+
+def get_username(first_name: str, last_name: str) -> str:
+    """
+    Usernames are the lower case first and last names, without spaces, joined by a dot.
+    """
+
+    return (
+        first_name.replace(" ", "").lower() + "." + last_name.replace(" ", "").lower()
+    )
+
+
+def search_users(users: QuerySet, name: str) -> QuerySet:
+    """
+    Filter users to those with every term of name in their first or last name, best matches first.
+    On PostgreSQL the name filters use the pg_trgm GIN indexes of the accounts 0004 migration and users are ranked
+    by trigram word similarity, on SQLite terms are matched with the FTS5 trigram table and ranked by bm25.
+
+    The SQLite table is kept in sync by triggers on accounts_user, a migration that rebuilds that table drops them,
+    run the 0004 migration SQL again after it.
+    :param users: The users to search
+    :param name: The search text, terms are separated by spaces
+    :return: The matching users, ordered by rank then first and last name
+    """
+
+    terms = name.split()
+    vendor = connections[users.db].vendor
+
+    if vendor == "sqlite":
+        return search_users_with_fts(users, terms)
+
+    for term in terms:
+        users = users.filter(
+            Q(first_name__icontains=term) | Q(last_name__icontains=term)
+        )
+
+    if vendor == "postgresql":
+        return users.annotate(
+            rank=TrigramWordSimilarity(
+                name, Concat("first_name", Value(" "), "last_name")
+            )
+        ).order_by("-rank", "first_name", "last_name")
+    return users.order_by("first_name", "last_name")
+
+
+def search_users_with_fts(users: QuerySet, terms: List[str]) -> QuerySet:
+    """
+    The SQLite search_users, terms too short for the trigram tokenizer fall back to a contains filter.
+    """
+
+    fts_terms = [term for term in terms if len(term) >= MIN_FTS_TERM_LENGTH]
+    for term in terms:
+        if len(term) < MIN_FTS_TERM_LENGTH:
+            users = users.filter(
+                Q(first_name__icontains=term) | Q(last_name__icontains=term)
+            )
+
+    if len(fts_terms) == 0:
+        return users.order_by("first_name", "last_name")
+
+    # every quoted term must be found as a substring of a name column, the FTS table is joined on the user id so
+    # its bm25 rank is computed once per match
+    match = " ".join('"{}"'.format(term.replace('"', '""')) for term in fts_terms)
+    return (
+        users.filter(name_search__query=match)
+        .annotate(rank=F("name_search__rank"))
+        .order_by("rank", "first_name", "last_name")
+    )
+
+
+def import_users(
+    rows: Sequence[dict], first_row_number: int = FIRST_ROW_NUMBER
+) -> UserImportResult:
+    """
+    Create or update users from import rows (CreateUserSchema dicts).
+    A row matching an existing user by username and email updates its phone number, date of birth and gender, any
+    other row creates a new user. A row whose username is taken by a user with another email is an error.
+
+    Every username is derived up front and the existing users are loaded with one query, rows of the same batch
+    that share a username are matched in memory and the changes are written with bulk_update and bulk_create.
+    :param rows: The import rows, in file order
+    :param first_row_number: Row number of the first row, used in error messages
+    :return: The counts, errors and saved users of the import
+    """
+
+    result = UserImportResult()
+    row_errors: List[Tuple[int, str]] = []
+
+    usernames = [
+        get_username(user_data.get("first_name", ""), user_data.get("last_name", ""))
+        for user_data in rows
+    ]
+    users_by_username: Dict[str, User] = {
+        user.username: user for user in User.objects.filter(username__in=usernames)
+    }
+
+    to_update: Dict[int, User] = {}
+    to_create: List[Tuple[int, User]] = []
+    imported_users: List[Tuple[int, User]] = []
+
+    for row_number, username, user_data in zip(
+        range(first_row_number, first_row_number + len(rows)), usernames, rows
+    ):
+        user = users_by_username.get(username)
+
+        if user is None:
+            user = User(
+                username=username,
+                email=user_data.get("email", ""),
+                first_name=user_data.get("first_name", ""),
+                last_name=user_data.get("last_name", ""),
+                phone_number=user_data.get("phone_number", ""),
+                date_of_birth=user_data.get("date_of_birth", None),
+                gender=user_data.get("gender", None),
+            )
+            users_by_username[username] = user
+            to_create.append((row_number, user))
+            imported_users.append((row_number, user))
+            continue
+
+        if user.email != user_data.get("email"):
+            row_errors.append(
+                (
+                    row_number,
+                    "A user with username {} already exists with another email".format(
+                        username
+                    ),
+                )
+            )
+            continue
+
+        user.phone_number = user_data.get("phone_number", "")
+        user.date_of_birth = user_data.get("date_of_birth", None)
+        user.gender = user_data.get("gender", None)
+        if user.pk is not None:
+            to_update[user.pk] = user
+        result.duplicates += 1
+        imported_users.append((row_number, user))
+
+    save_imported_users(list(to_update.values()), to_create, result, row_errors)
+
+    result.users = [user for _, user in imported_users if user.pk is not None]
+    result.errors = [
+        "For row {}, error {}".format(row_number, error)
+        for row_number, error in sorted(row_errors, key=lambda row_error: row_error[0])
+    ]
+    return result
+
+
+def save_imported_users(
+    to_update: Sequence[User],
+    to_create: Sequence[Tuple[int, User]],
+    result: UserImportResult,
+    row_errors: List[Tuple[int, str]],
+) -> None:
+    """
+    Write matched import rows with bulk_update and bulk_create in batches, in one transaction.
+    If a batch can not be created, for example a username was taken since the rows were matched, that batch is
+    saved row by row so only the bad rows are reported in row_errors.
+    :return: None
+    """
+
+    with transaction.atomic():
+        User.objects.bulk_update(
+            to_update,
+            ["phone_number", "date_of_birth", "gender"],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        HeatRoster.objects.mark_stale(
+            Participant.objects.filter(user__in=to_update).values("heat_id")
+        )
+
+        for start in range(0, len(to_create), BULK_BATCH_SIZE):
+            batch = to_create[start : start + BULK_BATCH_SIZE]
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create([user for _, user in batch])
+                result.created += len(batch)
+            except IntegrityError:
+                for row_number, user in batch:
+                    user.pk = None
+                    try:
+                        with transaction.atomic():
+                            user.save()
+                        result.created += 1
+                    except IntegrityError as e:
+                        user.pk = None
+                        row_errors.append((row_number, e.__str__()))
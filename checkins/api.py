@@ -1,7 +1,7 @@
 from typing import List
 
 from django.core.exceptions import ValidationError
-from django.db.models import Count, Q
+from django.db import transaction
 from ninja import Router
 
 from checkins.models import CheckIn
@@ -41,9 +41,11 @@ def create_checkin(request, check_in_schema: CreateCheckInSchema):
                     )
                 )
 
-    check_in, is_new = CheckIn.objects.get_or_create(
-        **schema_data, depends_on=depends_on
-    )
+    # the check in graph version is changed in the same transaction, see checkins.signals
+    with transaction.atomic():
+        check_in, is_new = CheckIn.objects.get_or_create(
+            **schema_data, depends_on=depends_on
+        )
     if is_new:
         return 201, check_in
     else:
@@ -56,40 +58,7 @@ def create_checkin(request, check_in_schema: CreateCheckInSchema):
     response={200: List[AnalyticsCheckInSchema]},
 )
 def get_checkin_analytics(request, race_id: int):
-    checkins = CheckIn.objects.annotate(
-        positive_count=Count(
-            "participantcheckin_check_ins",
-            filter=Q(
-                participantcheckin_check_ins__is_checked_in=True,
-                participantcheckin_check_ins__participant__race_id=race_id,
-            ),
-            distinct=True,
-        )
-        + Count(
-            "relayteamcheckin_check_ins",
-            filter=Q(
-                relayteamcheckin_check_ins__is_checked_in=True,
-                relayteamcheckin_check_ins__team__race_id=race_id,
-            ),
-            distinct=True,
-        ),
-        negative_count=Count(
-            "participantcheckin_check_ins",
-            filter=Q(
-                participantcheckin_check_ins__is_checked_in=False,
-                participantcheckin_check_ins__participant__race_id=race_id,
-            ),
-            distinct=True,
-        )
-        + Count(
-            "relayteamcheckin_check_ins",
-            filter=Q(
-                relayteamcheckin_check_ins__is_checked_in=False,
-                relayteamcheckin_check_ins__team__race_id=race_id,
-            ),
-            distinct=True,
-        ),
-    )
+    checkins = CheckIn.objects.with_race_counts(race_id)
 
     return 200, checkins
 
@@ -107,7 +76,8 @@ def get_check_in_race_types(request, check_in_id: int):
 def delete_checkin(request, check_in_id: int):
     try:
         check_in = CheckIn.objects.get(id=check_in_id)
-        check_in.delete()
+        with transaction.atomic():
+            check_in.delete()
         return 204, None
     except CheckIn.DoesNotExist:
         return 404, ErrorObjectSchema.from_404_error(
@@ -154,7 +124,8 @@ def update_checkin(request, check_in_id: int, check_in_schema: PatchCheckInSchem
             validation_error=e, instance_name="CheckIn"
         )
 
-    check_in.save()
+    with transaction.atomic():
+        check_in.save()
     return 200, check_in
 
 
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CheckinsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "checkins"
+
+    def ready(self):
+        # connects the check in graph and count receivers
+        from checkins import signals  # noqa: F401
@@ -0,0 +1,537 @@
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set
+
+from django.db import connections, router, transaction
+from django.db.models import Model, Q
+from django.http import HttpRequest
+from django.utils import timezone
+
+from checkins.models import CheckIn, CheckInCount, CheckInGraphVersion
+from checkins.schema import BatchCheckInResultSchema
+from heats.models import HeatRoster
+from participants.models import (
+    Participant,
+    ParticipantCheckIn,
+    RelayTeam,
+    RelayTeamCheckIn,
+)
+
+# the id of the single CheckInGraphVersion row
+CHECK_IN_GRAPH_VERSION_ID = 1
+CHECK_IN_GRAPH_CONTEXT_KEY = "check_in_graph"
+
+
+@dataclass
+class CheckInGraph:
+    """Every CheckIn by id, the depends_on chains are followed by id without querying."""
+
+    version: uuid.UUID
+    check_ins: Dict[int, CheckIn] = field(default_factory=dict)
+
+    def get_prerequisites(self, check_in_id: int) -> List[CheckIn]:
+        """
+        :return: The check ins check_in_id depends on, the closest first, up to the end of the chain
+        """
+
+        prerequisites = []
+        seen = {check_in_id}
+        check_in = self.check_ins.get(check_in_id)
+        while check_in is not None and check_in.depends_on_id not in seen:
+            seen.add(check_in.depends_on_id)
+            check_in = self.check_ins.get(check_in.depends_on_id)
+            if check_in is not None:
+                prerequisites.append(check_in)
+        return prerequisites
+
+
+_check_in_graph: CheckInGraph | None = None
+
+
+def get_check_in_graph() -> CheckInGraph:
+    """
+    The CheckIn graph of this process, rebuilt with one query when a CheckIn changed.
+    Changes are seen through the CheckInGraphVersion row, read with one query and changed by
+    invalidate_check_in_graph.
+    :return: The current graph
+    """
+
+    version = CheckInGraphVersion.objects.get_or_create(id=CHECK_IN_GRAPH_VERSION_ID)[
+        0
+    ].version
+
+    graph = _check_in_graph
+    if graph is None or graph.version != version:
+        graph = build_check_in_graph(version)
+    return graph
+
+
+def get_request_check_in_graph(request: HttpRequest) -> CheckInGraph:
+    """
+    The CheckIn graph of a request, its version is read once and the graph is kept on the request. Pass it down to
+    get_check_in, the prerequisite validations and check_in_batch, the response schemas get it from the request too.
+    :param request: The request
+    :return: The graph of the request
+    """
+
+    if not hasattr(request, CHECK_IN_GRAPH_CONTEXT_KEY):
+        setattr(request, CHECK_IN_GRAPH_CONTEXT_KEY, get_check_in_graph())
+    return getattr(request, CHECK_IN_GRAPH_CONTEXT_KEY)
+
+
+def get_context_check_in_graph(context: dict | None) -> CheckInGraph:
+    """
+    The CheckIn graph of a schema validation, kept in the validation context so all the check ins of a response are
+    read from one graph. Share a context between validations to share the graph, like
+    ParticipantSchema.from_orm(participant, context=context) in a loop. Responses validated with the request in
+    their context, like ninja does, use the graph of the request.
+    :param context: The pydantic validation context, None when the schema is validated without one
+    :return: The graph of the context
+    """
+
+    if context is None:
+        return get_check_in_graph()
+    if context.get("request") is not None:
+        return get_request_check_in_graph(context["request"])
+    if CHECK_IN_GRAPH_CONTEXT_KEY not in context:
+        context[CHECK_IN_GRAPH_CONTEXT_KEY] = get_check_in_graph()
+    return context[CHECK_IN_GRAPH_CONTEXT_KEY]
+
+
+def build_check_in_graph(version: uuid.UUID) -> CheckInGraph:
+    global _check_in_graph
+
+    _check_in_graph = CheckInGraph(
+        version=version,
+        check_ins={check_in.id: check_in for check_in in CheckIn.objects.all()},
+    )
+    return _check_in_graph
+
+
+def get_check_in(check_in_id: int, graph: CheckInGraph | None = None) -> CheckIn:
+    """
+    Get a CheckIn from the graph, the graph is rebuilt once if it does not have it.
+    :param check_in_id: The check in to get
+    :param graph: The graph of the request, read with get_check_in_graph if None. A rebuild updates it in place so
+    the rest of the request sees the check in.
+    :raises CheckIn.DoesNotExist: If there is no CheckIn with that id
+    """
+
+    if graph is None:
+        graph = get_check_in_graph()
+    if check_in_id not in graph.check_ins:
+        graph.check_ins = build_check_in_graph(graph.version).check_ins
+
+    try:
+        return graph.check_ins[check_in_id]
+    except KeyError:
+        raise CheckIn.DoesNotExist(
+            "CheckIn with id {} does not exist".format(check_in_id)
+        )
+
+
+def invalidate_check_in_graph() -> None:
+    """
+    Make every process rebuild its CheckIn graph, with a new version written in the current transaction.
+    :return: None
+    """
+
+    updated = CheckInGraphVersion.objects.filter(id=CHECK_IN_GRAPH_VERSION_ID).update(
+        version=uuid.uuid4()
+    )
+    if updated == 0:
+        CheckInGraphVersion.objects.get_or_create(id=CHECK_IN_GRAPH_VERSION_ID)
+
+
+def get_missing_prerequisite(
+    check_in_id: int,
+    checked_in_ids: Iterable[int],
+    graph: CheckInGraph | None = None,
+) -> CheckIn | None:
+    """
+    Validate a check in against its whole prerequisite chain.
+    :param check_in_id: The check in to complete
+    :param checked_in_ids: The ids of the check ins the participant or relay team is checked in at
+    :param graph: The graph of the request, read with get_check_in_graph if None
+    :return: The closest prerequisite that is not checked in, or None if they all are
+    """
+
+    if graph is None:
+        graph = get_check_in_graph()
+    checked_in_ids = set(checked_in_ids)
+    for prerequisite in graph.get_prerequisites(check_in_id):
+        if prerequisite.id not in checked_in_ids:
+            return prerequisite
+    return None
+
+
+def get_owner_missing_prerequisite(
+    checkin_model: type[Model],
+    owner_field: str,
+    owner_id: int,
+    check_in_id: int,
+    graph: CheckInGraph | None = None,
+) -> CheckIn | None:
+    """
+    Validate a check in of one participant or relay team, with one query of its prerequisite states.
+    :param checkin_model: ParticipantCheckIn or RelayTeamCheckIn
+    :param owner_field: The field of checkin_model with the participant or relay team
+    :param owner_id: The participant or relay team id
+    :param check_in_id: The check in to complete
+    :param graph: The graph of the request, read with get_check_in_graph if None
+    :return: The closest prerequisite that is not checked in, or None if they all are
+    """
+
+    if graph is None:
+        graph = get_check_in_graph()
+    prerequisites = graph.get_prerequisites(check_in_id)
+    if len(prerequisites) == 0:
+        return None
+
+    return get_missing_prerequisite(
+        check_in_id,
+        checkin_model.objects.filter(
+            **{owner_field: owner_id},
+            check_in_id__in=[prerequisite.id for prerequisite in prerequisites],
+            is_checked_in=True,
+        ).values_list("check_in_id", flat=True),
+        graph,
+    )
+
+
+def check_in_batch(
+    race_id: int,
+    check_in: CheckIn,
+    participant_ids: List[int],
+    bib_numbers: List[int],
+    value: bool,
+    graph: CheckInGraph | None = None,
+) -> List[BatchCheckInResultSchema]:
+    """
+    Set the check in of many participants and relay teams of a race, found by participant id or bib number.
+    The prerequisites of every item are validated with one query per model, the check in rows are then updated and
+    created in bulk in one transaction.
+    :param race_id: The race of the participants and relay teams
+    :param check_in: The check in to set
+    :param participant_ids: Ids of participants
+    :param bib_numbers: Bib numbers of active participants or relay teams
+    :param value: The is_checked_in value to set
+    :param graph: The graph of the request, read with get_check_in_graph if None
+    :return: One result per participant id then per bib number, in the given order
+    """
+
+    participants = Participant.objects.for_race_id(race_id).filter(
+        Q(id__in=participant_ids) | Q(bib_number__in=bib_numbers, is_active=True)
+    )
+    participants_by_id: Dict[int, Participant] = {}
+    participants_by_bib_number: Dict[int, Participant] = {}
+    for participant in participants.only("id", "bib_number", "is_active", "heat_id"):
+        participants_by_id[participant.id] = participant
+        if participant.is_active:
+            participants_by_bib_number[participant.bib_number] = participant
+
+    relay_teams_by_bib_number: Dict[int, RelayTeam] = {
+        relay_team.bib_number: relay_team
+        for relay_team in RelayTeam.objects.for_race_id(race_id)
+        .active()
+        .filter(bib_number__in=bib_numbers)
+        .only("id", "bib_number")
+    }
+
+    batch_participants: Dict[int, Participant] = {
+        participant.id: participant
+        for participant in list(participants_by_id.values())
+        + list(participants_by_bib_number.values())
+    }
+
+    if graph is None:
+        graph = get_check_in_graph()
+    prerequisites = graph.get_prerequisites(check_in.id)
+    with transaction.atomic():
+        missing_participant_checkins = save_check_in_batch(
+            ParticipantCheckIn,
+            "participant",
+            set(batch_participants.keys()),
+            race_id,
+            check_in,
+            prerequisites,
+            value,
+        )
+        missing_relay_team_checkins = save_check_in_batch(
+            RelayTeamCheckIn,
+            "team",
+            {relay_team.id for relay_team in relay_teams_by_bib_number.values()},
+            race_id,
+            check_in,
+            prerequisites,
+            value,
+        )
+        # bulk writes do not send the signals the heat rosters use
+        HeatRoster.objects.mark_stale(
+            [
+                participant.heat_id
+                for participant in batch_participants.values()
+                if participant.id not in missing_participant_checkins
+            ]
+        )
+
+    def get_result(missing_checkin: CheckIn | None, **ids) -> BatchCheckInResultSchema:
+        if missing_checkin is None:
+            return BatchCheckInResultSchema(
+                **ids, status=BatchCheckInResultSchema.Statuses.UPDATED
+            )
+        return BatchCheckInResultSchema(
+            **ids,
+            status=BatchCheckInResultSchema.Statuses.MISSING_PREREQUISITE,
+            details="Can not check in to {} as they have not checked in at {}".format(
+                check_in.name, missing_checkin.name
+            ),
+        )
+
+    results = []
+    for participant_id in participant_ids:
+        if participant_id in participants_by_id:
+            results.append(
+                get_result(
+                    missing_participant_checkins.get(participant_id),
+                    participant_id=participant_id,
+                )
+            )
+        else:
+            results.append(
+                BatchCheckInResultSchema(
+                    participant_id=participant_id,
+                    status=BatchCheckInResultSchema.Statuses.NOT_FOUND,
+                    details="Participant with id {} does not exist".format(
+                        participant_id
+                    ),
+                )
+            )
+
+    for bib_number in bib_numbers:
+        participant = participants_by_bib_number.get(bib_number)
+        relay_team = relay_teams_by_bib_number.get(bib_number)
+        if participant is not None:
+            results.append(
+                get_result(
+                    missing_participant_checkins.get(participant.id),
+                    participant_id=participant.id,
+                    bib_number=bib_number,
+                )
+            )
+        elif relay_team is not None:
+            results.append(
+                get_result(
+                    missing_relay_team_checkins.get(relay_team.id),
+                    relay_team_id=relay_team.id,
+                    bib_number=bib_number,
+                )
+            )
+        else:
+            results.append(
+                BatchCheckInResultSchema(
+                    bib_number=bib_number,
+                    status=BatchCheckInResultSchema.Statuses.NOT_FOUND,
+                    details="No active participant or relay team with bib number {}".format(
+                        bib_number
+                    ),
+                )
+            )
+
+    return results
+
+
+def save_check_in_batch(
+    checkin_model: type[Model],
+    owner_field: str,
+    owner_ids: Set[int],
+    race_id: int,
+    check_in: CheckIn,
+    prerequisites: List[CheckIn],
+    value: bool,
+) -> Dict[int, CheckIn]:
+    """
+    Set check_in to value for the owners whose prerequisites are checked in, and count the changes in the
+    CheckInCount of the race. Run it in a transaction.
+    :param checkin_model: ParticipantCheckIn or RelayTeamCheckIn
+    :param owner_field: The field of checkin_model with the participant or relay team
+    :param owner_ids: The participant or relay team ids
+    :param race_id: The race of the owners
+    :return: The closest missing prerequisite of each owner that was not checked in, by owner id
+    """
+
+    if len(owner_ids) == 0:
+        return {}
+
+    # the owners are locked so the states read here stay the ones the upsert replaces until the counts are written
+    owner_model = checkin_model._meta.get_field(owner_field).related_model
+    list(
+        owner_model.objects.select_for_update()
+        .filter(id__in=owner_ids)
+        .values_list("id", flat=True)
+    )
+
+    checked_in_ids: Dict[int, Set[int]] = {owner_id: set() for owner_id in owner_ids}
+    if len(prerequisites) > 0:
+        for owner_id, check_in_id in checkin_model.objects.filter(
+            **{"{}__in".format(owner_field): owner_ids},
+            check_in_id__in=[prerequisite.id for prerequisite in prerequisites],
+            is_checked_in=True,
+        ).values_list(owner_field, "check_in_id"):
+            checked_in_ids[owner_id].add(check_in_id)
+
+    missing_checkins: Dict[int, CheckIn] = {}
+    for owner_id in owner_ids:
+        for prerequisite in prerequisites:
+            if prerequisite.id not in checked_in_ids[owner_id]:
+                missing_checkins[owner_id] = prerequisite
+                break
+
+    saved_owner_ids = owner_ids - missing_checkins.keys()
+    if len(saved_owner_ids) == 0:
+        return missing_checkins
+
+    before: Dict[int, bool] = dict(
+        checkin_model.objects.filter(
+            **{"{}__in".format(owner_field): saved_owner_ids}, check_in_id=check_in.id
+        ).values_list(owner_field, "is_checked_in")
+    )
+
+    # one INSERT ... ON CONFLICT DO UPDATE on the unique owner and check in constraint
+    owner_attname = checkin_model._meta.get_field(owner_field).attname
+    checkin_model.objects.bulk_create(
+        [
+            checkin_model(
+                **{owner_attname: owner_id},
+                check_in_id=check_in.id,
+                is_checked_in=value,
+            )
+            for owner_id in saved_owner_ids
+        ],
+        update_conflicts=True,
+        unique_fields=[owner_field, "check_in"],
+        update_fields=["is_checked_in", "date_changed"],
+    )
+    CheckInCount.objects.add_state_changes(
+        race_id,
+        check_in.id,
+        [(before.get(owner_id), value) for owner_id in saved_owner_ids],
+    )
+    return missing_checkins
+
+
+def upsert_check_in(
+    checkin_model: type[Model],
+    owner_field: str,
+    owner_id: int,
+    check_in_id: int,
+    value: bool | None = None,
+) -> Model | None:
+    """
+    Set or flip a check in of a participant or relay team with one INSERT ... ON CONFLICT DO UPDATE statement, then
+    count the change in the CheckInCount of the owner race with one more upsert, in the same transaction.
+    Concurrent writes of the same check in are serialized by the database, a flip always applies to the latest value.
+    The unique constraint on the owner and check in is the conflict target, the row is only inserted if the owner
+    exists. Setting the value a check in already has changes nothing, its state is then read with one more query.
+    No signals are sent.
+    :param checkin_model: ParticipantCheckIn or RelayTeamCheckIn
+    :param owner_field: The field of checkin_model with the participant or relay team
+    :param owner_id: The participant or relay team id
+    :param check_in_id: The check in to set
+    :param value: The is_checked_in value to set, None flips it, a new row is then checked in
+    :return: The check in state, None if the owner does not exist
+    """
+
+    db = router.db_for_write(checkin_model)
+    connection = connections[db]
+    quote_name = connection.ops.quote_name
+
+    table = quote_name(checkin_model._meta.db_table)
+    owner = checkin_model._meta.get_field(owner_field)
+    owner_column = quote_name(owner.column)
+    owner_table = quote_name(owner.related_model._meta.db_table)
+    owner_id_column = quote_name(owner.target_field.column)
+    check_in_column = quote_name(checkin_model._meta.get_field("check_in").column)
+    if value is None:
+        # a flip always changes the row
+        update = "is_checked_in = NOT {}.is_checked_in, date_changed = excluded.date_changed".format(
+            table
+        )
+    else:
+        # an updated row then always changed, its previous value is the opposite of the returned one
+        update = (
+            "is_checked_in = excluded.is_checked_in, date_changed = excluded.date_changed "
+            "WHERE {}.is_checked_in <> excluded.is_checked_in".format(table)
+        )
+    date_changed = timezone.now()
+
+    with transaction.atomic(using=db), connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            # xmax is 0 for the rows a statement inserted
+            inserted = "xmax = 0"
+        else:
+            # SQLite has no xmax, its writes are serialized so the state read here is the one the upsert replaces
+            cursor.execute(
+                "SELECT COUNT(*) = 0 FROM {table} WHERE {owner_column} = %s AND {check_in_column} = %s".format(
+                    table=table,
+                    owner_column=owner_column,
+                    check_in_column=check_in_column,
+                ),
+                [owner_id, check_in_id],
+            )
+            inserted = "1" if cursor.fetchone()[0] else "0"
+
+        cursor.execute(
+            "INSERT INTO {table} ({owner_column}, {check_in_column}, is_checked_in, date_changed) "
+            "SELECT {owner_id}, %s, %s, %s FROM {owner_table} WHERE {owner_id} = %s "
+            "ON CONFLICT ({owner_column}, {check_in_column}) DO UPDATE SET "
+            "{update} "
+            "RETURNING id, is_checked_in, {inserted}".format(
+                table=table,
+                owner_column=owner_column,
+                check_in_column=check_in_column,
+                owner_table=owner_table,
+                owner_id=owner_id_column,
+                update=update,
+                inserted=inserted,
+            ),
+            [
+                check_in_id,
+                True if value is None else value,
+                connection.ops.adapt_datetimefield_value(date_changed),
+                owner_id,
+            ],
+        )
+        row = cursor.fetchone()
+        if row is None:
+            # the owner does not exist or the check in already has the value
+            return (
+                checkin_model._default_manager.using(db)
+                .filter(**{owner.attname: owner_id}, check_in_id=check_in_id)
+                .first()
+            )
+
+        is_checked_in = bool(row[1])
+        before = None if row[2] else not is_checked_in
+        positive_count = (is_checked_in is True) - (before is True)
+        negative_count = (is_checked_in is False) - (before is False)
+        cursor.execute(
+            "INSERT INTO {count_table} (race_id, check_in_id, positive_count, negative_count) "
+            "SELECT race_id, %s, %s, %s FROM {owner_table} WHERE {owner_id} = %s "
+            "ON CONFLICT (race_id, check_in_id) DO UPDATE SET "
+            "positive_count = {count_table}.positive_count + excluded.positive_count, "
+            "negative_count = {count_table}.negative_count + excluded.negative_count".format(
+                count_table=quote_name(CheckInCount._meta.db_table),
+                owner_table=owner_table,
+                owner_id=owner_id_column,
+            ),
+            [check_in_id, positive_count, negative_count, owner_id],
+        )
+
+    return checkin_model(
+        id=row[0],
+        **{owner.attname: owner_id},
+        check_in_id=check_in_id,
+        is_checked_in=is_checked_in,
+        date_changed=date_changed,
+    )
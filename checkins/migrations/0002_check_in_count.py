@@ -0,0 +1,77 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# the check in tables with the column and table of their participant or relay team
+COUNTED_TABLES = [
+    ("participants_participantcheckin", "participant_id", "participants_participant"),
+    ("participants_relayteamcheckin", "team_id", "participants_relayteam"),
+]
+
+# counts the existing check ins, later writes are counted by checkins.checkin_service and checkins.signals
+COUNT_EXISTING_SQL = (
+    "INSERT INTO checkins_checkincount (race_id, check_in_id, positive_count, negative_count) "
+    "SELECT race_id, check_in_id, SUM(positive_count), SUM(negative_count) FROM ("
+    + " UNION ALL ".join(
+        "SELECT {owner_table}.race_id, {table}.check_in_id, "
+        "CASE WHEN {table}.is_checked_in THEN 1 ELSE 0 END AS positive_count, "
+        "CASE WHEN {table}.is_checked_in THEN 0 ELSE 1 END AS negative_count "
+        "FROM {table} INNER JOIN {owner_table} ON {owner_table}.id = {table}.{owner_column}".format(
+            table=table, owner_column=owner_column, owner_table=owner_table
+        )
+        for table, owner_column, owner_table in COUNTED_TABLES
+    )
+    + ") check_ins GROUP BY race_id, check_in_id"
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkins", "0001_initial"),
+        ("participants", "0020_check_in_unique"),
+        ("race", "0005_racetype_checkins"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CheckInCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("positive_count", models.IntegerField(default=0)),
+                ("negative_count", models.IntegerField(default=0)),
+                (
+                    "check_in",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="counts",
+                        to="checkins.checkin",
+                    ),
+                ),
+                (
+                    "race",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="check_in_counts",
+                        to="race.race",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="checkincount",
+            constraint=models.UniqueConstraint(
+                fields=("race", "check_in"), name="unique_check_in_count_per_race"
+            ),
+        ),
+        migrations.RunSQL(COUNT_EXISTING_SQL, migrations.RunSQL.noop),
+    ]
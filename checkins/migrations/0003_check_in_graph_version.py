@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 14:19
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkins", "0002_check_in_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CheckInGraphVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.UUIDField(default=uuid.uuid4)),
+            ],
+        ),
+    ]
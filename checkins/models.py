@@ -1,5 +1,9 @@
+import uuid
+
 from django.db import models
 
+from checkins.querysets import CheckInCountQuerySet, CheckInQuerySet
+
 
 class CheckIn(models.Model):
     """
@@ -8,6 +12,8 @@ class CheckIn(models.Model):
     completed.
     """
 
+    objects = CheckInQuerySet.as_manager()
+
     name = models.CharField(max_length=256)
     positive_action = models.CharField(max_length=256)
     negative_action = models.CharField(max_length=256)
@@ -37,3 +43,46 @@ class CheckInUserBase(models.Model):
     )
     is_checked_in = models.BooleanField(default=False)
     date_changed = models.DateTimeField(auto_now=True)
+
+
+class CheckInCount(models.Model):
+    """
+    The number of participant and relay team check ins of a race that are checked in (positive) or not (negative).
+    Rows are kept up to date in the transaction of every check in write: by checkin_service for its upserts and
+    batches, and by the checkins.signals receivers for saves and deletes. Other bulk writes of check ins must count
+    their changes with CheckInCountQuerySet.add_state_changes.
+    """
+
+    objects = CheckInCountQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["race", "check_in"], name="unique_check_in_count_per_race"
+            ),
+        ]
+
+    race = models.ForeignKey(
+        to="race.Race", on_delete=models.CASCADE, related_name="check_in_counts"
+    )
+    check_in = models.ForeignKey(
+        to=CheckIn, on_delete=models.CASCADE, related_name="counts"
+    )
+    positive_count = models.IntegerField(default=0)
+    negative_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "{} counts for {}".format(self.check_in_id, self.race_id)
+
+
+class CheckInGraphVersion(models.Model):
+    """
+    The version of the CheckIn graph every process keeps in memory, see checkins.checkin_service. Its single row gets a
+    new version in the transaction of every CheckIn write, so a process sees a change as soon as it is committed and
+    never sees one that is rolled back.
+    """
+
+    version = models.UUIDField(default=uuid.uuid4)
+
+    def __str__(self):
+        return str(self.version)
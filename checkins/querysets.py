@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from typing import Iterable, Tuple
+
+from django.db.models import Count, F, FilteredRelation, Q, QuerySet
+from django.db.models.functions import Coalesce
+
+
+class CheckInQuerySet(QuerySet):
+
+    def with_race_counts(self, race_id: int) -> CheckInQuerySet:
+        """
+        Annotate positive_count and negative_count, the participant and relay team check ins of the race that are
+        checked in or not. They are read from the CheckInCount rows of the race, a check in without a row has no
+        check ins.
+        """
+
+        return self.annotate(
+            race_counts=FilteredRelation("counts", condition=Q(counts__race_id=race_id))
+        ).annotate(
+            positive_count=Coalesce(F("race_counts__positive_count"), 0),
+            negative_count=Coalesce(F("race_counts__negative_count"), 0),
+        )
+
+    def with_race_counts_aggregated(self, race_id: int) -> CheckInQuerySet:
+        """with_race_counts, counted from the participant and relay team check ins."""
+        return self.annotate(
+            positive_count=Count(
+                "participantcheckin_check_ins",
+                filter=Q(
+                    participantcheckin_check_ins__is_checked_in=True,
+                    participantcheckin_check_ins__participant__race_id=race_id,
+                ),
+                distinct=True,
+            )
+            + Count(
+                "relayteamcheckin_check_ins",
+                filter=Q(
+                    relayteamcheckin_check_ins__is_checked_in=True,
+                    relayteamcheckin_check_ins__team__race_id=race_id,
+                ),
+                distinct=True,
+            ),
+            negative_count=Count(
+                "participantcheckin_check_ins",
+                filter=Q(
+                    participantcheckin_check_ins__is_checked_in=False,
+                    participantcheckin_check_ins__participant__race_id=race_id,
+                ),
+                distinct=True,
+            )
+            + Count(
+                "relayteamcheckin_check_ins",
+                filter=Q(
+                    relayteamcheckin_check_ins__is_checked_in=False,
+                    relayteamcheckin_check_ins__team__race_id=race_id,
+                ),
+                distinct=True,
+            ),
+        )
+
+
+class CheckInCountQuerySet(QuerySet):
+
+    def add_state_changes(
+        self,
+        race_id: int,
+        check_in_id: int,
+        changes: Iterable[Tuple[bool | None, bool | None]],
+    ) -> None:
+        """
+        Count changes of participant and relay team check ins of a race with one F() update, in the transaction of the
+        write. A row is created for the first check in of the race.
+        :param race_id: The race of the participants and relay teams
+        :param check_in_id: The check in that changed
+        :param changes: The is_checked_in value before and after each change, None when there is no check in row
+        :return: None
+        """
+
+        positive_count = 0
+        negative_count = 0
+        for before, after in changes:
+            positive_count += (after is True) - (before is True)
+            negative_count += (after is False) - (before is False)
+        if positive_count == 0 and negative_count == 0:
+            return
+
+        counts = self.filter(race_id=race_id, check_in_id=check_in_id)
+        updated = counts.update(
+            positive_count=F("positive_count") + positive_count,
+            negative_count=F("negative_count") + negative_count,
+        )
+        if updated > 0:
+            return
+        if positive_count <= 0 and negative_count <= 0:
+            # only removals and no row, the race and its counts are being deleted
+            return
+
+        _, created = self.get_or_create(
+            race_id=race_id,
+            check_in_id=check_in_id,
+            defaults={
+                "positive_count": positive_count,
+                "negative_count": negative_count,
+            },
+        )
+        if not created:
+            # created by a concurrent write
+            counts.update(
+                positive_count=F("positive_count") + positive_count,
+                negative_count=F("negative_count") + negative_count,
+            )
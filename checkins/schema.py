@@ -1,6 +1,8 @@
-from typing import Optional
+import datetime
+from enum import Enum
+from typing import Any, List, Optional
 
-from ninja import ModelSchema
+from ninja import ModelSchema, Schema
 
 from checkins.models import CheckIn, CheckInUserBase
 
@@ -12,6 +14,26 @@ class CheckInSchema(ModelSchema):
         model = CheckIn
         fields = ("id", "name", "positive_action", "negative_action")
 
+    @staticmethod
+    def resolve_depends_on(obj: Any, context: dict | None) -> Any:
+        """
+        Follow the depends_on chain through the CheckIn graph, got once per validation context, instead of one query
+        per level and check in.
+        """
+        # checkin_service imports the schemas
+        from checkins.checkin_service import get_context_check_in_graph
+
+        if not isinstance(obj, CheckIn):
+            # request bodies
+            return obj.get("depends_on")
+        if obj.depends_on_id is None:
+            return None
+
+        depends_on = get_context_check_in_graph(context).check_ins.get(
+            obj.depends_on_id
+        )
+        return obj.depends_on if depends_on is None else depends_on
+
 
 CheckInSchema.update_forward_refs()
 
@@ -45,6 +67,14 @@ class CheckInUserBaseSchema(ModelSchema):
         )
 
 
+class CheckInStateSchema(Schema):
+    """The state of one check in of a participant or relay team."""
+
+    check_in_id: int
+    is_checked_in: bool
+    date_changed: datetime.datetime
+
+
 class AnalyticsCheckInSchema(ModelSchema):
     positive_count: int
     negative_count: int
@@ -55,3 +85,27 @@ class AnalyticsCheckInSchema(ModelSchema):
             "id",
             "name",
         )
+
+
+class BatchCheckInSchema(Schema):
+    """Participants are found by id or by bib number, bib numbers also find relay teams."""
+
+    participant_ids: List[int] = []
+    bib_numbers: List[int] = []
+    value: bool = True
+
+
+class BatchCheckInResultSchema(Schema):
+    class Statuses(Enum):
+        UPDATED = "updated"
+        NOT_FOUND = "not_found"
+        MISSING_PREREQUISITE = "missing_prerequisite"
+
+    class Config(Schema.Config):
+        use_enum_values = True
+
+    participant_id: int | None = None
+    relay_team_id: int | None = None
+    bib_number: int | None = None
+    status: Statuses
+    details: str | None = None
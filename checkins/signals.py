@@ -0,0 +1,76 @@
+from typing import Tuple
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from checkins.checkin_service import invalidate_check_in_graph
+from checkins.models import CheckIn, CheckInCount, CheckInUserBase
+from participants.models import ParticipantCheckIn, RelayTeamCheckIn
+
+# the participant or relay team field of the counted check in models
+COUNTED_OWNER_FIELDS = {ParticipantCheckIn: "participant", RelayTeamCheckIn: "team"}
+
+
+@receiver(post_save, sender=CheckIn)
+@receiver(post_delete, sender=CheckIn)
+def invalidate_check_in_graph_on_change(sender, instance: CheckIn, **kwargs):
+    """Writes of check ins should run in a transaction, so the new graph version is committed with them."""
+    invalidate_check_in_graph()
+
+
+def get_counted_state(
+    sender: type[CheckInUserBase], instance: CheckInUserBase
+) -> Tuple[int | None, int, bool]:
+    """:return: The owner race, check in and is_checked_in of a participant or relay team check in"""
+
+    owner = sender._meta.get_field(COUNTED_OWNER_FIELDS[sender])
+    race_id = (
+        owner.related_model._default_manager.filter(pk=getattr(instance, owner.attname))
+        .values_list("race_id", flat=True)
+        .first()
+    )
+    return race_id, instance.check_in_id, instance.is_checked_in
+
+
+@receiver(pre_save, sender=ParticipantCheckIn)
+@receiver(pre_save, sender=RelayTeamCheckIn)
+def remember_counted_state(sender, instance: CheckInUserBase, **kwargs):
+    """The saved state is read before the save, so post_save can count the change."""
+
+    instance._counted_state = None
+    if instance.pk is not None:
+        saved = sender._default_manager.filter(pk=instance.pk).first()
+        if saved is not None:
+            instance._counted_state = get_counted_state(sender, saved)
+
+
+@receiver(post_save, sender=ParticipantCheckIn)
+@receiver(post_save, sender=RelayTeamCheckIn)
+def count_saved_check_in(sender, instance: CheckInUserBase, **kwargs):
+    before = getattr(instance, "_counted_state", None)
+    race_id, check_in_id, is_checked_in = get_counted_state(sender, instance)
+
+    if before is not None and before[:2] != (race_id, check_in_id):
+        # moved to another check in or owner
+        if before[0] is not None:
+            CheckInCount.objects.add_state_changes(
+                before[0], before[1], [(before[2], None)]
+            )
+        before = None
+
+    if race_id is not None:
+        CheckInCount.objects.add_state_changes(
+            race_id,
+            check_in_id,
+            [(None if before is None else before[2], is_checked_in)],
+        )
+
+
+@receiver(post_delete, sender=ParticipantCheckIn)
+@receiver(post_delete, sender=RelayTeamCheckIn)
+def count_deleted_check_in(sender, instance: CheckInUserBase, **kwargs):
+    race_id, check_in_id, is_checked_in = get_counted_state(sender, instance)
+    if race_id is not None:
+        CheckInCount.objects.add_state_changes(
+            race_id, check_in_id, [(is_checked_in, None)]
+        )
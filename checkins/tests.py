@@ -0,0 +1,357 @@
+import uuid
+
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from checkins.checkin_service import check_in_batch, get_check_in_graph, upsert_check_in
+from checkins.models import CheckIn, CheckInGraphVersion
+from checkins.schema import CheckInSchema
+from participants.models import (
+    Participant,
+    ParticipantCheckIn,
+    RelayTeam,
+    RelayTeamCheckIn,
+)
+from tridu_server.testing import authorization_headers, create_race
+
+
+def create_check_in(name: str, depends_on: CheckIn | None = None) -> CheckIn:
+    return CheckIn.objects.create(
+        name=name,
+        positive_action="In",
+        negative_action="Out",
+        depends_on=depends_on,
+    )
+
+
+class CheckInGraphTestCase(TestCase):
+
+    def test_unchanged_graph_is_reused(self):
+        check_in = create_check_in("Packet pickup")
+        graph = get_check_in_graph()
+
+        # the version
+        with self.assertNumQueries(1):
+            self.assertIs(get_check_in_graph(), graph)
+        self.assertIn(check_in.id, graph.check_ins)
+
+    def test_check_in_writes_change_the_graph(self):
+        packet_pickup = create_check_in("Packet pickup")
+        get_check_in_graph()
+
+        swim = create_check_in("Swim", depends_on=packet_pickup)
+        self.assertEqual(
+            get_check_in_graph().get_prerequisites(swim.id), [packet_pickup]
+        )
+
+        swim.depends_on = None
+        swim.save()
+        self.assertEqual(get_check_in_graph().get_prerequisites(swim.id), [])
+
+        swim.delete()
+        self.assertNotIn(swim.id, get_check_in_graph().check_ins)
+
+    def test_rolled_back_check_ins_are_not_kept(self):
+        with transaction.atomic():
+            check_in = create_check_in("Packet pickup")
+            self.assertIn(check_in.id, get_check_in_graph().check_ins)
+            transaction.set_rollback(True)
+
+        self.assertNotIn(check_in.id, get_check_in_graph().check_ins)
+
+    def test_version_changed_by_another_process(self):
+        check_in = create_check_in("Packet pickup")
+        get_check_in_graph()
+
+        # another process renames the check in, in the same transaction as its new version
+        CheckIn.objects.filter(id=check_in.id).update(name="Bike")
+        CheckInGraphVersion.objects.update(version=uuid.uuid4())
+
+        self.assertEqual(get_check_in_graph().check_ins[check_in.id].name, "Bike")
+
+
+class DependsOnChainTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="staff")
+
+    def create_chain(self, length: int) -> CheckIn:
+        """:return: The last check in of a depends_on chain of length check ins"""
+
+        check_in = None
+        for position in range(length):
+            check_in = create_check_in("Check in {}".format(position), check_in)
+        return check_in
+
+    def assertChain(self, data: dict, length: int) -> None:
+        names = []
+        while data is not None:
+            names.append(data["name"])
+            data = data["depends_on"]
+        self.assertEqual(
+            names,
+            ["Check in {}".format(position) for position in reversed(range(length))],
+        )
+
+    def get_race_participants(self, length: int) -> tuple:
+        """:return: The participants of a race whose check ins have a depends_on chain of length, and the queries"""
+
+        race = create_race(participant_count=20, heat_count=2)
+        check_in = self.create_chain(length)
+        Participant.objects.for_race_id(race.id).first().race_type.checkins.add(
+            check_in
+        )
+        ParticipantCheckIn.objects.bulk_create(
+            ParticipantCheckIn(participant=participant, check_in=check_in)
+            for participant in Participant.objects.for_race_id(race.id)
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                "/api/races/{}/participants".format(race.id),
+                headers=authorization_headers(self.user),
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["items"], len(context.captured_queries)
+
+    def test_check_ins(self):
+        self.create_chain(4)
+
+        response = self.client.get(
+            "/api/check_ins/", headers=authorization_headers(self.user)
+        )
+
+        for length, data in enumerate(response.json(), 1):
+            self.assertChain(data, length)
+
+    def test_participants(self):
+        participants, _ = self.get_race_participants(3)
+
+        self.assertEqual(len(participants), 20)
+        for participant in participants:
+            self.assertChain(participant["checkins"][0]["check_in"], 3)
+            self.assertChain(participant["race_type"]["checkins"][0], 3)
+
+    def test_participant_queries_do_not_grow_with_chains(self):
+        _, short_chain_queries = self.get_race_participants(2)
+        _, long_chain_queries = self.get_race_participants(6)
+
+        self.assertEqual(short_chain_queries, long_chain_queries)
+
+    def test_iterator(self):
+        last_check_in = self.create_chain(3)
+
+        data = [
+            CheckInSchema.from_orm(check_in).model_dump()
+            for check_in in CheckIn.objects.filter(id=last_check_in.id).iterator()
+        ]
+
+        self.assertChain(data[0], 3)
+
+
+class CheckInCountTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.race = create_race(participant_count=20, heat_count=2, relay_team_count=2)
+        cls.other_race = create_race(participant_count=5, heat_count=1)
+        cls.packet_pickup = create_check_in("Packet pickup")
+        cls.swim = create_check_in("Swim", depends_on=cls.packet_pickup)
+        cls.participants = list(
+            Participant.objects.for_race_id(cls.race.id).order_by("id")
+        )
+        cls.relay_team = RelayTeam.objects.for_race_id(cls.race.id).first()
+
+    def assertCountsMatch(self) -> None:
+        for race in (self.race, self.other_race):
+            counts = {
+                check_in.id: (check_in.positive_count, check_in.negative_count)
+                for check_in in CheckIn.objects.with_race_counts(race.id)
+            }
+            aggregated_counts = {
+                check_in.id: (check_in.positive_count, check_in.negative_count)
+                for check_in in CheckIn.objects.with_race_counts_aggregated(race.id)
+            }
+            self.assertEqual(counts, aggregated_counts)
+
+    def upsert(
+        self, participant: Participant, value: bool = None
+    ) -> ParticipantCheckIn:
+        return upsert_check_in(
+            ParticipantCheckIn,
+            "participant",
+            participant.id,
+            self.packet_pickup.id,
+            value,
+        )
+
+    def test_upsert(self):
+        for participant in self.participants[:10]:
+            self.upsert(participant)
+        self.assertCountsMatch()
+
+        # flipped, set to its value and set to the other value
+        self.upsert(self.participants[0])
+        self.upsert(self.participants[1], True)
+        self.upsert(self.participants[2], False)
+        upsert_check_in(
+            RelayTeamCheckIn, "team", self.relay_team.id, self.packet_pickup.id
+        )
+        self.assertCountsMatch()
+        self.assertEqual(
+            CheckIn.objects.with_race_counts(self.race.id)
+            .filter(id=self.packet_pickup.id)
+            .values_list("positive_count", "negative_count")
+            .get(),
+            (9, 2),
+        )
+
+    def test_upsert_queries(self):
+        participant = self.participants[0]
+        # savepoint, previous state, upsert, count upsert and savepoint release
+        with self.assertNumQueries(5):
+            self.upsert(participant)
+        with self.assertNumQueries(5):
+            self.upsert(participant, True)
+        # unchanged or a missing owner, the state is read instead of counted
+        with self.assertNumQueries(5):
+            self.assertTrue(self.upsert(participant, True).is_checked_in)
+        with self.assertNumQueries(5):
+            self.assertIsNone(
+                upsert_check_in(
+                    ParticipantCheckIn, "participant", 0, self.packet_pickup.id
+                )
+            )
+        self.assertCountsMatch()
+
+    def test_batch(self):
+        for participant in self.participants[:5]:
+            self.upsert(participant)
+
+        # the first five have the prerequisite
+        check_in_batch(
+            self.race.id,
+            self.swim,
+            [participant.id for participant in self.participants[:10]],
+            [self.relay_team.bib_number],
+            True,
+        )
+        self.assertCountsMatch()
+
+        check_in_batch(
+            self.race.id,
+            self.packet_pickup,
+            [],
+            [participant.bib_number for participant in self.participants[3:15]],
+            False,
+        )
+        self.assertCountsMatch()
+
+    def test_saves_and_deletes(self):
+        participant_check_in = ParticipantCheckIn.objects.create(
+            participant=self.participants[0], check_in=self.packet_pickup
+        )
+        ParticipantCheckIn.objects.create(
+            participant=Participant.objects.for_race_id(self.other_race.id).first(),
+            check_in=self.packet_pickup,
+            is_checked_in=True,
+        )
+        RelayTeamCheckIn.objects.create(
+            team=self.relay_team, check_in=self.swim, is_checked_in=True
+        )
+        self.assertCountsMatch()
+
+        participant_check_in.is_checked_in = True
+        participant_check_in.save()
+        self.assertCountsMatch()
+
+        participant_check_in.check_in = self.swim
+        participant_check_in.save()
+        self.assertCountsMatch()
+
+        participant_check_in.participant = self.participants[1]
+        participant_check_in.save()
+        self.assertCountsMatch()
+
+        participant_check_in.delete()
+        self.assertCountsMatch()
+
+        self.upsert(self.participants[2])
+        self.participants[2].delete()
+        self.assertCountsMatch()
+
+
+class RequestCheckInGraphTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="staff")
+        cls.race = create_race(participant_count=10, heat_count=2, relay_team_count=2)
+        cls.packet_pickup = create_check_in("Packet pickup")
+        cls.swim = create_check_in("Swim", depends_on=cls.packet_pickup)
+        cls.bike = create_check_in("Bike", depends_on=cls.swim)
+        cls.participants = list(
+            Participant.objects.for_race_id(cls.race.id).order_by("id")
+        )
+        for check_in in (cls.packet_pickup, cls.swim):
+            ParticipantCheckIn.objects.bulk_create(
+                ParticipantCheckIn(
+                    participant=participant, check_in=check_in, is_checked_in=True
+                )
+                for participant in cls.participants[:5]
+            )
+
+    def assertVersionReadOnce(self, context: CaptureQueriesContext) -> None:
+        self.assertEqual(
+            len(
+                [
+                    query
+                    for query in context.captured_queries
+                    if CheckInGraphVersion._meta.db_table in query["sql"]
+                ]
+            ),
+            1,
+        )
+
+    def test_batch(self):
+        path = "/api/races/{}/checkins/{}/batch".format(self.race.id, self.bike.id)
+        data = {
+            "participant_ids": [participant.id for participant in self.participants],
+            "bib_numbers": [
+                relay_team.bib_number
+                for relay_team in RelayTeam.objects.for_race_id(self.race.id)
+            ],
+        }
+        # builds the graph of this process
+        get_check_in_graph()
+
+        # the user, the graph version, the participants and relay teams, then per model the locked owners, their
+        # prerequisites, their previous states and the upsert, and the CheckInCount of the updated participants
+        with self.assertNumQueries(17) as context:
+            response = self.client.post(
+                path,
+                data,
+                content_type="application/json",
+                headers=authorization_headers(self.user),
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertVersionReadOnce(context)
+        self.assertEqual(
+            [result["status"] for result in response.json()],
+            ["updated"] * 5 + ["missing_prerequisite"] * 7,
+        )
+
+    def test_participant(self):
+        path = "/api/participants/{}/checkins/{}".format(
+            self.participants[0].id, self.bike.id
+        )
+        get_check_in_graph()
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(path, headers=authorization_headers(self.user))
+        self.assertEqual(response.status_code, 200)
+        # the response resolves the depends_on chains with the graph of the request
+        self.assertVersionReadOnce(context)
@@ -1,8 +1,18 @@
 from django.contrib import admin
 
-from heats.models import Heat
+from heats.models import Heat, HeatRoster, HeatSchedulePlan
 
 
 @admin.register(Heat)
 class HeatAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(HeatSchedulePlan)
+class HeatSchedulePlanAdmin(admin.ModelAdmin):
+    pass
+
+
+@admin.register(HeatRoster)
+class HeatRosterAdmin(admin.ModelAdmin):
+    exclude = ("json_roster", "csv_roster")
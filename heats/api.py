@@ -1,12 +1,19 @@
 import datetime
 from typing import List
 
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotModified
 from ninja import Router
 
 from heats.models import Heat
+from heats.roster_service import RosterFormats, get_heat_roster
 from heats.schema import HeatSchema, CreateHeatSchema, PatchHeatSchema
-from participants.models import Participant, RelayTeam
-from participants.schema.particiapnt import ParticipantSchema, ParticipationSchema
+from participants.models import Participant, RelayParticipant, RelayTeam
+from participants.schema.particiapnt import (
+    CompactParticipantSchema,
+    ParticipantSchema,
+    ParticipationSchema,
+)
 from tridu_server.schemas import ErrorObjectSchema
 
 router = Router()
@@ -18,20 +25,38 @@ router = Router()
     response={200: List[ParticipantSchema]},
 )
 def get_heat_participants(request, heat_id: int):
-    participants = Participant.objects.in_heat(heat_id).select_all_related()
+    participants = Participant.objects.in_heat(heat_id).prefetch_all_related()
     return 200, participants
 
 
+@router.get(
+    "/{heat_id}/participants/compact",
+    tags=["participant", "heats"],
+    response={200: List[CompactParticipantSchema]},
+)
+def get_heat_participants_compact(request, heat_id: int):
+    """The heat participants with only their name, bib number and heat, ordered by bib number."""
+    return 200, Participant.objects.in_heat(heat_id).only_compact_fields().order_by(
+        "bib_number"
+    )
+
+
 @router.get(
     "/{heat_id}/participations",
     tags=["heats"],
     response={200: List[ParticipationSchema]},
 )
 def get_heat_participations(request, heat_id: int):
+    """
+    Returns the participants and relay teams of the heat, a relay team is shown with its first member's user.
+    The first members are prefetched with one query, a team without members has no user.
+    """
     participations = []
 
     participant: Participant
-    for participant in Participant.objects.in_heat(heat_id).select_all_related():
+    for participant in Participant.objects.in_heat(heat_id).select_related(
+        "race", "user"
+    ):
         participations.append(
             ParticipationSchema(
                 id=participant.id,
@@ -44,17 +69,29 @@ def get_heat_participations(request, heat_id: int):
         )
 
     relay_team: RelayTeam
-    for relay_team in RelayTeam.objects.for_heat(heat_id).select_related(
-        "race", "race_type", "heat"
+    for relay_team in (
+        RelayTeam.objects.for_heat(heat_id)
+        .select_related("race")
+        .prefetch_related(
+            Prefetch(
+                "participants",
+                queryset=RelayParticipant.objects.select_related("user").order_by("id")[
+                    :1
+                ],
+                to_attr="first_members",
+            )
+        )
     ):
-        user = relay_team.participants.first().user
-
         participations.append(
             ParticipationSchema(
                 id=relay_team.id,
                 race=relay_team.race,
                 type=ParticipationSchema.ParticipationTypes.RELAY_PARTICIPANT,
-                user=user,
+                user=(
+                    relay_team.first_members[0].user
+                    if len(relay_team.first_members) > 0
+                    else None
+                ),
                 bib_number=relay_team.bib_number,
             )
         )
@@ -62,12 +99,45 @@ def get_heat_participations(request, heat_id: int):
     return 200, participations
 
 
+@router.get(
+    "/{heat_id}/roster",
+    tags=["participant", "heats"],
+    response={404: ErrorObjectSchema},
+)
+def get_heat_roster_snapshot(
+    request, heat_id: int, roster_format: RosterFormats = RosterFormats.JSON
+):
+    """
+    The heat participants from the heat roster snapshot, as JSON like /heats/{heat_id}/participants or as CSV.
+    The response has an ETag, a request with a matching If-None-Match header gets a 304 without a body.
+    """
+    try:
+        heat = Heat.objects.get(id=heat_id)
+    except Heat.DoesNotExist:
+        return 404, ErrorObjectSchema.from_404_error(
+            details="Heat with id {} does not exist".format(heat_id)
+        )
+
+    roster = get_heat_roster(heat)
+    etag = '"{}-{}"'.format(roster.etag, roster_format.value)
+
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+    elif roster_format == RosterFormats.CSV:
+        response = HttpResponse(roster.csv_roster, content_type="text/csv")
+    else:
+        response = HttpResponse(roster.json_roster, content_type="application/json")
+
+    response["ETag"] = etag
+    return response
+
+
 @router.get(
     "/{heat_id}", tags=["heats"], response={200: HeatSchema, 404: ErrorObjectSchema}
 )
 def get_heat(request, heat_id: int):
     try:
-        return 200, Heat.objects.get(id=heat_id)
+        return 200, Heat.objects.with_participant_stats().get(id=heat_id)
     except Heat.DoesNotExist:
         return 404, ErrorObjectSchema.from_404_error(
             details="Heat with id {} does not exist".format(heat_id)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class HeatsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "heats"
+
+    def ready(self):
+        # connects the heat roster receivers
+        from heats import signals  # noqa: F401
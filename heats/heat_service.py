@@ -1,12 +1,41 @@
-from typing import List
+import bisect
+import datetime
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple, Type
 
-from django.db import transaction
-from django.db.models import Count, Sum, Q, F
+from django.db import connection, connections, transaction
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
 
-from heats.models import Heat
+from heats.models import Heat, HeatRoster, HeatSchedulePlan
 from participants.models import Participant, RelayTeam
 from race.models import RaceType
 
+BULK_UPDATE_BATCH_SIZE = 500
+MAX_SCHEDULER_WORKERS = 4
+
+
+class AutoScheduleModes(Enum):
+    """
+    How the automatic scheduler decides how many participants go in each heat.
+    GREEDY fills each heat up to its ideal capacity in start time order.
+    BALANCED splits the swim time ordering to minimize the swim time variance within heats, see balanced_heat_sizes.
+    """
+
+    GREEDY = "greedy"
+    BALANCED = "balanced"
+
 
 class AutoSchedulerException(Exception):
     """
@@ -16,105 +45,779 @@ class AutoSchedulerException(Exception):
     pass
 
 
-def auto_schedule_heats(race_id: int) -> None:
+def auto_schedule_heats(
+    race_id: int,
+    mode: AutoScheduleModes = AutoScheduleModes.GREEDY,
+    balance_weight: float = 0.0,
+    race_type_ids: Iterable[int] | None = None,
+) -> None:
     """
     Automatically schedule participants into heats.
     Participants are scheduled by swim time, and heats are organized by start time.
     The slower (higher swim time) the earlier they need to start (earlier heat).
+
+    Race types never share heats, so each race type is scheduled on its own, see auto_schedule_race_type. Called
+    outside of a transaction, each race type is committed on its own, so a failing race type does not undo the others,
+    and when the database supports row locks race types are scheduled in parallel. Called inside a transaction, race
+    types are scheduled one after the other in it: worker threads have their own connections, which would not see the
+    caller's uncommitted rows and would wait on its row locks.
+    :param mode: How heat sizes are chosen, see AutoScheduleModes
+    :param balance_weight: Only for the BALANCED mode, see balanced_heat_sizes
+    :param race_type_ids: Only schedule these race types, defaults to all the race's race types
+    :return: None
+    """
+
+    if len(check_auto_schedule_is_ready(race_id)) > 0:
+        raise AutoSchedulerException("Auto Schedule is not ready!")
+
+    if race_type_ids is None:
+        race_type_ids = (
+            RaceType.objects.for_race(race_id=race_id)
+            .distinct()
+            .values_list("id", flat=True)
+        )
+    race_type_ids = list(race_type_ids)
+
+    # without row locks (SQLite) concurrent writers would only wait on each other
+    if (
+        connection.in_atomic_block
+        or not connection.features.has_select_for_update
+        or len(race_type_ids) < 2
+    ):
+        for race_type_id in race_type_ids:
+            auto_schedule_race_type(race_id, race_type_id, mode, balance_weight)
+        return
+
+    with ThreadPoolExecutor(
+        max_workers=min(MAX_SCHEDULER_WORKERS, len(race_type_ids))
+    ) as executor:
+        futures = [
+            executor.submit(
+                run_in_thread,
+                auto_schedule_race_type,
+                race_id,
+                race_type_id,
+                mode,
+                balance_weight,
+            )
+            for race_type_id in race_type_ids
+        ]
+        for future in futures:
+            future.result()
+
+
+def auto_schedule_race_type(
+    race_id: int,
+    race_type_id: int,
+    mode: AutoScheduleModes = AutoScheduleModes.GREEDY,
+    balance_weight: float = 0.0,
+) -> None:
+    """
+    Schedule one race type of a race into its heats.
+    The race type's participants and relay teams are loaded once with a row lock, assigned in memory and written back
+    with bulk updates in a single transaction, so the number of queries does not grow with the number of heats and
+    other race types of the race can be scheduled at the same time.
     :return: None
     """
 
+    with transaction.atomic():
+        heats, participants, relay_teams = load_race_schedule(
+            race_id, race_type_id=race_type_id, lock=True
+        )
+        original_participants, original_relay_teams = schedule_state(
+            participants, relay_teams
+        )
+
+        assign_heats(heats, participants, relay_teams, mode, balance_weight)
+
+        save_schedule(
+            participants, relay_teams, original_participants, original_relay_teams
+        )
+
+
+def run_in_thread(function: Callable, *args) -> Any:
+    """
+    Call a function from a worker thread, closing the thread's database connections when done.
+    """
+
+    try:
+        return function(*args)
+    finally:
+        connections.close_all()
+
+
+def preview_auto_schedule_heats(
+    race_id: int,
+    mode: AutoScheduleModes = AutoScheduleModes.GREEDY,
+    balance_weight: float = 0.0,
+) -> HeatSchedulePlan:
+    """
+    Run the automatic scheduler without saving the participants or relay teams. The proposed changes are stored in
+    a HeatSchedulePlan, replacing any older plan for the race, that can be applied with apply_heat_schedule_plan.
+    :param mode: How heat sizes are chosen, see AutoScheduleModes
+    :param balance_weight: Only for the BALANCED mode, see balanced_heat_sizes
+    :return: The new HeatSchedulePlan
+    """
+
     if len(check_auto_schedule_is_ready(race_id)) > 0:
         raise AutoSchedulerException("Auto Schedule is not ready!")
 
-    heats = (
-        Heat.objects.for_race(race_id=race_id)
-        .order_by("start_datetime__hour", "start_datetime__minute")
-        .distinct()
-        .all()
+    heats, participants, relay_teams = load_race_schedule(race_id)
+    fingerprint = schedule_fingerprint(heats, participants, relay_teams)
+    original_participants, original_relay_teams = schedule_state(
+        participants, relay_teams
     )
 
-    Participant.objects.for_race_id(race_id=race_id).update(heat=None)
-    RelayTeam.objects.for_race_id(race_id=race_id).update(heat=None)
+    assign_heats(heats, participants, relay_teams, mode, balance_weight)
 
-    Participant.objects.for_race_id(
-        race_id=race_id
-    ).active().with_invalid_swim_time().update(swim_time=None)
+    heat_summaries = {
+        heat.id: {"heat_id": heat.id, "participant_count": 0, "swim_times": []}
+        for heat in heats
+    }
+    for participant in participants:
+        if participant.heat_id is not None:
+            heat_summaries[participant.heat_id]["participant_count"] += 1
+            if participant.swim_time is not None:
+                heat_summaries[participant.heat_id]["swim_times"].append(
+                    participant.swim_time.total_seconds()
+                )
+    for relay_team in relay_teams:
+        if relay_team.heat_id is not None:
+            heat_summaries[relay_team.heat_id]["participant_count"] += 1
 
-    race_type: RaceType
-    for race_type in RaceType.objects.for_race(race_id=race_id).distinct():
-        race_type_heats = filter(
-            lambda _heat: _heat.race_type_id == race_type.id, heats
+    with transaction.atomic():
+        HeatSchedulePlan.objects.filter(race_id=race_id).delete()
+        return HeatSchedulePlan.objects.create(
+            race_id=race_id,
+            fingerprint=fingerprint,
+            participants={
+                participant.id: participant.heat_id
+                for participant in participants
+                if original_participants[participant.id][0] != participant.heat_id
+            },
+            relay_teams={
+                relay_team.id: relay_team.heat_id
+                for relay_team in relay_teams
+                if original_relay_teams[relay_team.id] != relay_team.heat_id
+            },
+            heats=[
+                {
+                    "heat_id": summary["heat_id"],
+                    "participant_count": summary["participant_count"],
+                    "avg_swim_time": (
+                        sum(summary["swim_times"]) / len(summary["swim_times"])
+                        if len(summary["swim_times"]) > 0
+                        else 0
+                    ),
+                }
+                for summary in heat_summaries.values()
+            ],
+        )
+
+
+def apply_heat_schedule_plan(plan: HeatSchedulePlan) -> None:
+    """
+    Save a previewed plan's heat changes and delete the plan.
+    The plan is only applied if the race's heats, participants and relay teams have not changed since it was created.
+    :return: None
+    """
+
+    with transaction.atomic():
+        heats, participants, relay_teams = load_race_schedule(plan.race_id)
+
+        if schedule_fingerprint(heats, participants, relay_teams) != plan.fingerprint:
+            raise AutoSchedulerException(
+                "The race changed after this plan was created, please preview the schedule again."
+            )
+
+        original_participants, original_relay_teams = schedule_state(
+            participants, relay_teams
+        )
+
+        # JSON object keys are always strings
+        participant_heats = {
+            int(participant_id): heat_id
+            for participant_id, heat_id in plan.participants.items()
+        }
+        relay_team_heats = {
+            int(relay_team_id): heat_id
+            for relay_team_id, heat_id in plan.relay_teams.items()
+        }
+
+        for participant in participants:
+            if participant.is_active and not has_valid_swim_time(participant):
+                participant.swim_time = None
+            if participant.id in participant_heats:
+                participant.heat_id = participant_heats[participant.id]
+
+        for relay_team in relay_teams:
+            if relay_team.id in relay_team_heats:
+                relay_team.heat_id = relay_team_heats[relay_team.id]
+
+        save_schedule(
+            participants, relay_teams, original_participants, original_relay_teams
+        )
+        plan.delete()
+
+
+def reschedule_participants(race_id: int, participant_ids: Iterable[int]) -> int:
+    """
+    Incrementally update an existing schedule after some participants changed (new registration, swim time edit,
+    deactivation, etc.) instead of scheduling the whole race again.
+    The changed participants are removed from their heats and the active ones are inserted back into the current
+    swim time ordering of their race type. When the heat they land in is over capacity, the boundary participant is
+    moved to the closest adjacent heat with space, so only a few rows are written.
+    :param race_id: The race being rescheduled
+    :param participant_ids: The ids of the participants that changed
+    :return: The number of participants updated
+    """
+
+    changed_ids = set(participant_ids)
+
+    with transaction.atomic():
+        heats, participants, relay_teams = load_race_schedule(race_id)
+        original_participants, original_relay_teams = schedule_state(
+            participants, relay_teams
+        )
+
+        heats_by_race_type: Dict[int, List[Heat]] = {}
+        for heat in heats:
+            heats_by_race_type.setdefault(heat.race_type_id, []).append(heat)
+
+        heat_members: Dict[int, List[Participant]] = {heat.id: [] for heat in heats}
+        changed_participants: List[Participant] = []
+        for participant in participants:
+            if participant.id in changed_ids:
+                participant.heat = None
+                changed_participants.append(participant)
+            elif participant.heat_id in heat_members:
+                heat_members[participant.heat_id].append(participant)
+
+        for members in heat_members.values():
+            members.sort(key=swim_time_sort_key)
+
+        for participant in sorted(changed_participants, key=swim_time_sort_key):
+            if not participant.is_active:
+                continue
+            if not has_valid_swim_time(participant):
+                participant.swim_time = None
+            if participant.race_type_id in heats_by_race_type:
+                insert_into_heats(
+                    heats_by_race_type[participant.race_type_id],
+                    heat_members,
+                    participant,
+                )
+
+        for heat in heats:
+            for participant in heat_members[heat.id]:
+                participant.heat = heat
+
+        return save_schedule(
+            participants, relay_teams, original_participants, original_relay_teams
         )
-        total_count = 0
-        for heat in list(race_type_heats):
-            participant_ids = (
-                Participant.objects.for_race_id(race_id)
-                .active()
-                .filter(race_type_id=race_type.id, heat__isnull=True)
-                .order_by(F("swim_time").desc(nulls_first=True))[: heat.ideal_capacity]
-                .values_list("id", flat=True)
+
+
+def insert_into_heats(
+    heats: Sequence[Heat],
+    heat_members: Dict[int, List[Participant]],
+    participant: Participant,
+) -> None:
+    """
+    Insert a participant into its swim time position in a race type's heats, in memory.
+    If the heat is over capacity, one boundary participant per heat is moved towards the closest heat with space.
+    :param heats: The race type's heats, ordered by start time
+    :param heat_members: Heat id to its participants, sorted by swim time, updated in place
+    :param participant: The participant to insert
+    :return: None
+    """
+
+    participant_key = swim_time_sort_key(participant)
+
+    # the first heat whose fastest participant is not slower than this participant, else the last non-empty heat
+    position = None
+    for index, heat in enumerate(heats):
+        members = heat_members[heat.id]
+        if len(members) > 0:
+            position = index
+            if participant_key <= swim_time_sort_key(members[-1]):
+                break
+    if position is None:
+        position = 0
+
+    members = heat_members[heats[position].id]
+    members.insert(
+        bisect.bisect(
+            [swim_time_sort_key(member) for member in members], participant_key
+        ),
+        participant,
+    )
+
+    def has_room(index: int) -> bool:
+        return len(heat_members[heats[index].id]) < heats[index].ideal_capacity
+
+    if len(members) <= heats[position].ideal_capacity:
+        return
+
+    later = next(
+        (index for index in range(position + 1, len(heats)) if has_room(index)), None
+    )
+    if later is not None:
+        # move each heat's fastest participant to the start of the next heat
+        for index in range(position, later):
+            heat_members[heats[index + 1].id].insert(
+                0, heat_members[heats[index].id].pop()
             )
+        return
 
-            relay_team_ids = (
-                RelayTeam.objects.for_race_id(race_id)
-                .active()
-                .filter(race_type_id=race_type.id, heat__isnull=True)[
-                    : heat.ideal_capacity
-                ]
-                .values_list("id", flat=True)
+    earlier = next(
+        (index for index in range(position - 1, -1, -1) if has_room(index)), None
+    )
+    if earlier is not None:
+        # move each heat's slowest participant to the end of the previous heat
+        for index in range(position, earlier, -1):
+            heat_members[heats[index - 1].id].append(
+                heat_members[heats[index].id].pop(0)
             )
+        return
 
-            if len(participant_ids) != 0 and len(relay_team_ids) != 0:
-                raise AutoSchedulerException(
-                    "Participants and Relay Teams found for {} type".format(
-                        race_type.__str__()
-                    )
+    raise AutoSchedulerException(
+        "Race Type {} does not have enough capacity for participant {}".format(
+            participant.race_type_id, participant.id
+        )
+    )
+
+
+def load_race_schedule(
+    race_id: int, race_type_id: int | None = None, lock: bool = False
+) -> Tuple[List[Heat], List[Participant], List[RelayTeam]]:
+    """
+    Load everything the scheduler needs for a race, heats are ordered by start time.
+    :param race_id: The race to load
+    :param race_type_id: Only load this race type, defaults to the whole race
+    :param lock: Lock the participant and relay team rows until the end of the transaction
+    :return: The race's heats, participants and relay teams
+    """
+
+    heats = Heat.objects.for_race(race_id=race_id).order_by(
+        "start_datetime__hour", "start_datetime__minute", "id"
+    )
+    participants = Participant.objects.for_race_id(race_id=race_id).only(
+        "id", "race_type_id", "heat_id", "swim_time", "is_active"
+    )
+    relay_teams = RelayTeam.objects.for_race_id(race_id=race_id).only(
+        "id", "race_type_id", "heat_id", "is_active"
+    )
+
+    if race_type_id is not None:
+        heats = heats.for_race_type(race_type_id)
+        participants = participants.for_race_type_id(race_type_id)
+        relay_teams = relay_teams.for_race_type_id(race_type_id)
+
+    if lock:
+        participants = participants.select_for_update()
+        relay_teams = relay_teams.select_for_update()
+
+    return list(heats), list(participants), list(relay_teams)
+
+
+def schedule_state(
+    participants: Sequence[Participant], relay_teams: Sequence[RelayTeam]
+) -> Tuple[Dict[int, tuple], Dict[int, int | None]]:
+    """
+    The scheduler fields of every participant and relay team, used to only save what changed.
+    :return: Participant id to (heat id, swim time) and relay team id to heat id
+    """
+
+    return (
+        {
+            participant.id: (participant.heat_id, participant.swim_time)
+            for participant in participants
+        },
+        {relay_team.id: relay_team.heat_id for relay_team in relay_teams},
+    )
+
+
+def save_schedule(
+    participants: Sequence[Participant],
+    relay_teams: Sequence[RelayTeam],
+    original_participants: Dict[int, tuple],
+    original_relay_teams: Dict[int, int | None],
+) -> int:
+    """
+    Update the participants and relay teams whose scheduler fields changed.
+    :return: The number of participants and relay teams updated
+    """
+
+    changed_participants = [
+        participant
+        for participant in participants
+        if original_participants[participant.id]
+        != (participant.heat_id, participant.swim_time)
+    ]
+    participants_updated = update_heats(Participant, changed_participants)
+    cleared_swim_time_ids = [
+        participant.id
+        for participant in changed_participants
+        if participant.swim_time is None
+        and original_participants[participant.id][1] is not None
+    ]
+    if len(cleared_swim_time_ids) > 0:
+        Participant.objects.filter(id__in=cleared_swim_time_ids).update(swim_time=None)
+    # the updates skip the roster receivers, the old and new heat rosters of moved participants are stale
+    HeatRoster.objects.mark_stale(
+        [participant.heat_id for participant in changed_participants]
+        + [
+            original_participants[participant.id][0]
+            for participant in changed_participants
+        ]
+    )
+    changed_relay_teams = [
+        relay_team
+        for relay_team in relay_teams
+        if original_relay_teams[relay_team.id] != relay_team.heat_id
+    ]
+    relay_teams_updated = update_heats(RelayTeam, changed_relay_teams)
+    # rosters show the participant count of their heat, which counts relay teams
+    HeatRoster.objects.mark_stale(
+        [relay_team.heat_id for relay_team in changed_relay_teams]
+        + [original_relay_teams[relay_team.id] for relay_team in changed_relay_teams]
+    )
+    return participants_updated + relay_teams_updated
+
+
+def update_heats(model: Type[Participant | RelayTeam], instances: Sequence) -> int:
+    """
+    Save the heat of instances with one UPDATE per batch, whatever the number of heats.
+    Unlike bulk_update, which has a CASE branch per instance, the instances are grouped by heat so the CASE has one
+    branch per heat, which is much cheaper to build.
+    :param model: Participant or RelayTeam
+    :param instances: The instances to save
+    :return: The number of instances updated
+    """
+
+    updated = 0
+    for position in range(0, len(instances), BULK_UPDATE_BATCH_SIZE):
+        batch = instances[position : position + BULK_UPDATE_BATCH_SIZE]
+        ids_by_heat: Dict[int | None, List[int]] = {}
+        for instance in batch:
+            ids_by_heat.setdefault(instance.heat_id, []).append(instance.id)
+
+        updated += model.objects.filter(
+            id__in=[instance.id for instance in batch]
+        ).update(
+            heat_id=Case(
+                *[
+                    When(id__in=ids, then=Value(heat_id))
+                    for heat_id, ids in ids_by_heat.items()
+                    if heat_id is not None
+                ],
+                default=Value(None),
+                output_field=model._meta.get_field("heat").target_field,
+            )
+        )
+    return updated
+
+
+def schedule_fingerprint(
+    heats: Sequence[Heat],
+    participants: Sequence[Participant],
+    relay_teams: Sequence[RelayTeam],
+) -> str:
+    """
+    Hash of everything the scheduler output depends on, used to know if a plan is still valid.
+    """
+
+    state = (
+        [(heat.id, heat.race_type_id, heat.ideal_capacity) for heat in heats],
+        sorted(
+            (
+                participant.id,
+                participant.race_type_id,
+                participant.heat_id,
+                participant.is_active,
+                participant.swim_time,
+            )
+            for participant in participants
+        ),
+        sorted(
+            (
+                relay_team.id,
+                relay_team.race_type_id,
+                relay_team.heat_id,
+                relay_team.is_active,
+            )
+            for relay_team in relay_teams
+        ),
+    )
+    return hashlib.sha256(repr(state).encode()).hexdigest()
+
+
+def assign_heats(
+    heats: Sequence[Heat],
+    participants: Sequence[Participant],
+    relay_teams: Sequence[RelayTeam],
+    mode: AutoScheduleModes = AutoScheduleModes.GREEDY,
+    balance_weight: float = 0.0,
+) -> None:
+    """
+    Assign participants and relay teams to heats in memory, does not save the instances.
+    Every instance is first removed from its heat and invalid swim times are cleared. Then, for each race type, the
+    active participants are sorted by swim time (slowest and missing swim times first) and split, in that order,
+    across the race type's heats. In GREEDY mode each heat is filled up to its ideal capacity, in BALANCED mode the
+    heat sizes come from balanced_heat_sizes. Relay teams always fill their heats greedily, by id.
+    :param heats: The race's heats, ordered by start time
+    :param participants: All the race's participants
+    :param relay_teams: All the race's relay teams
+    :param mode: How heat sizes are chosen for participants
+    :param balance_weight: Only for the BALANCED mode, see balanced_heat_sizes
+    :return: None
+    """
+
+    heats_by_race_type: Dict[int, List[Heat]] = {}
+    for heat in heats:
+        heats_by_race_type.setdefault(heat.race_type_id, []).append(heat)
+
+    participants_by_race_type: Dict[int, List[Participant]] = {}
+    for participant in participants:
+        participant.heat = None
+        if participant.is_active and not has_valid_swim_time(participant):
+            participant.swim_time = None
+        if participant.is_active:
+            participants_by_race_type.setdefault(participant.race_type_id, []).append(
+                participant
+            )
+
+    relay_teams_by_race_type: Dict[int, List[RelayTeam]] = {}
+    for relay_team in relay_teams:
+        relay_team.heat = None
+        if relay_team.is_active:
+            relay_teams_by_race_type.setdefault(relay_team.race_type_id, []).append(
+                relay_team
+            )
+
+    for race_type_id, race_type_heats in heats_by_race_type.items():
+        race_type_participants = participants_by_race_type.get(race_type_id, [])
+        race_type_relay_teams = relay_teams_by_race_type.get(race_type_id, [])
+
+        if len(race_type_participants) > 0 and len(race_type_relay_teams) > 0:
+            raise AutoSchedulerException(
+                "Participants and Relay Teams found for {} type".format(
+                    RaceType.objects.get(id=race_type_id).__str__()
                 )
+            )
+
+        race_type_participants.sort(key=swim_time_sort_key)
+        sizes = None
+        if mode == AutoScheduleModes.BALANCED and len(race_type_participants) > 0:
+            known_swim_times = [
+                participant.swim_time.total_seconds()
+                for participant in race_type_participants
+                if participant.swim_time is not None
+            ]
+            # participants without a swim time are scheduled with the slowest ones
+            slowest = max(known_swim_times) if len(known_swim_times) > 0 else 0.0
+            sizes = balanced_heat_sizes(
+                [
+                    (
+                        participant.swim_time.total_seconds()
+                        if participant.swim_time is not None
+                        else slowest
+                    )
+                    for participant in race_type_participants
+                ],
+                [heat.ideal_capacity for heat in race_type_heats],
+                balance_weight,
+            )
+
+        fill_heats(race_type_heats, race_type_participants, sizes)
+        fill_heats(
+            race_type_heats,
+            sorted(race_type_relay_teams, key=lambda relay_team: relay_team.id),
+        )
+
+
+def fill_heats(
+    heats: Sequence[Heat],
+    entries: Sequence[Participant | RelayTeam],
+    sizes: Sequence[int] | None = None,
+) -> None:
+    """
+    Fill the heats in order with the entries, each heat takes up to its ideal capacity.
+    :param heats: The heats to fill, in order
+    :param entries: Participants or relay teams, in the order they should be scheduled
+    :param sizes: How many entries each heat takes, defaults to the heats' ideal capacity
+    :return: None
+    """
+
+    if sizes is None:
+        sizes = [max(heat.ideal_capacity, 0) for heat in heats]
+
+    position = 0
+    for heat, size in zip(heats, sizes):
+        for entry in entries[position : position + size]:
+            entry.heat = heat
+        position += size
+
+
+def balanced_heat_sizes(
+    swim_times: Sequence[float],
+    capacities: Sequence[int],
+    balance_weight: float = 0.0,
+) -> List[int]:
+    """
+    Split swim times, already in schedule order, into contiguous heats that minimize the swim time variance within
+    heats without going over any heat's capacity.
+    The cost of a heat is the sum of squared differences between its swim times and their mean, plus balance_weight
+    times the squared difference between its size and its proportional share of the participants. A balance_weight
+    of 0 only minimizes variance, higher values push heats towards even filling.
 
-            if len(participant_ids) > 0:
-                Participant.objects.filter(id__in=participant_ids).update(heat=heat)
-            elif len(relay_team_ids) > 0:
-                RelayTeam.objects.filter(id__in=relay_team_ids).update(heat=heat)
+    Solved with dynamic programming over the heats, using prefix sums to get each heat's cost in constant time. The
+    cost is a Monge function, so each heat's row is computed with divide and conquer in O(n log n).
+    :param swim_times: Swim times in seconds, in the order they are scheduled
+    :param capacities: Each heat's capacity, in start time order
+    :param balance_weight: Weight of the heat size term, in seconds squared per participant squared
+    :return: The number of participants for each heat
+    """
+
+    count = len(swim_times)
+    capacities = [max(capacity, 0) for capacity in capacities]
+    total_capacity = sum(capacities)
+    if total_capacity < count:
+        raise AutoSchedulerException(
+            "Heats have {} spots, {} are needed.".format(total_capacity, count)
+        )
+
+    sums = [0.0]
+    squares = [0.0]
+    for swim_time in swim_times:
+        sums.append(sums[-1] + swim_time)
+        squares.append(squares[-1] + swim_time * swim_time)
+
+    infinity = float("inf")
+    previous = [0.0] + [infinity] * count
+    choices = []
+
+    for capacity in capacities:
+        share = count * capacity / total_capacity if total_capacity > 0 else 0
+        current = [infinity] * (count + 1)
+        choice = [0] * (count + 1)
+
+        # (first row, last row, first option, last option)
+        stack = [(0, count, 0, count)]
+        while stack:
+            low, high, option_low, option_high = stack.pop()
+            if low > high:
+                continue
+            row = (low + high) // 2
+            best = infinity
+            best_option = min(option_high, row)
+            for option in range(max(option_low, row - capacity), best_option + 1):
+                if previous[option] == infinity:
+                    continue
+                size = row - option
+                if size == 0:
+                    cost = 0.0
+                else:
+                    total = sums[row] - sums[option]
+                    cost = squares[row] - squares[option] - total * total / size
+                value = previous[option] + cost + balance_weight * (size - share) ** 2
+                if value < best:
+                    best = value
+                    best_option = option
+            current[row] = best
+            choice[row] = best_option
+            stack.append((low, row - 1, option_low, best_option))
+            stack.append((row + 1, high, best_option, option_high))
+
+        choices.append(choice)
+        previous = current
+
+    sizes = []
+    row = count
+    for choice in reversed(choices):
+        sizes.append(row - choice[row])
+        row = choice[row]
+    sizes.reverse()
+    return sizes
+
+
+def has_valid_swim_time(participant: Participant) -> bool:
+    return participant.swim_time is not None and participant.swim_time != (
+        datetime.timedelta(minutes=0, seconds=0)
+    )
+
+
+def swim_time_sort_key(participant: Participant) -> tuple:
+    """
+    Sort key to order participants by swim time, slowest first, participants without a swim time go first.
+    """
 
-            total_count += heat.ideal_capacity
+    if participant.swim_time is None:
+        return False, datetime.timedelta(0), participant.id
+    return True, -participant.swim_time, participant.id
 
 
 def check_auto_schedule_is_ready(race_id: int) -> List[str]:
     """
     For the auto scheduler to be ready, it must have enough spaces for all its participants based on
     heat's ideal capacity.
+    Every race type of the race is loaded in one query, with its active participant count, active relay team count
+    and heat capacity as subquery aggregates, which avoids joining the participants and relay teams tables together.
     :return: Empty list if ready, list of error messages if issues are found.
     """
 
     errors = []
 
-    # [{'race_type': int, 'max_capacity': int}]
-    heat_list = (
-        Heat.objects.for_race(race_id)
-        .values("race_type")
-        .annotate(max_capacity=Sum("ideal_capacity"))
+    participants = Participant.objects.for_race_id(race_id).filter(
+        race_type_id=OuterRef("id")
+    )
+    relay_teams = RelayTeam.objects.for_race_id(race_id).filter(
+        race_type_id=OuterRef("id")
     )
+    heats = Heat.objects.for_race(race_id).filter(race_type_id=OuterRef("id"))
 
-    heat_dict_capacity = {
-        heat.get("race_type"): heat.get("max_capacity") for heat in heat_list
-    }
+    race_types = (
+        RaceType.objects.filter(Exists(participants) | Exists(relay_teams))
+        .annotate(
+            count=Coalesce(
+                Subquery(
+                    participants.active()
+                    .values("race_type_id")
+                    .annotate(count=Count("id"))
+                    .values("count")
+                ),
+                0,
+            )
+            + Coalesce(
+                Subquery(
+                    relay_teams.active()
+                    .values("race_type_id")
+                    .annotate(count=Count("id"))
+                    .values("count")
+                ),
+                0,
+            ),
+            max_capacity=Subquery(
+                heats.values("race_type_id")
+                .annotate(max_capacity=Sum("ideal_capacity"))
+                .values("max_capacity")
+            ),
+        )
+        .order_by("id")
+    )
 
     race_type: RaceType
-    for race_type in RaceType.objects.for_race(race_id=race_id).annotate(
-        count=Count("participants__bib_number", filter=Q(participants__is_active=True))
-        + Count("relay_teams__bib_number", filter=Q(relay_teams__is_active=True))
-    ):
-        if race_type.id not in heat_dict_capacity:
+    for race_type in race_types:
+        if race_type.max_capacity is None:
             errors.append("Race Type {} has no heats available".format(race_type.name))
 
-        elif race_type.count > heat_dict_capacity[race_type.id]:
+        elif race_type.count > race_type.max_capacity:
             errors.append(
                 "Race Type {} does not have enough capacity. It has {} spots, it needs {} spots. {} spots are missing.".format(
                     race_type.name,
-                    heat_dict_capacity[race_type.id],
+                    race_type.max_capacity,
                     race_type.count,
-                    race_type.count - heat_dict_capacity[race_type.id],
+                    race_type.count - race_type.max_capacity,
                 )
             )
 
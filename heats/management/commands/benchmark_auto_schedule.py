@@ -0,0 +1,107 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+
+from heats.heat_service import auto_schedule_heats
+from heats.models import Heat
+from participants.models import Participant, RelayTeam
+from tridu_server.testing import create_race
+
+
+def auto_schedule_heats_per_heat(race_id: int) -> None:
+    """
+    The query pattern of the auto scheduler before it scheduled in memory, kept as the benchmark baseline: every heat
+    selects its participants and relay teams sorted by the database, then updates them.
+    """
+
+    Participant.objects.for_race_id(race_id).update(heat=None)
+    RelayTeam.objects.for_race_id(race_id).update(heat=None)
+    Participant.objects.for_race_id(race_id).active().with_invalid_swim_time().update(
+        swim_time=None
+    )
+
+    heat: Heat
+    for heat in Heat.objects.for_race(race_id).order_by(
+        "race_type_id", "start_datetime"
+    ):
+        participant_ids = list(
+            Participant.objects.for_race_id(race_id)
+            .active()
+            .filter(race_type_id=heat.race_type_id, heat__isnull=True)
+            .order_by(F("swim_time").desc(nulls_first=True))
+            .values_list("id", flat=True)[: heat.ideal_capacity]
+        )
+        relay_team_ids = list(
+            RelayTeam.objects.for_race_id(race_id)
+            .active()
+            .filter(race_type_id=heat.race_type_id, heat__isnull=True)
+            .values_list("id", flat=True)[: heat.ideal_capacity]
+        )
+        if len(participant_ids) > 0:
+            Participant.objects.filter(id__in=participant_ids).update(heat=heat)
+        elif len(relay_team_ids) > 0:
+            RelayTeam.objects.filter(id__in=relay_team_ids).update(heat=heat)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the queries and time of the auto scheduler with the previous per heat scheduler on synthetic races. "
+        "The races are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--participants",
+            type=int,
+            default=2000,
+            help="Participants of each synthetic race.",
+        )
+        parser.add_argument(
+            "--heats",
+            type=int,
+            nargs="+",
+            default=[5, 20, 40, 80],
+            help="Heat counts to benchmark.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            "{:>6} {:>18} {:>18} {:>14} {:>14}".format(
+                "heats",
+                "per heat queries",
+                "in memory queries",
+                "per heat ms",
+                "in memory ms",
+            )
+        )
+
+        for heat_count in options["heats"]:
+            with transaction.atomic():
+                race = create_race(
+                    participant_count=options["participants"], heat_count=heat_count
+                )
+                # the in memory scheduler only writes what changed, so it runs first on the unscheduled race
+                in_memory = self.measure(auto_schedule_heats, race.id)
+                per_heat = self.measure(auto_schedule_heats_per_heat, race.id)
+                transaction.set_rollback(True)
+
+            self.stdout.write(
+                "{:>6} {:>18} {:>18} {:>14.1f} {:>14.1f}".format(
+                    heat_count, per_heat[0], in_memory[0], per_heat[1], in_memory[1]
+                )
+            )
+
+    @staticmethod
+    def measure(scheduler, race_id: int) -> tuple:
+        """
+        :return: The number of queries and the milliseconds scheduler takes to schedule the race
+        """
+
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            scheduler(race_id)
+            elapsed = time.perf_counter() - start
+        return len(context.captured_queries), elapsed * 1000
@@ -0,0 +1,113 @@
+import math
+import random
+import time
+from typing import List, Sequence
+
+from django.core.management.base import BaseCommand
+
+from heats.heat_service import balanced_heat_sizes
+
+
+def greedy_heat_sizes(count: int, capacities: Sequence[int]) -> List[int]:
+    """The heat sizes of the GREEDY mode, each heat is filled up to its capacity in order."""
+
+    sizes = []
+    for capacity in capacities:
+        sizes.append(min(capacity, count))
+        count -= sizes[-1]
+    return sizes
+
+
+def heat_spreads(swim_times: Sequence[float], sizes: Sequence[int]) -> List[float]:
+    """:return: The swim time standard deviation of each non empty heat"""
+
+    spreads = []
+    position = 0
+    for size in sizes:
+        heat_swim_times = swim_times[position : position + size]
+        position += size
+        if size > 0:
+            mean = sum(heat_swim_times) / size
+            spreads.append(
+                math.sqrt(
+                    sum((swim_time - mean) ** 2 for swim_time in heat_swim_times) / size
+                )
+            )
+    return spreads
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the GREEDY and BALANCED heat sizes of the auto scheduler on synthetic swim times: time, swim time "
+        "spread within heats and heat sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--participants",
+            type=int,
+            default=3000,
+            help="Participants of the race type.",
+        )
+        parser.add_argument(
+            "--heats", type=int, default=40, help="Heats of the race type."
+        )
+        parser.add_argument(
+            "--slack",
+            type=float,
+            default=0.1,
+            help="Heat capacity above an even split, as a fraction.",
+        )
+        parser.add_argument(
+            "--balance-weights",
+            type=float,
+            nargs="+",
+            default=[0.0, 100.0, 10000.0],
+            help="Balance weights of the BALANCED runs.",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options["seed"])
+        count = options["participants"]
+        capacity = math.ceil(count / options["heats"] * (1 + options["slack"]))
+        capacities = [capacity] * options["heats"]
+        # slowest first, like the scheduler
+        swim_times = sorted(
+            (max(generator.gauss(600, 150), 120) for _ in range(count)), reverse=True
+        )
+
+        self.stdout.write(
+            "{:<18} {:>9} {:>16} {:>16} {:>10} {:>10}".format(
+                "mode", "ms", "mean spread s", "max spread s", "min size", "last size"
+            )
+        )
+
+        start = time.perf_counter()
+        sizes = greedy_heat_sizes(count, capacities)
+        self.write_row("greedy", time.perf_counter() - start, swim_times, sizes)
+
+        for balance_weight in options["balance_weights"]:
+            start = time.perf_counter()
+            sizes = balanced_heat_sizes(swim_times, capacities, balance_weight)
+            self.write_row(
+                "balanced w={:g}".format(balance_weight),
+                time.perf_counter() - start,
+                swim_times,
+                sizes,
+            )
+
+    def write_row(
+        self, mode: str, elapsed: float, swim_times: Sequence[float], sizes: List[int]
+    ) -> None:
+        spreads = heat_spreads(swim_times, sizes)
+        self.stdout.write(
+            "{:<18} {:>9.1f} {:>16.1f} {:>16.1f} {:>10} {:>10}".format(
+                mode,
+                elapsed * 1000,
+                sum(spreads) / len(spreads),
+                max(spreads),
+                min(sizes),
+                sizes[-1],
+            )
+        )
@@ -0,0 +1,66 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("heats", "0005_alter_heat_color"),
+        ("race", "0005_racetype_checkins"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HeatSchedulePlan",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date_created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "fingerprint",
+                    models.CharField(
+                        help_text="Hash of the race's heats, participants and relay teams when the plan was created.",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "participants",
+                    models.JSONField(
+                        default=dict,
+                        help_text="Participant id to new heat id, only changes.",
+                    ),
+                ),
+                (
+                    "relay_teams",
+                    models.JSONField(
+                        default=dict,
+                        help_text="Relay Team id to new heat id, only changes.",
+                    ),
+                ),
+                (
+                    "heats",
+                    models.JSONField(
+                        default=list,
+                        help_text="Per heat participant count and average swim time.",
+                    ),
+                ),
+                (
+                    "race",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="heat_schedule_plans",
+                        to="race.race",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("heats", "0006_heatscheduleplan"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HeatRoster",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date_built", models.DateTimeField(auto_now=True)),
+                ("is_stale", models.BooleanField(default=False)),
+                (
+                    "version",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Bumped when the roster is marked stale, a rebuild is only saved if it did not change meanwhile.",
+                    ),
+                ),
+                (
+                    "etag",
+                    models.CharField(
+                        help_text="Hash of the JSON roster, sent as the ETag header.",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "json_roster",
+                    models.TextField(help_text="The heat participants as JSON."),
+                ),
+                (
+                    "csv_roster",
+                    models.TextField(
+                        help_text="The heat participants as CSV, with the participant export columns."
+                    ),
+                ),
+                (
+                    "heat",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="roster",
+                        to="heats.heat",
+                    ),
+                ),
+            ],
+        ),
+    ]
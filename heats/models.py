@@ -1,6 +1,6 @@
 from django.db import models
 
-from heats.querysets import HeatQuerySet
+from heats.querysets import HeatQuerySet, HeatRosterQuerySet
 
 
 class Heat(models.Model):
@@ -49,3 +49,63 @@ class Heat(models.Model):
             "short_code": "{} {}".format(self.race_type.name, self.termination),
             "color": self.color,
         }
+
+
+class HeatSchedulePlan(models.Model):
+    """
+    A previewed auto scheduler result for a race. It holds the heat changes the scheduler proposes so staff can review
+    them and apply them later without running the scheduler again.
+    """
+
+    race = models.ForeignKey(
+        to="race.Race", on_delete=models.CASCADE, related_name="heat_schedule_plans"
+    )
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    fingerprint = models.CharField(
+        max_length=64,
+        help_text="Hash of the race's heats, participants and relay teams when the plan was created.",
+    )
+    participants = models.JSONField(
+        default=dict, help_text="Participant id to new heat id, only changes."
+    )
+    relay_teams = models.JSONField(
+        default=dict, help_text="Relay Team id to new heat id, only changes."
+    )
+    heats = models.JSONField(
+        default=list, help_text="Per heat participant count and average swim time."
+    )
+
+    def __str__(self):
+        return "Heat Schedule Plan {} for {}".format(self.id, self.race_id)
+
+
+class HeatRoster(models.Model):
+    """
+    A rendered roster of a heat's participants, served to volunteers without querying the participants again.
+    A roster is marked stale when one of its participants changes, see HeatRosterQuerySet.mark_stale, and rebuilt on
+    read by heats.roster_service.
+    """
+
+    objects = HeatRosterQuerySet.as_manager()
+
+    heat = models.OneToOneField(
+        to=Heat, on_delete=models.CASCADE, related_name="roster"
+    )
+    date_built = models.DateTimeField(auto_now=True)
+    is_stale = models.BooleanField(default=False)
+    version = models.PositiveIntegerField(
+        default=0,
+        help_text="Bumped when the roster is marked stale, a rebuild is only saved if it did not change meanwhile.",
+    )
+
+    etag = models.CharField(
+        max_length=64, help_text="Hash of the JSON roster, sent as the ETag header."
+    )
+    json_roster = models.TextField(help_text="The heat participants as JSON.")
+    csv_roster = models.TextField(
+        help_text="The heat participants as CSV, with the participant export columns."
+    )
+
+    def __str__(self):
+        return "Roster of {}".format(self.heat_id)
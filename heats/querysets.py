@@ -1,6 +1,13 @@
 from __future__ import annotations
 
+import datetime
+from typing import Iterable
+
 from django.db import models
+from django.db.models import Avg, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from participants.models import Participant, RelayTeam
 
 
 class HeatQuerySet(models.QuerySet):
@@ -10,3 +17,66 @@ class HeatQuerySet(models.QuerySet):
 
     def for_race_type(self, race_type_id: int) -> HeatQuerySet:
         return self.filter(race_type_id=race_type_id)
+
+    def with_participant_stats(self) -> HeatQuerySet:
+        """
+        Annotate participant_count, active participants and relay teams, and avg_swim_time, of active participants,
+        as subqueries of the heats query. The schemas use these instead of querying each heat.
+        """
+        participants = Participant.objects.active().filter(heat_id=OuterRef("id"))
+        relay_teams = RelayTeam.objects.active().filter(heat_id=OuterRef("id"))
+
+        return self.annotate(
+            participant_count=Coalesce(
+                Subquery(
+                    participants.values("heat_id")
+                    .annotate(count=Count("id"))
+                    .values("count")
+                ),
+                0,
+            )
+            + Coalesce(
+                Subquery(
+                    relay_teams.values("heat_id")
+                    .annotate(count=Count("id"))
+                    .values("count")
+                ),
+                0,
+            ),
+            avg_swim_time=Coalesce(
+                Subquery(
+                    participants.values("heat_id")
+                    .annotate(avg_swim_time=Avg("swim_time"))
+                    .values("avg_swim_time")
+                ),
+                Value(datetime.timedelta(0)),
+            ),
+        )
+
+    def prefetch_race_type_checkins(self) -> HeatQuerySet:
+        """
+        Prefetch the check ins of the heats' race types, which HeatSchema shows. Their depends_on chains are read
+        from the CheckIn graph by CheckInSchema.
+        """
+        return self.prefetch_related("race_type__checkins")
+
+
+class HeatRosterQuerySet(models.QuerySet):
+
+    def mark_stale(self, heat_ids: Iterable[int | None] | models.QuerySet) -> int:
+        """
+        Mark the rosters of heats stale so they are rebuilt on their next read.
+        Every write that changes the participants of a heat, or a participant in a heat, must call it, single saves
+        are covered by the receivers in heats.signals.
+        Stale rosters get their version bumped too, a rebuild that started before this call is then not saved.
+        :param heat_ids: Heat ids, None values are ignored, or a queryset of heat ids
+        :return: The number of rosters marked stale
+        """
+
+        if not isinstance(heat_ids, models.QuerySet):
+            heat_ids = {heat_id for heat_id in heat_ids if heat_id is not None}
+            if len(heat_ids) == 0:
+                return 0
+        return self.filter(heat_id__in=heat_ids).update(
+            is_stale=True, version=models.F("version") + 1
+        )
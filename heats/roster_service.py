@@ -0,0 +1,121 @@
+import csv
+import hashlib
+from enum import Enum
+
+from django.utils import timezone
+
+from heats.models import Heat, HeatRoster
+from participants.models import Participant
+from participants.participant_service import (
+    EXPORT_CSV_COLUMNS,
+    EchoWriter,
+    flatten_dict,
+)
+from participants.schema.particiapnt import (
+    DownloadInfoParticipantSchema,
+    ParticipantSchema,
+)
+from tridu_server.renderers import render_json
+
+
+class RosterFormats(Enum):
+    JSON = "json"
+    CSV = "csv"
+
+
+def build_heat_roster(heat: Heat) -> HeatRoster:
+    """
+    Render and save the JSON and CSV rosters of a heat.
+    The JSON roster is the /heats/{heat_id}/participants response, the CSV roster has the participant export
+    columns.
+    The roster is only saved if its version did not change while rendering, otherwise a participant changed after
+    it was read and the roster stays stale for the next read.
+    :return: The rendered roster, saved unless it is stale
+    """
+
+    # created stale first, so a change while the first roster of a heat renders is not lost
+    roster, _ = HeatRoster.objects.get_or_create(
+        heat_id=heat.id, defaults={"is_stale": True}
+    )
+
+    participants = list(
+        Participant.objects.in_heat(heat.id)
+        .select_related("origin", "race", "race_type", "user")
+        .prefetch_related("checkins__check_in", "race_type__checkins")
+        .order_by("bib_number")
+    )
+    # the same annotated heat for every participant, so its stats are only queried once
+    heat = (
+        Heat.objects.select_related("race", "race_type")
+        .with_participant_stats()
+        .get(id=heat.id)
+    )
+    for participant in participants:
+        participant.heat = heat
+
+    # rendered like the API renders the /heats/{heat_id}/participants response, with one validation context so the
+    # check in chains of every participant are read from one CheckIn graph
+    context = {}
+    json_roster = render_json(
+        [
+            ParticipantSchema.from_orm(participant, context=context).model_dump()
+            for participant in participants
+        ]
+    ).decode()
+
+    writer = csv.writer(EchoWriter())
+    csv_roster = writer.writerow(EXPORT_CSV_COLUMNS) + "".join(
+        writer.writerow(
+            [
+                "" if row.get(column) is None else row[column]
+                for column in EXPORT_CSV_COLUMNS
+            ]
+        )
+        for row in (
+            flatten_dict(DownloadInfoParticipantSchema.from_orm(participant).dict())
+            for participant in participants
+        )
+    )
+
+    roster.etag = hashlib.sha256(json_roster.encode()).hexdigest()
+    roster.json_roster = json_roster
+    roster.csv_roster = csv_roster
+    roster.date_built = timezone.now()
+    saved = HeatRoster.objects.filter(id=roster.id, version=roster.version).update(
+        is_stale=False,
+        etag=roster.etag,
+        json_roster=roster.json_roster,
+        csv_roster=roster.csv_roster,
+        date_built=roster.date_built,
+    )
+    roster.is_stale = saved == 0
+    return roster
+
+
+def get_heat_roster(heat: Heat) -> HeatRoster:
+    """
+    Get the roster of a heat, building it if it is missing or stale.
+    """
+
+    try:
+        roster = HeatRoster.objects.get(heat_id=heat.id)
+    except HeatRoster.DoesNotExist:
+        return build_heat_roster(heat)
+
+    if roster.is_stale:
+        return build_heat_roster(heat)
+    return roster
+
+
+def build_race_heat_rosters(race_id: int) -> int:
+    """
+    Build the rosters of a race's heats that are missing or stale, the others are kept.
+    :return: The number of rosters built
+    """
+
+    heats = Heat.objects.for_race(race_id).exclude(roster__is_stale=False)
+    built = 0
+    for heat in heats:
+        build_heat_roster(heat)
+        built += 1
+    return built
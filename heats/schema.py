@@ -1,9 +1,10 @@
 import datetime
+from typing import Dict, List
 
 from django.db.models import Avg
-from ninja import ModelSchema
+from ninja import ModelSchema, Schema
 
-from heats.models import Heat
+from heats.models import Heat, HeatSchedulePlan
 from race.schema import (
     RaceTypeSchema,
     RaceSchema,
@@ -11,6 +12,22 @@ from race.schema import (
 )
 
 
+def get_avg_swim_time(heat: Heat) -> datetime.timedelta:
+    """Uses the HeatQuerySet.with_participant_stats annotation when the heat has it, else queries it."""
+    if hasattr(heat, "avg_swim_time"):
+        return heat.avg_swim_time
+    return heat.participants.active().aggregate(Avg("swim_time"))[
+        "swim_time__avg"
+    ] or datetime.timedelta(0)
+
+
+def get_participant_count(heat: Heat) -> int:
+    """Uses the HeatQuerySet.with_participant_stats annotation when the heat has it, else queries it."""
+    if hasattr(heat, "participant_count"):
+        return heat.participant_count
+    return heat.participants.active().count() + heat.relay_teams.active().count()
+
+
 class HeatSchema(ModelSchema):
     race_type: RaceTypeSchema
     race: RaceSchema
@@ -20,13 +37,11 @@ class HeatSchema(ModelSchema):
 
     @staticmethod
     def resolve_avg_swim_time(obj: Heat) -> datetime.timedelta:
-        return obj.participants.active().aggregate(Avg("swim_time"))[
-            "swim_time__avg"
-        ] or datetime.timedelta(0)
+        return get_avg_swim_time(obj)
 
     @staticmethod
     def resolve_participant_count(obj: Heat) -> int:
-        return obj.participants.active().count() + obj.relay_teams.active().count()
+        return get_participant_count(obj)
 
     @staticmethod
     def resolve_name(obj: Heat) -> str:
@@ -45,6 +60,23 @@ class HeatSchema(ModelSchema):
         fields_optional = ("pool",)
 
 
+class CompactHeatSchema(ModelSchema):
+    name: str
+
+    @staticmethod
+    def resolve_name(obj: Heat) -> str:
+        return obj.__str__()
+
+    class Meta:
+        model = Heat
+        fields = (
+            "id",
+            "termination",
+            "start_datetime",
+            "color",
+        )
+
+
 class PatchHeatSchema(ModelSchema):
     class Meta:
         model = Heat
@@ -81,14 +113,11 @@ class DownloadHeatSchema(ModelSchema):
 
     @staticmethod
     def resolve_avg_swim_time(obj: Heat) -> str:
-        return str(
-            obj.participants.active().aggregate(Avg("swim_time"))["swim_time__avg"]
-            or datetime.timedelta(0)
-        )
+        return str(get_avg_swim_time(obj))
 
     @staticmethod
     def resolve_participant_count(obj: Heat) -> int:
-        return obj.participants.active().count() + obj.relay_teams.active().count()
+        return get_participant_count(obj)
 
     @staticmethod
     def resolve_name(obj: Heat) -> str:
@@ -102,3 +131,19 @@ class DownloadHeatSchema(ModelSchema):
             "pool",
         )
         fields_optional = ("pool",)
+
+
+class HeatSchedulePlanHeatSchema(Schema):
+    heat_id: int
+    participant_count: int
+    avg_swim_time: datetime.timedelta
+
+
+class HeatSchedulePlanSchema(ModelSchema):
+    participants: Dict[int, int | None]
+    relay_teams: Dict[int, int | None]
+    heats: List[HeatSchedulePlanHeatSchema]
+
+    class Meta:
+        model = HeatSchedulePlan
+        fields = ("id", "race", "date_created")
@@ -0,0 +1,133 @@
+from django.db.models import DEFERRED, Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from accounts.models import User
+from checkins.models import CheckIn
+from heats.models import Heat, HeatRoster
+from locations.models import Location
+from participants.models import Participant, ParticipantCheckIn, RelayTeam
+from race.models import Race, RaceType
+
+
+@receiver(pre_save, sender=Participant)
+@receiver(pre_save, sender=RelayTeam)
+def mark_participant_heat_rosters_stale(
+    sender, instance: Participant | RelayTeam, **kwargs
+):
+    """
+    A saved participant changes the roster of its heat, and of its previous heat when it moved. Relay teams change
+    the participant count of their heats, which rosters show.
+    The previous heat is the one the instance was loaded or last saved in, it is only queried for instances that
+    were not, like the ones created with a pk or loaded without their heat.
+    """
+    saved_heat_id = getattr(instance, "saved_heat_id", DEFERRED)
+    if instance.pk is None:
+        HeatRoster.objects.mark_stale([instance.heat_id])
+    elif saved_heat_id is not DEFERRED:
+        HeatRoster.objects.mark_stale([instance.heat_id, saved_heat_id])
+    else:
+        HeatRoster.objects.mark_stale(
+            Heat.objects.filter(
+                Q(id=instance.heat_id)
+                | Q(id__in=sender.objects.filter(pk=instance.pk).values("heat_id"))
+            ).values("id")
+        )
+
+
+@receiver(post_delete, sender=Participant)
+@receiver(post_delete, sender=RelayTeam)
+def mark_deleted_participant_heat_roster_stale(
+    sender, instance: Participant | RelayTeam, **kwargs
+):
+    HeatRoster.objects.mark_stale([instance.heat_id])
+
+
+@receiver(post_save, sender=ParticipantCheckIn)
+@receiver(post_delete, sender=ParticipantCheckIn)
+def mark_checkin_heat_roster_stale(sender, instance: ParticipantCheckIn, **kwargs):
+    """Rosters list the participant check ins."""
+    HeatRoster.objects.mark_stale(
+        Participant.objects.filter(id=instance.participant_id).values("heat_id")
+    )
+
+
+@receiver(post_save, sender=User)
+def mark_user_heat_rosters_stale(sender, instance: User, created: bool, **kwargs):
+    """Rosters list the participant users."""
+    if not created:
+        HeatRoster.objects.mark_stale(
+            Participant.objects.of_user(instance.id).values("heat_id")
+        )
+
+
+@receiver(post_save, sender=Heat)
+def mark_heat_roster_stale(sender, instance: Heat, created: bool, **kwargs):
+    """Rosters show their heat."""
+    if not created:
+        HeatRoster.objects.mark_stale([instance.id])
+
+
+@receiver(post_save, sender=Race)
+def mark_race_heat_rosters_stale(sender, instance: Race, created: bool, **kwargs):
+    """Rosters show the race of their heat and participants."""
+    if not created:
+        HeatRoster.objects.mark_stale(Heat.objects.for_race(instance.id).values("id"))
+
+
+@receiver(post_save, sender=RaceType)
+def mark_race_type_heat_rosters_stale(
+    sender, instance: RaceType, created: bool, **kwargs
+):
+    """Rosters show the race type, and its check ins, of their heat and participants."""
+    if not created:
+        HeatRoster.objects.mark_stale(
+            Heat.objects.filter(
+                Q(race_type=instance.id) | Q(participants__race_type=instance.id)
+            ).values("id")
+        )
+
+
+@receiver(m2m_changed, sender=RaceType.checkins.through)
+def mark_race_type_checkins_heat_rosters_stale(
+    sender, instance: RaceType | CheckIn, action: str, pk_set, **kwargs
+):
+    if not action.startswith("post_"):
+        return
+
+    if isinstance(instance, RaceType):
+        race_type_ids = [instance.id]
+    elif pk_set is not None:
+        race_type_ids = list(pk_set)
+    else:
+        # post_clear from the check in side, the race types are no longer known
+        HeatRoster.objects.mark_stale(Heat.objects.values("id"))
+        return
+
+    HeatRoster.objects.mark_stale(
+        Heat.objects.filter(
+            Q(race_type__in=race_type_ids)
+            | Q(participants__race_type__in=race_type_ids)
+        ).values("id")
+    )
+
+
+@receiver(post_save, sender=CheckIn)
+@receiver(post_delete, sender=CheckIn)
+def mark_checkin_rosters_stale(sender, instance: CheckIn, **kwargs):
+    """
+    Rosters show check ins through race types and participant check ins, with their depends_on chains. Check ins are
+    few and rarely edited, so every roster is marked stale instead of finding the ones that show it.
+    """
+    HeatRoster.objects.mark_stale(Heat.objects.values("id"))
+
+
+@receiver(post_save, sender=Location)
+def mark_location_heat_rosters_stale(
+    sender, instance: Location, created: bool, **kwargs
+):
+    """Rosters show the participant origins."""
+    if not created:
+        HeatRoster.objects.mark_stale(
+            Participant.objects.filter(origin_id=instance.id).values("heat_id")
+        )
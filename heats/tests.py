@@ -0,0 +1,677 @@
+import datetime
+import itertools
+import random
+import threading
+from typing import List, Sequence
+from unittest import mock
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from checkins.models import CheckIn
+from heats import heat_service, roster_service
+from heats.heat_service import (
+    AutoSchedulerException,
+    auto_schedule_heats,
+    balanced_heat_sizes,
+    check_auto_schedule_is_ready,
+    run_in_thread,
+)
+from heats.models import Heat, HeatRoster, HeatSchedulePlan
+from participants.models import Participant, RelayTeam
+from race.models import Race, RaceType
+from tridu_server.testing import authorization_headers, create_race
+
+
+class AutoScheduleHeatsTestCase(TestCase):
+
+    def count_queries(self, heat_count: int) -> int:
+        race = create_race(
+            participant_count=120,
+            heat_count=heat_count,
+            seed=heat_count,
+        )
+        with CaptureQueriesContext(connection) as context:
+            auto_schedule_heats(race.id)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_heats(self):
+        query_counts = [self.count_queries(heat_count) for heat_count in (2, 8, 24)]
+
+        self.assertEqual(len(set(query_counts)), 1, query_counts)
+
+    def test_query_count(self):
+        race = create_race(participant_count=40, heat_count=6)
+
+        # readiness check and race types, then in a savepoint: heats, participants, relay teams, bulk update and
+        # stale rosters
+        with self.assertNumQueries(2 + 7):
+            auto_schedule_heats(race.id)
+
+        self.assertFalse(
+            Participant.objects.for_race_id(race.id)
+            .active()
+            .filter(heat__isnull=True)
+            .exists()
+        )
+
+
+def assertRaceScheduled(test_case: TestCase, race_id: int) -> None:
+    """Every active participant of the race is in a heat of its race type."""
+
+    participants = Participant.objects.for_race_id(race_id).active()
+    test_case.assertFalse(participants.filter(heat__isnull=True).exists())
+    test_case.assertFalse(
+        participants.exclude(heat__race_type_id=F("race_type_id")).exists()
+    )
+
+
+class ParallelAutoScheduleHeatsTestCase(TransactionTestCase):
+    """
+    Race types are scheduled by worker threads when the database has row locks, which SQLite does not have: the
+    tests make the scheduler believe it does.
+    """
+
+    def setUp(self):
+        self.race = create_race(participant_count=60, heat_count=3, race_type_count=3)
+        self.thread_ids = []
+
+    def run_in_thread(self, function, *args):
+        self.thread_ids.append(threading.get_ident())
+        return run_in_thread(function, *args)
+
+    def test_race_types_are_scheduled_by_workers(self):
+        with mock.patch.object(
+            connection.features, "has_select_for_update", True
+        ), mock.patch.object(
+            heat_service, "run_in_thread", self.run_in_thread
+        ), mock.patch.object(
+            # one worker at a time, SQLite does not wait on table locks of its in memory test database
+            heat_service,
+            "MAX_SCHEDULER_WORKERS",
+            1,
+        ):
+            auto_schedule_heats(self.race.id)
+
+        self.assertEqual(len(self.thread_ids), 3)
+        self.assertNotIn(threading.get_ident(), self.thread_ids)
+        assertRaceScheduled(self, self.race.id)
+
+    def test_race_types_are_scheduled_in_the_caller_transaction(self):
+        with mock.patch.object(
+            connection.features, "has_select_for_update", True
+        ), mock.patch.object(
+            # SQLite has no FOR UPDATE clause
+            connection.ops,
+            "for_update_sql",
+            return_value="",
+        ), mock.patch.object(
+            heat_service, "ThreadPoolExecutor", side_effect=AssertionError
+        ):
+            with transaction.atomic():
+                # uncommitted rows, which worker connections would not see
+                race = create_race(
+                    participant_count=30, heat_count=2, race_type_count=2, seed=2
+                )
+                auto_schedule_heats(race.id)
+                assertRaceScheduled(self, race.id)
+
+
+class RescheduleParticipantsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.race = create_race(
+            participant_count=30, heat_count=3, relay_team_count=2, seed=4
+        )
+        auto_schedule_heats(cls.race.id)
+        cls.race_type = RaceType.objects.filter(participants__race=cls.race).first()
+        cls.heats = list(
+            Heat.objects.for_race_type(cls.race_type.id).order_by("start_datetime")
+        )
+
+    def create_participant(
+        self, swim_time: datetime.timedelta | None, race: Race | None = None
+    ) -> Participant:
+        race = self.race if race is None else race
+        return Participant.objects.create(
+            user=User.objects.create(username="late{}".format(User.objects.count())),
+            race=race,
+            race_type=race.participants.first().race_type,
+            bib_number=1000 + Participant.objects.count(),
+            swim_time=swim_time,
+        )
+
+    def get_heat_members(self) -> List[List[Participant]]:
+        return [
+            sorted(
+                Participant.objects.in_heat(heat.id).active(),
+                key=heat_service.swim_time_sort_key,
+            )
+            for heat in self.heats
+        ]
+
+    def assertHeatsOrdered(self) -> None:
+        """Every heat is within its capacity, and slower than the heats after it."""
+
+        heat_members = self.get_heat_members()
+        for heat, members in zip(self.heats, heat_members):
+            self.assertLessEqual(
+                len(members), Heat.objects.get(id=heat.id).ideal_capacity
+            )
+        for members, later_members in zip(heat_members, heat_members[1:]):
+            if len(members) > 0 and len(later_members) > 0:
+                self.assertLess(
+                    heat_service.swim_time_sort_key(members[-1]),
+                    heat_service.swim_time_sort_key(later_members[0]),
+                )
+        assertRaceScheduled(self, self.race.id)
+
+    def reschedule(self, participant_ids: List[int]) -> int:
+        return heat_service.reschedule_participants(self.race.id, participant_ids)
+
+    def test_fast_late_entrant(self):
+        participant = self.create_participant(datetime.timedelta(seconds=100))
+
+        self.assertEqual(self.reschedule([participant.id]), 1)
+
+        participant.refresh_from_db()
+        self.assertEqual(participant.heat_id, self.heats[-1].id)
+        self.assertHeatsOrdered()
+
+    def test_full_heat_shifts_towards_the_heat_with_room(self):
+        # only the slowest heat has room left
+        for heat, members in zip(self.heats, self.get_heat_members()):
+            Heat.objects.filter(id=heat.id).update(
+                ideal_capacity=len(members) + (1 if heat == self.heats[0] else 0)
+            )
+        before = {
+            participant.id: participant.heat_id
+            for participant in Participant.objects.for_race_id(self.race.id)
+        }
+        participant = self.create_participant(datetime.timedelta(seconds=100))
+
+        # the entrant, then the slowest participant of each heat after the first one
+        self.assertEqual(self.reschedule([participant.id]), len(self.heats))
+
+        participant.refresh_from_db()
+        self.assertEqual(participant.heat_id, self.heats[-1].id)
+        moved = [
+            participant
+            for participant in Participant.objects.for_race_id(self.race.id)
+            if participant.id in before
+            and before[participant.id] != participant.heat_id
+        ]
+        self.assertEqual(len(moved), len(self.heats) - 1)
+        self.assertHeatsOrdered()
+
+    def test_without_swim_time(self):
+        participant = self.create_participant(None)
+        zero_swim_time = self.create_participant(datetime.timedelta(0))
+
+        self.reschedule([participant.id, zero_swim_time.id])
+
+        participant.refresh_from_db()
+        zero_swim_time.refresh_from_db()
+        # participants without a swim time go first
+        self.assertEqual(participant.heat_id, self.heats[0].id)
+        self.assertEqual(zero_swim_time.heat_id, self.heats[0].id)
+        self.assertIsNone(zero_swim_time.swim_time)
+        self.assertHeatsOrdered()
+
+    def test_relay_teams_keep_their_heats(self):
+        relay_team_heats = dict(
+            RelayTeam.objects.for_race_id(self.race.id).values_list("id", "heat_id")
+        )
+        participant = self.create_participant(datetime.timedelta(seconds=500))
+
+        self.reschedule([participant.id])
+
+        self.assertEqual(
+            dict(
+                RelayTeam.objects.for_race_id(self.race.id).values_list("id", "heat_id")
+            ),
+            relay_team_heats,
+        )
+        self.assertFalse(
+            Participant.objects.filter(heat__relay_teams__isnull=False).exists()
+        )
+        self.assertHeatsOrdered()
+
+    def test_participant_of_another_race(self):
+        other_race = create_race(participant_count=5, heat_count=1, seed=5)
+        auto_schedule_heats(other_race.id)
+        participant = self.create_participant(
+            datetime.timedelta(seconds=100), other_race
+        )
+
+        self.assertEqual(self.reschedule([participant.id]), 0)
+
+        participant.refresh_from_db()
+        self.assertIsNone(participant.heat_id)
+        self.assertHeatsOrdered()
+
+
+class HeatSchedulePlanTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="staff", is_staff=True)
+        cls.race = create_race(participant_count=30, heat_count=3, seed=6)
+
+    def post(self, path: str):
+        return self.client.post(
+            path.format(race_id=self.race.id),
+            headers=authorization_headers(self.user),
+        )
+
+    def preview(self) -> int:
+        response = self.post("/api/races/{race_id}/heats/auto_schedule/preview")
+        self.assertEqual(response.status_code, 200)
+        return response.json()["id"]
+
+    def apply(self, plan_id: int):
+        return self.post(
+            "/api/races/{race_id}/heats/auto_schedule/plans/" + str(plan_id)
+        )
+
+    def test_apply(self):
+        plan = HeatSchedulePlan.objects.get(id=self.preview())
+
+        self.assertEqual(self.apply(plan.id).status_code, 200)
+
+        assertRaceScheduled(self, self.race.id)
+        self.assertEqual(
+            {
+                str(participant_id): heat_id
+                for participant_id, heat_id in Participant.objects.for_race_id(
+                    self.race.id
+                ).values_list("id", "heat_id")
+            },
+            plan.participants,
+        )
+
+    def test_apply_after_participants_changed(self):
+        plan_id = self.preview()
+        participant = Participant.objects.for_race_id(self.race.id).first()
+        participant.swim_time = datetime.timedelta(seconds=100)
+        participant.save()
+
+        response = self.apply(plan_id)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("changed after this plan was created", response.json()["details"])
+        self.assertFalse(
+            Participant.objects.for_race_id(self.race.id)
+            .filter(heat__isnull=False)
+            .exists()
+        )
+        # kept, so it can still be reviewed
+        self.assertTrue(HeatSchedulePlan.objects.filter(id=plan_id).exists())
+
+    def test_apply_twice(self):
+        plan_id = self.preview()
+
+        self.assertEqual(self.apply(plan_id).status_code, 200)
+        heats = dict(
+            Participant.objects.for_race_id(self.race.id).values_list("id", "heat_id")
+        )
+
+        self.assertEqual(self.apply(plan_id).status_code, 404)
+        self.assertEqual(
+            dict(
+                Participant.objects.for_race_id(self.race.id).values_list(
+                    "id", "heat_id"
+                )
+            ),
+            heats,
+        )
+
+
+def heat_sizes_cost(
+    swim_times: Sequence[float],
+    sizes: Sequence[int],
+    capacities: Sequence[int],
+    balance_weight: float,
+) -> float:
+    """The cost balanced_heat_sizes minimizes, computed directly from the heats."""
+
+    cost = 0.0
+    position = 0
+    total_capacity = sum(capacities)
+    for size, capacity in zip(sizes, capacities):
+        heat_swim_times = swim_times[position : position + size]
+        position += size
+        if size > 0:
+            mean = sum(heat_swim_times) / size
+            cost += sum((swim_time - mean) ** 2 for swim_time in heat_swim_times)
+        share = len(swim_times) * capacity / total_capacity if total_capacity else 0
+        cost += balance_weight * (size - share) ** 2
+    return cost
+
+
+class BalancedHeatSizesTestCase(SimpleTestCase):
+
+    def test_optimal_on_small_inputs(self):
+        generator = random.Random(4)
+
+        for _ in range(300):
+            count = generator.randint(0, 10)
+            capacities = [
+                generator.randint(0, 6) for _ in range(generator.randint(1, 4))
+            ]
+            capacities[-1] += max(count - sum(capacities), 0)
+            swim_times = sorted(
+                (generator.randint(200, 900) for _ in range(count)), reverse=True
+            )
+            balance_weight = generator.choice([0.0, 1.0, 100.0])
+
+            sizes = balanced_heat_sizes(swim_times, capacities, balance_weight)
+
+            self.assertEqual(sum(sizes), count)
+            for size, capacity in zip(sizes, capacities):
+                self.assertLessEqual(size, capacity)
+            # every split of the participants into the heats, in order and within capacity
+            best = min(
+                heat_sizes_cost(swim_times, candidate, capacities, balance_weight)
+                for candidate in itertools.product(
+                    *[range(capacity + 1) for capacity in capacities]
+                )
+                if sum(candidate) == count
+            )
+            self.assertAlmostEqual(
+                heat_sizes_cost(swim_times, sizes, capacities, balance_weight),
+                best,
+                places=6,
+            )
+
+    def test_not_enough_capacity(self):
+        with self.assertRaises(AutoSchedulerException):
+            balanced_heat_sizes([600.0, 500.0, 400.0], [1, 1])
+
+
+def check_auto_schedule_is_ready_joined(race_id: int) -> List[str]:
+    """
+    The readiness check before it used subquery aggregates, which counted through joins of the participants and relay
+    teams. Kept to check both give the same errors.
+    """
+
+    errors = []
+    heat_capacities = {
+        heat["race_type"]: heat["max_capacity"]
+        for heat in Heat.objects.for_race(race_id)
+        .values("race_type")
+        .annotate(max_capacity=Sum("ideal_capacity"))
+    }
+
+    for race_type in RaceType.objects.for_race(race_id=race_id).annotate(
+        count=Count("participants__bib_number", filter=Q(participants__is_active=True))
+        + Count("relay_teams__bib_number", filter=Q(relay_teams__is_active=True))
+    ):
+        if race_type.id not in heat_capacities:
+            errors.append("Race Type {} has no heats available".format(race_type.name))
+        elif race_type.count > heat_capacities[race_type.id]:
+            errors.append(
+                "Race Type {} does not have enough capacity. It has {} spots, it needs {} spots. {} spots are "
+                "missing.".format(
+                    race_type.name,
+                    heat_capacities[race_type.id],
+                    race_type.count,
+                    race_type.count - heat_capacities[race_type.id],
+                )
+            )
+    return errors
+
+
+class CheckAutoScheduleIsReadyTestCase(TestCase):
+
+    def assertErrors(self, race_id: int, errors: List[str]) -> None:
+        with self.assertNumQueries(1):
+            self.assertEqual(check_auto_schedule_is_ready(race_id), errors)
+        self.assertEqual(
+            sorted(check_auto_schedule_is_ready_joined(race_id)), sorted(errors)
+        )
+
+    def test_ready(self):
+        race = create_race(participant_count=30, heat_count=3, relay_team_count=4)
+
+        self.assertErrors(race.id, [])
+
+    def test_no_heats(self):
+        race = create_race(participant_count=30, heat_count=3, race_type_count=2)
+        race_type = RaceType.objects.for_race(race.id).order_by("id").last()
+        Heat.objects.filter(race_type=race_type).delete()
+
+        self.assertErrors(
+            race.id, ["Race Type {} has no heats available".format(race_type.name)]
+        )
+
+    def test_not_enough_capacity(self):
+        race = create_race(participant_count=30, heat_count=3)
+        race_type = RaceType.objects.for_race(race.id).first()
+        Heat.objects.filter(race=race).update(ideal_capacity=8)
+
+        self.assertErrors(
+            race.id,
+            [
+                "Race Type {} does not have enough capacity. It has 24 spots, it needs 30 spots. 6 spots are "
+                "missing.".format(race_type.name)
+            ],
+        )
+
+    def test_inactive_participants_are_not_counted(self):
+        race = create_race(participant_count=30, heat_count=3)
+        Heat.objects.filter(race=race).update(ideal_capacity=8)
+        Participant.objects.filter(race=race, bib_number__lte=6).update(is_active=False)
+
+        self.assertErrors(race.id, [])
+
+    def test_relay_teams_are_counted(self):
+        race = create_race(participant_count=10, heat_count=2, relay_team_count=5)
+        relay_race_type = RaceType.objects.get(relay_teams__bib_number=11)
+        Heat.objects.filter(race_type=relay_race_type).update(ideal_capacity=2)
+        RelayTeam.objects.filter(race=race, bib_number=15).update(is_active=False)
+        self.assertErrors(race.id, [])
+
+        RelayTeam.objects.filter(race=race, bib_number=15).update(is_active=True)
+        self.assertErrors(
+            race.id,
+            [
+                "Race Type {} does not have enough capacity. It has 4 spots, it needs 5 spots. 1 spots are "
+                "missing.".format(relay_race_type.name)
+            ],
+        )
+
+    def test_other_races_are_ignored(self):
+        race = create_race(participant_count=20, heat_count=2)
+        other_race = create_race(participant_count=20, heat_count=2)
+        race_type = RaceType.objects.for_race(race.id).first()
+        # the other race's participants move to the first race's race type, which has no heats in the other race
+        Participant.objects.filter(race=other_race).update(race_type=race_type)
+
+        self.assertErrors(race.id, [])
+        self.assertErrors(
+            other_race.id,
+            ["Race Type {} has no heats available".format(race_type.name)],
+        )
+
+
+class HeatRosterTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="staff", is_staff=True)
+        cls.race = create_race(
+            participant_count=30, heat_count=3, relay_team_count=2, seed=3
+        )
+        auto_schedule_heats(cls.race.id)
+        cls.heat = Heat.objects.for_race(cls.race.id).order_by("start_datetime").first()
+
+    def get(self, path: str, **headers):
+        return self.client.get(
+            path, headers={**authorization_headers(self.user), **headers}
+        )
+
+    def get_roster(self, heat: Heat):
+        return self.get("/api/heats/{}/roster".format(heat.id))
+
+    def assertRostersStale(self, heats) -> None:
+        self.assertEqual(
+            set(
+                HeatRoster.objects.filter(is_stale=True).values_list(
+                    "heat_id", flat=True
+                )
+            ),
+            {heat.id for heat in heats},
+        )
+
+    def build_rosters(self) -> None:
+        for heat in Heat.objects.for_race(self.race.id):
+            self.get_roster(heat)
+        self.assertRostersStale([])
+
+    def test_roster_is_the_participants_response(self):
+        participants = self.get("/api/heats/{}/participants".format(self.heat.id))
+
+        self.assertEqual(
+            self.get_roster(self.heat).json(),
+            sorted(
+                participants.json(), key=lambda participant: participant["bib_number"]
+            ),
+        )
+
+    def test_not_modified(self):
+        etag = self.get_roster(self.heat)["ETag"]
+
+        response = self.get(
+            "/api/heats/{}/roster".format(self.heat.id), If_None_Match=etag
+        )
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_heat_update_changes_the_roster(self):
+        etag = self.get_roster(self.heat)["ETag"]
+
+        response = self.client.patch(
+            "/api/heats/{}".format(self.heat.id),
+            {"color": "0xFFFFFF"},
+            content_type="application/json",
+            headers=authorization_headers(self.user),
+        )
+        self.assertEqual(response.status_code, 200)
+
+        roster = self.get_roster(self.heat)
+        self.assertNotEqual(roster["ETag"], etag)
+        self.assertEqual(roster.json()[0]["heat"]["color"], "0xFFFFFF")
+
+    def test_race_and_race_type_saves(self):
+        self.build_rosters()
+        heats = list(Heat.objects.for_race(self.race.id))
+
+        self.race.name = "Renamed"
+        self.race.save()
+        self.assertRostersStale(heats)
+
+        self.build_rosters()
+        race_type = self.heat.race_type
+        race_type.name = "Renamed"
+        race_type.save()
+        self.assertRostersStale(
+            [heat for heat in heats if heat.race_type_id == race_type.id]
+        )
+
+    def test_check_in_changes(self):
+        self.build_rosters()
+        race_type_heats = list(Heat.objects.for_race_type(self.heat.race_type_id))
+
+        check_in = CheckIn.objects.create(name="Wetbag")
+        self.assertRostersStale(Heat.objects.all())
+
+        self.build_rosters()
+        self.heat.race_type.checkins.add(check_in)
+        self.assertRostersStale(race_type_heats)
+
+    def test_relay_team_moves(self):
+        relay_heats = list(
+            Heat.objects.for_race(self.race.id)
+            .filter(relay_teams__isnull=False)
+            .distinct()
+        )
+        other_heat = (
+            Heat.objects.for_race(self.race.id)
+            .filter(race_type_id=relay_heats[0].race_type_id)
+            .exclude(id__in=[heat.id for heat in relay_heats])
+            .get()
+        )
+        self.build_rosters()
+
+        relay_team = RelayTeam.objects.filter(heat=relay_heats[0]).first()
+        relay_team.heat = other_heat
+        relay_team.save()
+
+        self.assertRostersStale([relay_heats[0], other_heat])
+
+    def test_participant_moves(self):
+        other_heat = (
+            Heat.objects.for_race_type(self.heat.race_type_id)
+            .exclude(id=self.heat.id)
+            .first()
+        )
+        self.build_rosters()
+
+        participant = Participant.objects.in_heat(self.heat.id).first()
+        participant.heat = other_heat
+        with CaptureQueriesContext(connection) as context:
+            participant.save()
+
+        self.assertRostersStale([self.heat, other_heat])
+        # the heat it leaves is the one it was loaded in, not looked up by the roster update
+        roster_updates = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith('UPDATE "heats_heatroster"')
+        ]
+        self.assertEqual(len(roster_updates), 1)
+        self.assertNotIn("participants_participant", roster_updates[0])
+
+    def test_change_while_building_keeps_the_roster_stale(self):
+        self.build_rosters()
+        HeatRoster.objects.mark_stale([self.heat.id])
+        render_json = roster_service.render_json
+
+        def render_json_and_change(data):
+            # another request changes a participant of the heat while the roster renders
+            HeatRoster.objects.mark_stale([self.heat.id])
+            return render_json(data)
+
+        with mock.patch.object(
+            roster_service, "render_json", side_effect=render_json_and_change
+        ):
+            self.assertEqual(self.get_roster(self.heat).status_code, 200)
+        self.assertRostersStale([self.heat])
+
+        self.get_roster(self.heat)
+        self.assertRostersStale([])
+
+    def test_clean_gender(self):
+        participant = Participant.objects.in_heat(self.heat.id).first()
+        User.objects.filter(id=participant.user_id).update(gender="Woman")
+        self.build_rosters()
+
+        response = self.client.post(
+            "/api/users/action/clean_gender", headers=authorization_headers(self.user)
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertRostersStale([self.heat])
+        self.assertEqual(
+            next(
+                row["user"]["gender"]
+                for row in self.get_roster(self.heat).json()
+                if row["id"] == participant.id
+            ),
+            "F",
+        )
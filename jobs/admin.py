@@ -0,0 +1,8 @@
+from django.contrib import admin
+
+from jobs.models import ImportJob
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    exclude = ("rows", "result")
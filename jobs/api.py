@@ -0,0 +1,47 @@
+from ninja import Router
+
+from jobs.models import ImportJob
+from jobs.schema import ImportJobSchema
+from tridu_server.schemas import BulkCreateResponseSchema, ErrorObjectSchema
+
+router = Router()
+
+
+@router.get(
+    "/{job_id}/result",
+    tags=["import"],
+    response={
+        200: BulkCreateResponseSchema,
+        404: ErrorObjectSchema,
+        409: ErrorObjectSchema,
+    },
+)
+def get_import_job_result(request, job_id: int):
+    try:
+        job = ImportJob.objects.get(id=job_id)
+    except ImportJob.DoesNotExist:
+        return 404, ErrorObjectSchema.from_404_error(
+            details="Import Job with id {} does not exist".format(job_id)
+        )
+
+    if job.result is None:
+        return 409, ErrorObjectSchema.for_validation_error(
+            details="Import Job is {}, it has no result yet.".format(job.status),
+            instance_name="Import Job",
+        )
+
+    return 200, job.result
+
+
+@router.get(
+    "/{job_id}",
+    tags=["import"],
+    response={200: ImportJobSchema, 404: ErrorObjectSchema},
+)
+def get_import_job(request, job_id: int):
+    try:
+        return 200, ImportJob.objects.get(id=job_id)
+    except ImportJob.DoesNotExist:
+        return 404, ErrorObjectSchema.from_404_error(
+            details="Import Job with id {} does not exist".format(job_id)
+        )
@@ -0,0 +1,171 @@
+import datetime
+from typing import List, Sequence
+
+from django.utils import timezone
+
+from accounts.models import User
+from accounts.schema import UserSchema
+from accounts.user_service import import_users
+from jobs.models import ImportJob
+from participants.participant_service import FIRST_ROW_NUMBER, import_participants
+from participants.schema.particiapnt import ParticipantSchema
+from tridu_server.schemas import BulkCreateResponseSchema
+
+IMPORT_JOB_CHUNK_SIZE = 500
+# a running job whose worker saved no progress for this long is failed, the worker is assumed to be dead
+IMPORT_JOB_HEARTBEAT_TIMEOUT = datetime.timedelta(minutes=10)
+
+
+def queue_import_job(
+    kind: ImportJob.Kinds, rows: Sequence[dict], created_by: User | None = None
+) -> ImportJob:
+    """
+    Save an import for a background worker to process.
+    :param kind: What the rows are
+    :param rows: The import rows, as given to import_participants or import_users
+    :param created_by: The user requesting the import
+    :return: The new queued ImportJob
+    """
+
+    return ImportJob.objects.create(
+        kind=kind,
+        rows=list(rows),
+        rows_total=len(rows),
+        created_by=created_by,
+    )
+
+
+def claim_next_import_job() -> ImportJob | None:
+    """
+    Mark the oldest queued job as running and return it, after failing the stale running jobs.
+    The claim is a conditional update, so two workers never run the same job.
+    :return: The claimed job, None if no job is queued
+    """
+
+    fail_stale_import_jobs()
+
+    for job_id in (
+        ImportJob.objects.queued().oldest_first().values_list("id", flat=True)[:10]
+    ):
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(
+            id=job_id, status=ImportJob.Statuses.QUEUED
+        ).update(
+            status=ImportJob.Statuses.RUNNING, date_started=now, date_heartbeat=now
+        )
+        if claimed == 1:
+            return ImportJob.objects.get(id=job_id)
+    return None
+
+
+def fail_stale_import_jobs() -> int:
+    """
+    Fail the running jobs without a heartbeat for IMPORT_JOB_HEARTBEAT_TIMEOUT, their worker died.
+    They are not requeued, the rows imported before the worker died would come back as duplicates. The progress
+    tells the client which rows were imported.
+    Each job is failed with a conditional update, so a worker saving progress meanwhile keeps its job.
+    :return: The number of jobs failed
+    """
+
+    failed = 0
+    now = timezone.now()
+    job: ImportJob
+    for job in ImportJob.objects.stale(now - IMPORT_JOB_HEARTBEAT_TIMEOUT).only(
+        "id", "errors", "date_heartbeat"
+    ):
+        failed += ImportJob.objects.filter(
+            id=job.id,
+            status=ImportJob.Statuses.RUNNING,
+            date_heartbeat=job.date_heartbeat,
+        ).update(
+            status=ImportJob.Statuses.FAILED,
+            rows=[],
+            errors=job.errors + ["Import stopped, the worker stopped responding"],
+            date_finished=now,
+        )
+    return failed
+
+
+def run_import_job(job: ImportJob) -> None:
+    """
+    Import a job's rows in chunks, saving the progress after each chunk so clients can poll it.
+    Once done, the job holds the BulkCreateResponseSchema of the whole import and its rows are cleared.
+    Progress is only saved while the job is running, a job failed as stale stops at its next chunk.
+    :return: None
+    """
+
+    items: List[str] = []
+
+    try:
+        for start in range(0, job.rows_total, IMPORT_JOB_CHUNK_SIZE):
+            chunk = job.rows[start : start + IMPORT_JOB_CHUNK_SIZE]
+
+            if job.kind == ImportJob.Kinds.PARTICIPANTS:
+                result = import_participants(
+                    chunk, first_row_number=FIRST_ROW_NUMBER + start
+                )
+                context = {}
+                items.extend(
+                    ParticipantSchema.from_orm(
+                        participant, context=context
+                    ).model_dump_json()
+                    for participant in result.participants
+                )
+            else:
+                result = import_users(chunk, first_row_number=FIRST_ROW_NUMBER + start)
+                items.extend(
+                    UserSchema.from_orm(user).model_dump_json() for user in result.users
+                )
+
+            job.rows_done = start + len(chunk)
+            job.created += result.created
+            job.duplicates += result.duplicates
+            job.errors.extend(result.errors)
+            if not save_running_import_job(
+                job, ["rows_done", "created", "duplicates", "errors"]
+            ):
+                return
+
+        job.result = BulkCreateResponseSchema.for_import(
+            instance_name=job.kind.lower(),
+            created=job.created,
+            duplicates=job.duplicates,
+            errors=job.errors,
+            items=items,
+        ).dict()
+        job.status = ImportJob.Statuses.DONE
+    except Exception as e:
+        job.errors.append("Import stopped, error {}".format(e.__str__()))
+        job.status = ImportJob.Statuses.FAILED
+
+    job.rows = []
+    job.date_finished = timezone.now()
+    save_running_import_job(
+        job,
+        [
+            "status",
+            "rows",
+            "rows_done",
+            "created",
+            "duplicates",
+            "errors",
+            "result",
+            "date_finished",
+        ],
+    )
+
+
+def save_running_import_job(job: ImportJob, update_fields: List[str]) -> bool:
+    """
+    Save fields of a job and its heartbeat, unless the job is no longer running, e.g. it was failed as stale.
+    :return: If the job was saved
+    """
+
+    job.date_heartbeat = timezone.now()
+    return (
+        ImportJob.objects.filter(id=job.id, status=ImportJob.Statuses.RUNNING).update(
+            date_heartbeat=job.date_heartbeat,
+            **{field: getattr(job, field) for field in update_fields},
+        )
+        == 1
+    )
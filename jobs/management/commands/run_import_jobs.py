@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs.job_service import claim_next_import_job, run_import_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued import jobs, keeps polling for new jobs unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once there are no queued jobs left.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=2.0,
+            help="Seconds to wait before polling again when no job is queued.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # like the request cycle does, drop broken connections and the ones older than CONN_MAX_AGE
+            close_old_connections()
+            job = claim_next_import_job()
+
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["sleep"])
+                continue
+
+            self.stdout.write("Running {}".format(job))
+            run_import_job(job)
+            self.stdout.write("Finished {}".format(job))
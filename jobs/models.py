@@ -0,0 +1,66 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+from jobs.querysets import ImportJobQuerySet
+from tridu_server import settings
+
+
+class ImportJob(models.Model):
+    """
+    A bulk import request waiting for, or processed by, a background worker (manage.py run_import_jobs).
+    Keeps the import rows, the progress and the final BulkCreateResponseSchema so clients can poll it.
+    """
+
+    class Kinds(models.TextChoices):
+        """
+        Choices for the kind field
+        """
+
+        PARTICIPANTS = "Participants"
+        USERS = "Users"
+
+    class Statuses(models.TextChoices):
+        """
+        Choices for the status field
+        """
+
+        QUEUED = "Queued"
+        RUNNING = "Running"
+        DONE = "Done"
+        FAILED = "Failed"
+
+    objects = ImportJobQuerySet.as_manager()
+
+    kind = models.CharField(max_length=25, choices=Kinds)
+    status = models.CharField(
+        max_length=25, choices=Statuses, default=Statuses.QUEUED, db_index=True
+    )
+
+    rows = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_done = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    duplicates = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list)
+    result = models.JSONField(
+        null=True, blank=True, help_text="The BulkCreateResponseSchema once done."
+    )
+
+    created_by = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="import_jobs",
+        null=True,
+        blank=True,
+    )
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(null=True, blank=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+    date_heartbeat = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the worker last saved progress, running jobs without a recent heartbeat are failed.",
+    )
+
+    def __str__(self):
+        return "{} Import Job {} ({})".format(self.kind, self.id, self.status)
@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import datetime
+
+from django.db.models import Q, QuerySet
+
+
+class ImportJobQuerySet(QuerySet):
+
+    def queued(self) -> ImportJobQuerySet:
+        return self.filter(status=self.model.Statuses.QUEUED)
+
+    def running(self) -> ImportJobQuerySet:
+        return self.filter(status=self.model.Statuses.RUNNING)
+
+    def stale(self, last_heartbeat: datetime.datetime) -> ImportJobQuerySet:
+        """
+        Running jobs whose worker has not saved progress since last_heartbeat, the worker is assumed to be dead.
+        """
+        return self.running().filter(
+            Q(date_heartbeat__lt=last_heartbeat)
+            | Q(date_heartbeat__isnull=True, date_started__lt=last_heartbeat)
+        )
+
+    def oldest_first(self) -> ImportJobQuerySet:
+        return self.order_by("date_created", "id")
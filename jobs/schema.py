@@ -0,0 +1,21 @@
+from ninja import ModelSchema
+
+from jobs.models import ImportJob
+
+
+class ImportJobSchema(ModelSchema):
+    class Meta:
+        model = ImportJob
+        fields = (
+            "id",
+            "kind",
+            "status",
+            "rows_total",
+            "rows_done",
+            "created",
+            "duplicates",
+            "errors",
+            "date_created",
+            "date_started",
+            "date_finished",
+        )
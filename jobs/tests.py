@@ -0,0 +1,105 @@
+import datetime
+import io
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from jobs.job_service import (
+    IMPORT_JOB_HEARTBEAT_TIMEOUT,
+    claim_next_import_job,
+    queue_import_job,
+    run_import_job,
+)
+from jobs.models import ImportJob
+
+USER_ROWS = [
+    {
+        "first_name": "First{}".format(index),
+        "last_name": "Last",
+        "email": "first{}@example.com".format(index),
+        "date_of_birth": datetime.date(2000, 1, index + 1),
+        "gender": "M",
+        "phone_number": "1",
+    }
+    for index in range(3)
+]
+
+
+class ClaimNextImportJobTestCase(TestCase):
+
+    def test_claims_oldest_queued_job(self):
+        first = queue_import_job(ImportJob.Kinds.USERS, USER_ROWS)
+        queue_import_job(ImportJob.Kinds.USERS, USER_ROWS)
+
+        job = claim_next_import_job()
+
+        self.assertEqual(job.id, first.id)
+        self.assertEqual(job.status, ImportJob.Statuses.RUNNING)
+        self.assertIsNotNone(job.date_heartbeat)
+
+    def test_fails_stale_running_jobs(self):
+        stale = queue_import_job(ImportJob.Kinds.USERS, USER_ROWS)
+        alive = queue_import_job(ImportJob.Kinds.USERS, USER_ROWS)
+        claim_next_import_job()
+        claim_next_import_job()
+        ImportJob.objects.filter(id=stale.id).update(
+            date_heartbeat=timezone.now() - IMPORT_JOB_HEARTBEAT_TIMEOUT * 2
+        )
+
+        self.assertIsNone(claim_next_import_job())
+
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(stale.status, ImportJob.Statuses.FAILED)
+        self.assertEqual(stale.rows, [])
+        self.assertIsNotNone(stale.date_finished)
+        self.assertEqual(
+            stale.errors, ["Import stopped, the worker stopped responding"]
+        )
+        self.assertEqual(alive.status, ImportJob.Statuses.RUNNING)
+
+
+class RunImportJobTestCase(TestCase):
+
+    def test_run(self):
+        queue_import_job(ImportJob.Kinds.USERS, USER_ROWS)
+        job = claim_next_import_job()
+
+        run_import_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Statuses.DONE)
+        self.assertEqual(job.rows_done, 3)
+        self.assertEqual(job.created, 3)
+        self.assertEqual(job.rows, [])
+
+    def test_failed_job_is_not_overwritten(self):
+        queue_import_job(ImportJob.Kinds.USERS, USER_ROWS)
+        job = claim_next_import_job()
+        # another worker failed the job as stale while this one was still running
+        ImportJob.objects.filter(id=job.id).update(status=ImportJob.Statuses.FAILED)
+
+        run_import_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.Statuses.FAILED)
+        self.assertEqual(job.rows_done, 0)
+
+
+class RunImportJobsCommandTestCase(TestCase):
+
+    def test_closes_old_connections_before_each_job(self):
+        queue_import_job(ImportJob.Kinds.USERS, USER_ROWS)
+        queue_import_job(ImportJob.Kinds.USERS, USER_ROWS)
+
+        # closing the connection would end the test transaction
+        with mock.patch(
+            "jobs.management.commands.run_import_jobs.close_old_connections"
+        ) as close_old_connections:
+            call_command("run_import_jobs", "--once", stdout=io.StringIO())
+
+        # two jobs, then the poll that finds none
+        self.assertEqual(close_old_connections.call_count, 3)
+        self.assertFalse(ImportJob.objects.queued().exists())
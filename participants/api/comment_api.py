@@ -5,6 +5,7 @@ from ninja.pagination import paginate
 
 from participants.models import ParticipantComment, RelayTeamComment
 from participants.schema.particiapnt import ParticipantCommentSchema
+from tridu_server.pagination import CursorPagination
 from tridu_server.schemas import ErrorObjectSchema
 
 participant_comment_router = Router()
@@ -15,7 +16,7 @@ participant_comment_router = Router()
     tags=["comment", "participant"],
     response={200: List[ParticipantCommentSchema]},
 )
-@paginate
+@paginate(CursorPagination)
 def get_all_participant_comments(request):
     return ParticipantComment.objects.all()
 
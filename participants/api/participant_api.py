@@ -1,14 +1,30 @@
-import datetime
 from typing import List
 
 from django.core.exceptions import ValidationError
-from ninja import Router
-
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from ninja import File, Router
+from ninja.files import UploadedFile
+
+from checkins.checkin_service import (
+    get_check_in,
+    get_owner_missing_prerequisite,
+    get_request_check_in_graph,
+    upsert_check_in,
+)
 from checkins.models import CheckIn
-from heats.models import Heat
+from checkins.schema import CheckInStateSchema
+from heats.models import Heat, HeatRoster
+from jobs.job_service import queue_import_job
+from jobs.models import ImportJob
+from jobs.schema import ImportJobSchema
 from locations.models import Location
 from participants.api.comment_api import participant_comment_router
 from participants.models import Participant, ParticipantComment, ParticipantCheckIn
+from participants.participant_service import (
+    import_participants,
+    import_participants_csv,
+)
 from participants.schema.particiapnt import (
     ParticipantSchema,
     ParticipantCommentSchema,
@@ -18,7 +34,11 @@ from participants.schema.particiapnt import (
 )
 from race.models import RaceType
 from race.schema import RaceTypeSchema
-from tridu_server.schemas import BulkCreateResponseSchema, ErrorObjectSchema
+from tridu_server.schemas import (
+    BulkCreateResponseSchema,
+    BulkImportChunkSchema,
+    ErrorObjectSchema,
+)
 
 router = Router()
 
@@ -29,83 +49,56 @@ router.add_router("/comments", participant_comment_router)
 def create_participant_bulk(
     request, participantSchemas: List[CreateParticipantBulkSchema]
 ):
-    created = 0
-    duplicates = 0
-    errors = []
-    items = []
-    count = 2  # excel starts at 2
-
-    for participantSchema in participantSchemas:
-        data = participantSchema.dict()
-
-        origin = None
-        if "city" in data and "country" in data and "province" in data:
-            # get origin of Participant
-            city = data.pop("city")
-            country = data.pop("country")
-            province = data.pop("province")
-            if province and country and city:
-                origin, isNewOrigin = Location.objects.get_or_create(
-                    city=city, country=country, province=province
-                )
+    result = import_participants(
+        [participantSchema.dict() for participantSchema in participantSchemas]
+    )
+
+    return 201, BulkCreateResponseSchema.for_import(
+        instance_name="participants",
+        created=result.created,
+        duplicates=result.duplicates,
+        errors=result.errors,
+        items=[
+            ParticipantSchema.from_orm(participant).model_dump_json()
+            for participant in result.participants
+        ],
+    )
 
-        try:
-            swim_time_values = data.get("swim_time", "").strip().split(":")
-            if len(swim_time_values) != 2:
-                raise ValidationError("Invalid swim_time, not in formation MM:SS")
-            minutes = swim_time_values[0]
-            seconds = swim_time_values[1]
-            if not minutes.isnumeric() or not seconds.isnumeric():
-                raise ValidationError("Invalid swim_time, not in formation MM:SS")
-            swim_time = datetime.timedelta(seconds=int(seconds), minutes=int(minutes))
-
-            try:
-                participant = Participant.objects.get(
-                    bib_number=data["bib_number"],
-                    race_id=data["race"],
-                    race_type_id=data["race_type"],
-                    user_id=data["user"],
-                )
-                participant.swim_time = swim_time
-                participant.location = data.get("location", "")
-                participant.team = data.get("team", "")
-                participant.origin_id = origin.id if origin is not None else None
-                participant.save()
-                duplicates += 1
-            except Participant.DoesNotExist:
-                participant = Participant.objects.create(
-                    origin_id=origin.id if origin is not None else None,
-                    bib_number=data["bib_number"],
-                    is_ftt=data["is_ftt"],
-                    team=data.get("team", ""),
-                    swim_time=swim_time,
-                    race_id=data["race"],
-                    race_type_id=data["race_type"],
-                    user_id=data["user"],
-                    location=data.get("location", ""),
-                )
-                created += 1
-            items.append(ParticipantSchema.from_orm(participant).model_dump_json())
-        except Exception as e:
-            errors.append("For row {}, error {}".format(count, e.__str__()))
-
-        count = count + 1
-
-    return 201, {
-        "created": created,
-        "duplicates": duplicates,
-        "errors": errors,
-        "items": items,
-        "message": (
-            "{} participants created, {} were already found, no errors encountered.".format(
-                created, duplicates
-            )
-            if len(errors) == 0
-            else "{} participants created, {} were already found but {} errors encountered!".format(
-                created, duplicates, len(errors)
-            )
-        ),
-    }
+
+@router.post("/import/jobs", tags=["import"], response={201: ImportJobSchema})
+def create_participant_bulk_job(
+    request, participantSchemas: List[CreateParticipantBulkSchema]
+):
+    """Queues the import for a background worker, poll the job for its progress and result."""
+    return 201, queue_import_job(
+        kind=ImportJob.Kinds.PARTICIPANTS,
+        rows=[participantSchema.dict() for participantSchema in participantSchemas],
+        created_by=request.user,
+    )
+
+
+@router.post("/import/csv", tags=["import"])
+def create_participant_bulk_csv(request, file: UploadedFile = File(...)):
+    """
+    Imports a CSV file with a header row, the columns of CreateParticipantBulkSchema by their field aliases:
+    bib_number, is_ftt, race_id, race_type_id and user_id, and optionally team, location, city, province, country
+    and swim_time in the MM:SS format. The header has race_id, race_type_id and user_id where the items of the JSON
+    import have race, race_type and user.
+    Rows are validated and saved in chunks, the response streams one BulkImportChunkSchema per chunk as NDJSON. Each
+    chunk is saved on its own, a bad row is reported in the errors of its chunk and does not undo the other chunks.
+    """
+
+    def chunk_results():
+        for rows_done, result in import_participants_csv(file.file):
+            yield BulkImportChunkSchema(
+                rows_done=rows_done,
+                created=result.created,
+                duplicates=result.duplicates,
+                errors=result.errors,
+                items=[participant.id for participant in result.participants],
+            ).model_dump_json() + "\n"
+
+    return StreamingHttpResponse(chunk_results(), content_type="application/x-ndjson")
 
 
 @router.get(
@@ -115,7 +108,7 @@ def recently_edited_participants(request, count: int = 5):
     """Returns the most recently edited participants."""
     return (
         200,
-        Participant.objects.select_all_related()
+        Participant.objects.prefetch_all_related()
         .order_by_most_recently_edited()
         .all()[:count],
     )
@@ -290,58 +283,98 @@ def checkin_participant(
 ):
     """By default, it will flip the value, but if value is in URL, set that value."""
 
+    graph = get_request_check_in_graph(request)
     try:
-        participant = Participant.objects.select_all_related().get(id=participant_id)
-    except Participant.DoesNotExist:
+        checkin = get_check_in(checkin_id, graph)
+    except CheckIn.DoesNotExist:
         return 404, ErrorObjectSchema.from_404_error(
-            "Participant with id {} does not exist".format(participant_id)
+            "CheckIn with id {} does not exist".format(checkin_id)
         )
 
+    with transaction.atomic():
+        # the lock keeps the prerequisites from changing until the upsert is committed
+        try:
+            participant = (
+                Participant.objects.select_for_update()
+                .only("id", "heat_id")
+                .get(id=participant_id)
+            )
+        except Participant.DoesNotExist:
+            return 404, ErrorObjectSchema.from_404_error(
+                "Participant with id {} does not exist".format(participant_id)
+            )
+
+        missing_checkin = get_owner_missing_prerequisite(
+            ParticipantCheckIn, "participant", participant.id, checkin_id, graph
+        )
+        if missing_checkin is not None:
+            return 409, ErrorObjectSchema.for_validation_error(
+                "Can not check in participant to {} as they have not checked in at {}".format(
+                    checkin.name, missing_checkin.name
+                ),
+                "Participant",
+            )
+
+        upsert_check_in(
+            ParticipantCheckIn, "participant", participant.id, checkin_id, value
+        )
+
+    HeatRoster.objects.mark_stale([participant.heat_id])
+    # loaded after the upsert, so the response has the new check in state
+    return 200, Participant.objects.prefetch_all_related().get(id=participant.id)
+
+
+@router.patch(
+    "/{participant_id}/checkins/{checkin_id}/state",
+    tags=["participant", "checkins"],
+    response={200: CheckInStateSchema, 404: ErrorObjectSchema, 409: ErrorObjectSchema},
+)
+def set_participant_checkin_state(
+    request, participant_id: int, checkin_id: int, value: bool = None
+):
+    """
+    The same check in as checkin_participant, it flips the value unless value is in the URL.
+    Responds with only the check in state, written with a single upsert.
+    """
+
+    graph = get_request_check_in_graph(request)
     try:
-        checkin = CheckIn.objects.select_related(
-            "depends_on", "depends_on__depends_on", "depends_on__depends_on__depends_on"
-        ).get(id=checkin_id)
+        checkin = get_check_in(checkin_id, graph)
     except CheckIn.DoesNotExist:
         return 404, ErrorObjectSchema.from_404_error(
             "CheckIn with id {} does not exist".format(checkin_id)
         )
 
-    if checkin.depends_on is not None:
-        not_ready = False
-        participant_dependent = None
+    with transaction.atomic():
+        # the lock keeps the prerequisites from changing until the upsert is committed
         try:
-            participant_dependent = participant.checkins.get(
-                check_in__id=checkin.depends_on.id
+            participant = (
+                Participant.objects.select_for_update()
+                .only("id", "heat_id")
+                .get(id=participant_id)
+            )
+        except Participant.DoesNotExist:
+            return 404, ErrorObjectSchema.from_404_error(
+                "Participant with id {} does not exist".format(participant_id)
             )
-        except ParticipantCheckIn.DoesNotExist:
-            not_ready = True
 
-        if not_ready or not participant_dependent.is_checked_in:
+        missing_checkin = get_owner_missing_prerequisite(
+            ParticipantCheckIn, "participant", participant.id, checkin_id, graph
+        )
+        if missing_checkin is not None:
             return 409, ErrorObjectSchema.for_validation_error(
                 "Can not check in participant to {} as they have not checked in at {}".format(
-                    checkin.name, checkin.depends_on.name
+                    checkin.name, missing_checkin.name
                 ),
                 "Participant",
             )
 
-    try:
-        participant_checkin = participant.checkins.get(check_in__id=checkin_id)
-    except ParticipantCheckIn.DoesNotExist:
-        participant.checkins.create(
-            check_in_id=checkin_id,
-            is_checked_in=True,
+        participant_checkin = upsert_check_in(
+            ParticipantCheckIn, "participant", participant.id, checkin_id, value
         )
-        participant.refresh_from_db()
-        return 200, participant
-
-    if value:
-        participant_checkin.is_checked_in = value
-    else:
-        participant_checkin.is_checked_in = not participant_checkin.is_checked_in
 
-    participant_checkin.save()
-    participant.refresh_from_db()
-    return 200, participant
+    HeatRoster.objects.mark_stale([participant.heat_id])
+    return 200, participant_checkin
 
 
 @router.get(
@@ -389,7 +422,7 @@ def create_participant_comment(
 )
 def get_participant(request, participant_id: int):
     try:
-        return 200, Participant.objects.select_all_related().get(id=participant_id)
+        return 200, Participant.objects.prefetch_all_related().get(id=participant_id)
     except Participant.DoesNotExist:
         return 404, ErrorObjectSchema.from_404_error(
             "Participant with id {} does not exist".format(participant_id)
@@ -1,10 +1,18 @@
 from typing import List
 
 from django.core.exceptions import ValidationError
+from django.db import transaction
 from ninja import Router
 
 from accounts.models import User
+from checkins.checkin_service import (
+    get_check_in,
+    get_owner_missing_prerequisite,
+    get_request_check_in_graph,
+    upsert_check_in,
+)
 from checkins.models import CheckIn
+from checkins.schema import CheckInStateSchema
 from heats.models import Heat
 from locations.models import Location
 from participants.api.comment_api import relay_team_comment_router
@@ -234,56 +242,87 @@ def checkin_relay_team(
 ):
     """By default, it will flip the value, but if value is in URL, set that value."""
 
+    graph = get_request_check_in_graph(request)
     try:
-        relay_team = RelayTeam.objects.get(id=relay_team_id)
-    except RelayTeam.DoesNotExist:
+        checkin = get_check_in(checkin_id, graph)
+    except CheckIn.DoesNotExist:
         return 404, ErrorObjectSchema.from_404_error(
-            "Relay Team with id {} does not exist".format(relay_team_id)
+            "CheckIn with id {} does not exist".format(checkin_id)
+        )
+
+    with transaction.atomic():
+        # the lock keeps the prerequisites from changing until the upsert is committed
+        try:
+            relay_team = RelayTeam.objects.select_for_update().get(id=relay_team_id)
+        except RelayTeam.DoesNotExist:
+            return 404, ErrorObjectSchema.from_404_error(
+                "Relay Team with id {} does not exist".format(relay_team_id)
+            )
+
+        missing_checkin = get_owner_missing_prerequisite(
+            RelayTeamCheckIn, "team", relay_team.id, checkin_id, graph
         )
+        if missing_checkin is not None:
+            return 409, ErrorObjectSchema.for_validation_error(
+                "Can not check in Relay Team to {} as they have not checked in at {}".format(
+                    checkin.name, missing_checkin.name
+                ),
+                "Relay Team",
+            )
 
+        upsert_check_in(RelayTeamCheckIn, "team", relay_team.id, checkin_id, value)
+
+    return 200, relay_team
+
+
+@router.patch(
+    "/{relay_team_id}/checkins/{checkin_id}/state",
+    tags=["relay team", "checkins"],
+    response={200: CheckInStateSchema, 404: ErrorObjectSchema, 409: ErrorObjectSchema},
+)
+def set_relay_team_checkin_state(
+    request, relay_team_id: int, checkin_id: int, value: bool = None
+):
+    """
+    The same check in as checkin_relay_team, it flips the value unless value is in the URL.
+    Responds with only the check in state, written with a single upsert.
+    """
+
+    graph = get_request_check_in_graph(request)
     try:
-        checkin = CheckIn.objects.get(id=checkin_id)
+        checkin = get_check_in(checkin_id, graph)
     except CheckIn.DoesNotExist:
         return 404, ErrorObjectSchema.from_404_error(
             "CheckIn with id {} does not exist".format(checkin_id)
         )
 
-    if checkin.depends_on is not None:
-        not_ready = False
-        relay_dependant = None
+    with transaction.atomic():
+        # the lock keeps the prerequisites from changing until the upsert is committed
         try:
-            relay_dependant = relay_team.checkins.get(
-                check_in__id=checkin.depends_on.id
+            relay_team = (
+                RelayTeam.objects.select_for_update().only("id").get(id=relay_team_id)
+            )
+        except RelayTeam.DoesNotExist:
+            return 404, ErrorObjectSchema.from_404_error(
+                "Relay Team with id {} does not exist".format(relay_team_id)
             )
-        except RelayTeamCheckIn.DoesNotExist:
-            not_ready = True
 
-        if not_ready or not relay_dependant.is_checked_in:
+        missing_checkin = get_owner_missing_prerequisite(
+            RelayTeamCheckIn, "team", relay_team.id, checkin_id, graph
+        )
+        if missing_checkin is not None:
             return 409, ErrorObjectSchema.for_validation_error(
                 "Can not check in Relay Team to {} as they have not checked in at {}".format(
-                    checkin.name, checkin.depends_on.name
+                    checkin.name, missing_checkin.name
                 ),
                 "Relay Team",
             )
 
-    try:
-        relay_team_checkin = relay_team.checkins.get(check_in__id=checkin_id)
-    except RelayTeamCheckIn.DoesNotExist:
-        relay_team.checkins.create(
-            check_in_id=checkin_id,
-            is_checked_in=True,
-        )
-        relay_team.refresh_from_db()
-        return 200, relay_team
-
-    if value:
-        relay_team_checkin.is_checked_in = value
-    else:
-        relay_team_checkin.is_checked_in = not relay_team_checkin.is_checked_in
-
-    relay_team_checkin.save()
-    relay_team.refresh_from_db()
-    return 200, relay_team
+        relay_team_checkin = upsert_check_in(
+            RelayTeamCheckIn, "team", relay_team.id, checkin_id, value
+        )
+
+    return 200, relay_team_checkin
 
 
 @router.post(
@@ -0,0 +1,73 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from participants.models import Participant, Participation
+from tridu_server.testing import create_race
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the bib number search of the check in search box, the previous regex filter against the indexed "
+        "prefix ranges, on a synthetic race created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bibs", type=int, default=5000, help="Participants of the race."
+        )
+        parser.add_argument(
+            "--searches",
+            type=int,
+            default=200,
+            help="Searches for each method, with random prefixes of one to four digits.",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        generator = random.Random(options["seed"])
+        prefixes = [
+            generator.randint(1, 10 ** generator.randint(1, 4) - 1)
+            for _ in range(options["searches"])
+        ]
+
+        with transaction.atomic():
+            race = create_race(participant_count=options["bibs"], heat_count=10)
+            participants = Participant.objects.for_race_id(race.id)
+            participations = Participation.objects.for_race_id(race.id)
+
+            searches = {
+                "participant regex": lambda prefix: participants.filter(
+                    bib_number__regex=r"{}".format(prefix)
+                ).order_by("bib_number"),
+                "participant prefix": lambda prefix: participants.with_bib_number_prefix(
+                    prefix
+                ).order_by(
+                    "bib_number"
+                ),
+                "participation regex": lambda prefix: participations.filter(
+                    bib_number__regex=r"{}".format(prefix)
+                ).order_by_bib_number(),
+                "participation prefix": lambda prefix: participations.with_bib_number_prefix(
+                    prefix
+                ).order_by_bib_number(),
+            }
+
+            self.stdout.write(
+                "{:<22} {:>10} {:>10}".format("search", "mean ms", "max ms")
+            )
+            for name, search in searches.items():
+                durations = []
+                for prefix in prefixes:
+                    start = time.perf_counter()
+                    list(search(prefix).values_list("id", flat=True))
+                    durations.append((time.perf_counter() - start) * 1000)
+                self.stdout.write(
+                    "{:<22} {:>10.2f} {:>10.2f}".format(
+                        name, sum(durations) / len(durations), max(durations)
+                    )
+                )
+
+            transaction.set_rollback(True)
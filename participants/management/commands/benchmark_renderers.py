@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from ninja.renderers import JSONRenderer
+
+from heats.heat_service import auto_schedule_heats
+from participants.models import Participant
+from participants.schema.particiapnt import ParticipantSchema
+from tridu_server.renderers import MsgPackRenderer, ORJSONRenderer
+from tridu_server.testing import create_race
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the encode time and payload size of the default ninja JSON renderer, the orjson renderer and the "
+        "msgpack renderer on the participants of a synthetic race, created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--participants",
+            type=int,
+            default=2000,
+            help="Participants of the race.",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=10, help="Renders of each renderer."
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            race = create_race(
+                participant_count=options["participants"],
+                heat_count=40,
+                race_type_count=2,
+            )
+            auto_schedule_heats(race.id)
+            # the data a renderer gets, as the /races/{race_id}/participants items are validated by ninja
+            context = {}
+            data = [
+                ParticipantSchema.from_orm(participant, context=context).model_dump()
+                for participant in Participant.objects.for_race_id(
+                    race.id
+                ).prefetch_all_related()
+            ]
+            transaction.set_rollback(True)
+
+        request = RequestFactory().get("/")
+        self.stdout.write("{:<10} {:>10} {:>12}".format("renderer", "ms", "bytes"))
+        for name, renderer in (
+            ("ninja", JSONRenderer()),
+            ("orjson", ORJSONRenderer()),
+            ("msgpack", MsgPackRenderer()),
+        ):
+            start = time.perf_counter()
+            for _ in range(options["repeat"]):
+                content = renderer.render(request, data, response_status=200)
+            elapsed = (time.perf_counter() - start) / options["repeat"]
+            self.stdout.write(
+                "{:<10} {:>10.1f} {:>12}".format(name, elapsed * 1000, len(content))
+            )
@@ -0,0 +1,147 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_participations(apps, schema_editor):
+    """Index every existing Participant and RelayParticipant."""
+    Participant = apps.get_model("participants", "Participant")
+    RelayParticipant = apps.get_model("participants", "RelayParticipant")
+    Participation = apps.get_model("participants", "Participation")
+
+    Participation.objects.bulk_create(
+        [
+            Participation(
+                kind="participant",
+                participant_id=participant.id,
+                race_id=participant.race_id,
+                user_id=participant.user_id,
+                bib_number=participant.bib_number,
+                is_active=participant.is_active,
+            )
+            for participant in Participant.objects.all().iterator()
+        ],
+        batch_size=500,
+    )
+    Participation.objects.bulk_create(
+        [
+            Participation(
+                kind="relay_participant",
+                relay_participant_id=relay_participant.id,
+                race_id=relay_participant.team.race_id,
+                user_id=relay_participant.user_id,
+                bib_number=relay_participant.team.bib_number,
+                is_active=relay_participant.is_active,
+            )
+            for relay_participant in RelayParticipant.objects.select_related(
+                "team"
+            ).iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "participants",
+            "0017_rename_ischeckedin_participantcheckin_is_checked_in_and_more",
+        ),
+        ("race", "0005_racetype_checkins"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="Participation",
+        ),
+        migrations.CreateModel(
+            name="Participation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("participant", "Participant"),
+                            ("relay_participant", "Relay Participant"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("bib_number", models.IntegerField()),
+                ("is_active", models.BooleanField(default=True)),
+                (
+                    "participant",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="participation",
+                        to="participants.participant",
+                    ),
+                ),
+                (
+                    "race",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="participations",
+                        to="race.race",
+                    ),
+                ),
+                (
+                    "relay_participant",
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="participation",
+                        to="participants.relayparticipant",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="participations",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["race", "bib_number"], name="participation_race_bib_idx"
+                    )
+                ],
+                "constraints": [
+                    models.CheckConstraint(
+                        check=models.Q(
+                            models.Q(
+                                ("kind", "participant"),
+                                ("relay_participant__isnull", True),
+                            ),
+                            models.Q(
+                                ("kind", "relay_participant"),
+                                ("participant__isnull", True),
+                            ),
+                            _connector="OR",
+                        ),
+                        name="participation_kind_matches_participant",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(create_participations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("participants", "0018_participation_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="participant",
+            index=models.Index(
+                fields=["race", "bib_number"], name="participant_race_bib_idx"
+            ),
+        ),
+    ]
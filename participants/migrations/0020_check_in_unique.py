@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-18 13:41
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def delete_duplicate_check_ins(apps, schema_editor):
+    """Keep the last created row of each participant and relay team check in, the constraints allow only one."""
+    for model_name, owner_field in (
+        ("ParticipantCheckIn", "participant"),
+        ("RelayTeamCheckIn", "team"),
+    ):
+        model = apps.get_model("participants", model_name)
+        latest_ids = (
+            model.objects.values(owner_field, "check_in")
+            .annotate(latest_id=Max("id"))
+            .values("latest_id")
+        )
+        model.objects.exclude(id__in=latest_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("checkins", "0001_initial"),
+        ("participants", "0019_participant_race_bib_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_check_ins, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="participantcheckin",
+            constraint=models.UniqueConstraint(
+                fields=("participant", "check_in"), name="unique_participant_check_in"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="relayteamcheckin",
+            constraint=models.UniqueConstraint(
+                fields=("team", "check_in"), name="unique_relay_team_check_in"
+            ),
+        ),
+    ]
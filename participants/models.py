@@ -1,10 +1,11 @@
 from django.db import models
-from django.db.models import Q
+from django.db.models import DEFERRED, Q
 
 from checkins.models import CheckInUserBase
 from comments.models import Comment
 from participants.querysets import (
     ParticipantQuerySet,
+    ParticipationQuerySet,
     RelayParticipantQuerySet,
     RelayTeamQuerySet,
 )
@@ -17,9 +18,72 @@ class Participation(models.Model):
     The connection model between a Participant or RelayTeam to the Heat, Race, and RaceType models.
     Allows us to keep all race bib numbers in one model, able to search on one model by bib number, and run heat
     actions on one model, especially useful for swim time related actions like auto scheduler.
+
+    It is a denormalized index with one row per Participant and per RelayParticipant, relay participants use their
+    team's bib number. Rows are kept in sync by the save methods of Participant, RelayParticipant and RelayTeam, any
+    bulk write of these fields must sync them with the ParticipationQuerySet sync methods.
     """
 
-    pass
+    class Kinds(models.TextChoices):
+        """
+        Choices for the kind field, the same values as ParticipationSchema.ParticipationTypes
+        """
+
+        PARTICIPANT = "participant"
+        RELAY_PARTICIPANT = "relay_participant"
+
+    objects = ParticipationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["race", "bib_number"], name="participation_race_bib_idx"
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(kind="participant", relay_participant__isnull=True)
+                | Q(kind="relay_participant", participant__isnull=True),
+                name="participation_kind_matches_participant",
+            ),
+        ]
+
+    kind = models.CharField(max_length=20, choices=Kinds)
+    participant = models.OneToOneField(
+        to="Participant",
+        on_delete=models.CASCADE,
+        related_name="participation",
+        null=True,
+        blank=True,
+    )
+    relay_participant = models.OneToOneField(
+        to="RelayParticipant",
+        on_delete=models.CASCADE,
+        related_name="participation",
+        null=True,
+        blank=True,
+    )
+
+    race = models.ForeignKey(
+        to="race.Race", on_delete=models.CASCADE, related_name="participations"
+    )
+    user = models.ForeignKey(
+        to=settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="participations",
+    )
+    bib_number = models.IntegerField()
+    is_active = models.BooleanField(default=True)
+
+    @property
+    def participation_id(self) -> int:
+        """The id of the Participant or RelayParticipant."""
+        if self.kind == Participation.Kinds.PARTICIPANT:
+            return self.participant_id
+        return self.relay_participant_id
+
+    def __str__(self):
+        return "{} {}".format(self.kind, self.bib_number)
 
 
 class BaseParticipant(ActiveModel):
@@ -74,6 +138,11 @@ class Participant(BaseParticipant):
                 violation_error_message="Another active participant is already using this bib number.",
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=["race", "bib_number"], name="participant_race_bib_idx"
+            ),
+        ]
 
     heat = models.ForeignKey(
         to="heats.Heat",
@@ -98,9 +167,29 @@ class Participant(BaseParticipant):
     )
     swim_time = models.DurationField(null=True, blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        participant = super().from_db(db, field_names, values)
+        # the heat it is saved in, so a save knows the heat roster it leaves without a query, see heats.signals
+        participant.saved_heat_id = participant.__dict__.get("heat_id", DEFERRED)
+        return participant
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.saved_heat_id = self.heat_id
+        Participation.objects.sync_participants([self])
+
 
 class ParticipantCheckIn(CheckInUserBase):
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["participant", "check_in"],
+                name="unique_participant_check_in",
+            ),
+        ]
+
     participant = models.ForeignKey(
         to=Participant, on_delete=models.CASCADE, related_name="checkins"
     )
@@ -126,6 +215,10 @@ class RelayParticipant(BaseParticipant):
         to="RelayTeam", on_delete=models.PROTECT, related_name="participants"
     )
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Participation.objects.sync_relay_participants([self])
+
 
 class RelayTeam(ActiveModel):
     """
@@ -168,9 +261,29 @@ class RelayTeam(ActiveModel):
     bib_number = models.IntegerField(db_index=True)
     name = models.CharField(max_length=255, verbose_name="Relay Team Name")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        relay_team = super().from_db(db, field_names, values)
+        # the heat it is saved in, so a save knows the heat roster it leaves without a query, see heats.signals
+        relay_team.saved_heat_id = relay_team.__dict__.get("heat_id", DEFERRED)
+        return relay_team
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.saved_heat_id = self.heat_id
+        Participation.objects.sync_relay_team(self)
+
 
 class RelayTeamCheckIn(CheckInUserBase):
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["team", "check_in"],
+                name="unique_relay_team_check_in",
+            ),
+        ]
+
     team = models.ForeignKey(
         to=RelayTeam, on_delete=models.CASCADE, related_name="checkins"
     )
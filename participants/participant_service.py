@@ -0,0 +1,493 @@
+import csv
+import datetime
+import io
+import itertools
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import IO, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+import pydantic
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import User
+from locations.models import Location
+from heats.models import Heat, HeatRoster
+from participants.models import Participant, Participation
+from participants.schema.particiapnt import (
+    CreateParticipantBulkSchema,
+    DownloadInfoParticipantSchema,
+)
+from race.models import Race, RaceType
+
+BULK_BATCH_SIZE = 500
+CSV_IMPORT_CHUNK_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+
+# flattened DownloadInfoParticipantSchema keys, in export column order
+EXPORT_CSV_COLUMNS = [
+    "bib_number",
+    "user.first_name",
+    "user.last_name",
+    "user.email",
+    "user.date_of_birth",
+    "user.gender",
+    "team",
+    "location",
+    "origin.city",
+    "origin.province",
+    "origin.country",
+    "race_type.name",
+    "swim_time",
+    "heat.name",
+    "heat.start_time",
+    "heat.color",
+    "heat.pool",
+    "heat.ideal_capacity",
+    "heat.participant_count",
+    "heat.avg_swim_time",
+]
+
+# excel rows start at 2, after the header row
+FIRST_ROW_NUMBER = 2
+
+LocationKey = Tuple[str, str, str]
+ParticipantKey = Tuple[int, int, int, int]
+
+
+class ExportFormats(Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+@dataclass
+class ParticipantImportResult:
+    """The outcome of a participant import, errors are already formatted with their row number."""
+
+    created: int = 0
+    duplicates: int = 0
+    errors: List[str] = field(default_factory=list)
+    participants: List[Participant] = field(default_factory=list)
+
+
+def import_participants(
+    rows: Sequence[dict],
+    first_row_number: int = FIRST_ROW_NUMBER,
+    row_numbers: Sequence[int] | None = None,
+) -> ParticipantImportResult:
+    """
+    Create or update participants from import rows (CreateParticipantBulkSchema dicts).
+    A row matching an existing participant by bib number, race, race type and user updates its swim time, team,
+    location and origin, any other row creates a new participant.
+
+    All rows are parsed and validated first, then every Location and existing Participant is resolved with one
+    query each and the changes are written with bulk_update and bulk_create in batches. A row that can not be
+    saved does not stop the import, its error is reported with its row number.
+    :param rows: The import rows, in file order
+    :param first_row_number: Row number of the first row, used in error messages
+    :param row_numbers: Row number of each row, defaults to consecutive numbers from first_row_number
+    :return: The counts, errors and saved participants of the import
+    """
+
+    result = ParticipantImportResult()
+    row_errors: List[Tuple[int, str]] = []
+
+    if row_numbers is None:
+        row_numbers = range(first_row_number, first_row_number + len(rows))
+
+    parsed_rows = []
+    for row_number, data in zip(row_numbers, rows):
+        try:
+            swim_time = parse_swim_time(data.get("swim_time"))
+        except ValidationError as e:
+            row_errors.append((row_number, e.__str__()))
+            continue
+        parsed_rows.append((row_number, data, swim_time))
+
+    origin_ids = get_or_create_location_ids(
+        {
+            location_key
+            for _, data, _ in parsed_rows
+            if (location_key := get_location_key(data)) is not None
+        }
+    )
+
+    to_update, to_create = match_import_rows(
+        parsed_rows, origin_ids, result, row_errors
+    )
+    save_imported_participants(to_update, to_create, result, row_errors)
+
+    row_numbers = {
+        participant.pk: row_number
+        for row_number, participant in to_update + to_create
+        if participant.pk is not None
+    }
+    result.participants = sorted(
+        Participant.objects.filter(id__in=row_numbers.keys())
+        .select_all_related()
+        .prefetch_related("checkins__check_in", "race_type__checkins"),
+        key=lambda saved_participant: row_numbers[saved_participant.id],
+    )
+    result.errors = [
+        "For row {}, error {}".format(row_number, error)
+        for row_number, error in sorted(row_errors, key=lambda row_error: row_error[0])
+    ]
+    return result
+
+
+def import_participants_csv(
+    csv_file: IO[bytes], chunk_size: int = CSV_IMPORT_CHUNK_SIZE
+) -> Iterator[Tuple[int, ParticipantImportResult]]:
+    """
+    Import participants from a CSV file with CreateParticipantBulkSchema columns, one chunk at a time.
+    Rows are read lazily, each chunk is validated and saved with import_participants before the next chunk is
+    read, so memory use does not grow with the file size.
+    :param csv_file: The binary CSV file, with a header row
+    :param chunk_size: Number of rows per chunk
+    :return: A generator of (rows read so far, chunk result) tuples
+    """
+
+    reader = csv.DictReader(
+        io.TextIOWrapper(csv_file, encoding="utf-8-sig", newline="")
+    )
+    rows_done = 0
+
+    while True:
+        chunk = list(itertools.islice(reader, chunk_size))
+        if len(chunk) == 0:
+            return
+
+        rows = []
+        row_numbers = []
+        schema_errors = []
+        for row_number, row in enumerate(chunk, start=FIRST_ROW_NUMBER + rows_done):
+            try:
+                rows.append(
+                    CreateParticipantBulkSchema.model_validate(
+                        {
+                            key: value
+                            for key, value in row.items()
+                            if key is not None and value is not None
+                        }
+                    ).dict()
+                )
+                row_numbers.append(row_number)
+            except pydantic.ValidationError as e:
+                schema_errors.append(
+                    "For row {}, error {}".format(
+                        row_number,
+                        ", ".join(
+                            "{} {}".format(
+                                ".".join(str(location) for location in error["loc"]),
+                                error["msg"],
+                            )
+                            for error in e.errors()
+                        ),
+                    )
+                )
+
+        result = import_participants(rows, row_numbers=row_numbers)
+        result.errors = schema_errors + result.errors
+        rows_done += len(chunk)
+        yield rows_done, result
+
+
+def export_participants(
+    race_id: int, active: bool = False, export_format: ExportFormats = ExportFormats.CSV
+) -> Iterator[str]:
+    """
+    Export a race's participants as DownloadInfoParticipantSchema rows, one line at a time.
+    The heats are loaded once with their participant stats and participants are read with a server side cursor,
+    in chunks, so memory use does not grow with the race size and the first line is sent right away.
+    :param race_id: The race to export
+    :param active: Only export active participants
+    :param export_format: CSV with EXPORT_CSV_COLUMNS and a header line, or one JSON object per line
+    :return: A generator of lines
+    """
+
+    heats = {
+        heat.id: heat
+        for heat in Heat.objects.for_race(race_id)
+        .select_related("race_type")
+        .with_participant_stats()
+    }
+
+    participants = (
+        Participant.objects.for_race_id(race_id=race_id)
+        .select_related("origin", "race_type", "user")
+        .order_by("heat__start_datetime__hour", "heat__start_datetime__minute")
+    )
+    if active:
+        participants = participants.active()
+
+    if export_format == ExportFormats.CSV:
+        writer = csv.writer(EchoWriter())
+        yield writer.writerow(EXPORT_CSV_COLUMNS)
+
+    for participant in participants.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        participant.heat = heats.get(participant.heat_id)
+        schema = DownloadInfoParticipantSchema.from_orm(participant)
+
+        if export_format == ExportFormats.CSV:
+            row = flatten_dict(schema.dict())
+            yield writer.writerow(
+                [
+                    "" if row.get(column) is None else row[column]
+                    for column in EXPORT_CSV_COLUMNS
+                ]
+            )
+        else:
+            yield schema.model_dump_json() + "\n"
+
+
+class EchoWriter:
+    """A file-like object for csv.writer, writerow returns the line instead of buffering it."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def flatten_dict(data: dict, prefix: str = "") -> dict:
+    """Flatten nested dicts, a nested key is its path joined by dots."""
+
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten_dict(value, prefix + key + "."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def match_import_rows(
+    parsed_rows: Sequence[Tuple[int, dict, datetime.timedelta]],
+    origin_ids: Dict[LocationKey, int],
+    result: ParticipantImportResult,
+    row_errors: List[Tuple[int, str]],
+) -> Tuple[List[Tuple[int, Participant]], List[Tuple[int, Participant]]]:
+    """
+    Match parsed import rows to existing participants, in memory, without saving.
+    Existing participants are loaded with one query, rows that would break a participant constraint or reference a
+    missing race, race type or user are added to row_errors.
+    :return: The (row number, participant) pairs to update and to create
+    """
+
+    race_ids = {data["race"] for _, data, _ in parsed_rows}
+    user_ids = {data["user"] for _, data, _ in parsed_rows}
+    bib_numbers = {data["bib_number"] for _, data, _ in parsed_rows}
+    existing_ids = {
+        "race": set(Race.objects.filter(id__in=race_ids).values_list("id", flat=True)),
+        "race_type": set(
+            RaceType.objects.filter(
+                id__in={data["race_type"] for _, data, _ in parsed_rows}
+            ).values_list("id", flat=True)
+        ),
+        "user": set(User.objects.filter(id__in=user_ids).values_list("id", flat=True)),
+    }
+
+    participants_by_key: Dict[ParticipantKey, Participant] = {}
+    registered_users: Set[Tuple[int, int]] = set()
+    active_bib_numbers: Set[Tuple[int, int]] = set()
+    for participant in Participant.objects.filter(race_id__in=race_ids).filter(
+        Q(user_id__in=user_ids) | Q(bib_number__in=bib_numbers, is_active=True)
+    ):
+        participants_by_key[get_participant_key(participant)] = participant
+        registered_users.add((participant.user_id, participant.race_id))
+        if participant.is_active:
+            active_bib_numbers.add((participant.bib_number, participant.race_id))
+
+    to_update: Dict[int, Tuple[int, Participant]] = {}
+    to_create: List[Tuple[int, Participant]] = []
+    now = timezone.now()
+
+    for row_number, data, swim_time in parsed_rows:
+        origin_id = origin_ids.get(get_location_key(data))
+        key = (data["bib_number"], data["race"], data["race_type"], data["user"])
+
+        missing_reference = next(
+            (
+                reference
+                for reference in ("race", "race_type", "user")
+                if data[reference] not in existing_ids[reference]
+            ),
+            None,
+        )
+        if missing_reference is not None:
+            row_errors.append(
+                (
+                    row_number,
+                    "{} with id {} does not exist".format(
+                        missing_reference.replace("_", " ").title(),
+                        data[missing_reference],
+                    ),
+                )
+            )
+            continue
+
+        participant = participants_by_key.get(key)
+        if participant is not None:
+            participant.swim_time = swim_time
+            participant.location = data.get("location", "")
+            participant.team = data.get("team", "")
+            participant.origin_id = origin_id
+            participant.date_changed = now
+            if participant.pk is not None:
+                to_update[participant.pk] = (row_number, participant)
+            result.duplicates += 1
+            continue
+
+        if (data["user"], data["race"]) in registered_users:
+            row_errors.append(
+                (row_number, "This user is already registered for this race!")
+            )
+            continue
+        if (data["bib_number"], data["race"]) in active_bib_numbers:
+            row_errors.append(
+                (
+                    row_number,
+                    "Another active participant is already using this bib number.",
+                )
+            )
+            continue
+
+        participant = Participant(
+            origin_id=origin_id,
+            bib_number=data["bib_number"],
+            is_ftt=data["is_ftt"],
+            team=data.get("team", ""),
+            swim_time=swim_time,
+            race_id=data["race"],
+            race_type_id=data["race_type"],
+            user_id=data["user"],
+            location=data.get("location", ""),
+        )
+        participants_by_key[key] = participant
+        registered_users.add((data["user"], data["race"]))
+        active_bib_numbers.add((data["bib_number"], data["race"]))
+        to_create.append((row_number, participant))
+
+    return list(to_update.values()), to_create
+
+
+def save_imported_participants(
+    to_update: Sequence[Tuple[int, Participant]],
+    to_create: Sequence[Tuple[int, Participant]],
+    result: ParticipantImportResult,
+    row_errors: List[Tuple[int, str]],
+) -> None:
+    """
+    Write matched import rows with bulk_update and bulk_create in batches, in one transaction.
+    If a batch can not be created, for example a bib number was taken since the rows were matched, that batch is
+    saved row by row so only the bad rows are reported in row_errors.
+    :return: None
+    """
+
+    with transaction.atomic():
+        Participant.objects.bulk_update(
+            [participant for _, participant in to_update],
+            ["swim_time", "location", "team", "origin", "date_changed"],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        HeatRoster.objects.mark_stale(
+            participant.heat_id for _, participant in to_update
+        )
+
+        for start in range(0, len(to_create), BULK_BATCH_SIZE):
+            batch = to_create[start : start + BULK_BATCH_SIZE]
+            try:
+                with transaction.atomic():
+                    Participant.objects.bulk_create(
+                        [participant for _, participant in batch]
+                    )
+                    # bulk_create skips Participant.save, index the new participants here
+                    Participation.objects.sync_participants(
+                        [participant for _, participant in batch]
+                    )
+                result.created += len(batch)
+            except IntegrityError:
+                for row_number, participant in batch:
+                    participant.pk = None
+                    try:
+                        with transaction.atomic():
+                            participant.save()
+                        result.created += 1
+                    except IntegrityError as e:
+                        participant.pk = None
+                        row_errors.append((row_number, e.__str__()))
+
+
+def parse_swim_time(value: str | None) -> datetime.timedelta:
+    """
+    Parse an import swim time in the MM:SS format.
+    :raises ValidationError: If the value is not in the MM:SS format
+    """
+
+    swim_time_values = (value or "").strip().split(":")
+    if len(swim_time_values) != 2:
+        raise ValidationError("Invalid swim_time, not in formation MM:SS")
+    minutes = swim_time_values[0]
+    seconds = swim_time_values[1]
+    if not minutes.isnumeric() or not seconds.isnumeric():
+        raise ValidationError("Invalid swim_time, not in formation MM:SS")
+    return datetime.timedelta(seconds=int(seconds), minutes=int(minutes))
+
+
+def get_location_key(data: dict) -> LocationKey | None:
+    city = data.get("city")
+    province = data.get("province")
+    country = data.get("country")
+    if city and province and country:
+        return city, province, country
+    return None
+
+
+def get_participant_key(participant: Participant) -> ParticipantKey:
+    return (
+        participant.bib_number,
+        participant.race_id,
+        participant.race_type_id,
+        participant.user_id,
+    )
+
+
+def get_or_create_location_ids(
+    location_keys: Iterable[LocationKey],
+) -> Dict[LocationKey, int]:
+    """
+    Get the ids of many locations, creating the missing ones, with one query to read and one to create.
+    :param location_keys: (city, province, country) tuples
+    :return: (city, province, country) to Location id
+    """
+
+    location_keys = set(location_keys)
+    if len(location_keys) == 0:
+        return {}
+
+    def find_location_ids() -> Dict[LocationKey, int]:
+        return {
+            (location.city, location.province, location.country): location.id
+            for location in Location.objects.filter(
+                city__in={city for city, _, _ in location_keys},
+                province__in={province for _, province, _ in location_keys},
+                country__in={country for _, _, country in location_keys},
+            )
+            if (location.city, location.province, location.country) in location_keys
+        }
+
+    location_ids = find_location_ids()
+    missing_keys = location_keys - location_ids.keys()
+    if len(missing_keys) > 0:
+        Location.objects.bulk_create(
+            [
+                Location(city=city, province=province, country=country)
+                for city, province, country in missing_keys
+            ],
+            batch_size=BULK_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        location_ids = find_location_ids()
+
+    return location_ids
@@ -1,9 +1,37 @@
 from __future__ import annotations
 
 import datetime
-from typing import List
+from typing import Iterable, List
 
-from django.db.models import QuerySet, Count, Q
+from django.db.models import QuerySet, Count, Prefetch, Q
+
+# largest value of an IntegerField, bib numbers never have more digits
+MAX_BIB_NUMBER = 2147483647
+
+
+def get_bib_number_prefix_filter(prefix: int, field: str = "bib_number") -> Q:
+    """
+    Match the bib numbers that start with the digits of prefix, as ranges on the integer column.
+    A prefix of 12 matches 12, 120 to 129, 1200 to 1299 and so on, each range can use an index on the column.
+    :param prefix: The first digits of the bib number
+    :param field: The bib number field to filter on
+    :return: A filter for the bib numbers with that prefix
+    """
+
+    if prefix <= 0:
+        return Q(**{field: prefix})
+
+    bib_number_filter = Q()
+    scale = 1
+    while prefix * scale <= MAX_BIB_NUMBER:
+        bib_number_filter |= Q(
+            **{
+                "{}__gte".format(field): prefix * scale,
+                "{}__lte".format(field): (prefix + 1) * scale - 1,
+            }
+        )
+        scale *= 10
+    return bib_number_filter
 
 
 class BaseParticipantQuerySet(QuerySet):
@@ -35,6 +63,9 @@ class ParticipantQuerySet(BaseParticipantQuerySet):
     def for_race_type_id(self, race_type_id) -> ParticipantQuerySet:
         return self.filter(race_type_id=race_type_id)
 
+    def with_bib_number_prefix(self, prefix: int) -> ParticipantQuerySet:
+        return self.filter(get_bib_number_prefix_filter(prefix))
+
     def in_heat(self, heat_id: int) -> ParticipantQuerySet:
         return self.filter(heat_id=heat_id)
 
@@ -74,6 +105,50 @@ class ParticipantQuerySet(BaseParticipantQuerySet):
             "heat__race",
         )
 
+    def prefetch_heat_with_stats(self) -> ParticipantQuerySet:
+        """
+        Prefetch the heats, with their race, race type and race type check ins, annotated by
+        HeatQuerySet.with_participant_stats. Use it instead of select_related on the heat, which would not have the
+        annotations.
+        """
+        return self.prefetch_related(get_heat_with_stats_prefetch(self.model))
+
+    def prefetch_checkins(self) -> ParticipantQuerySet:
+        """
+        Prefetch the participant check ins and the check ins of the participant race type. Their depends_on chains
+        are read from the CheckIn graph by CheckInSchema. The heat race type check ins come with
+        prefetch_heat_with_stats.
+        """
+        return self.prefetch_related("checkins__check_in", "race_type__checkins")
+
+    def prefetch_all_related(self) -> ParticipantQuerySet:
+        """
+        Load everything ParticipantSchema shows with a fixed number of queries, whatever the number of participants.
+        """
+        return (
+            self.select_related("origin", "race", "race_type", "user")
+            .prefetch_heat_with_stats()
+            .prefetch_checkins()
+        )
+
+    def only_compact_fields(self) -> ParticipantQuerySet:
+        """
+        Join the user and heat and load only the columns of CompactParticipantSchema.
+        """
+        return self.select_related("user", "heat").only(
+            "id",
+            "bib_number",
+            "is_active",
+            "race_type",
+            "user__id",
+            "user__first_name",
+            "user__last_name",
+            "heat__id",
+            "heat__termination",
+            "heat__start_datetime",
+            "heat__color",
+        )
+
 
 class RelayParticipantQuerySet(BaseParticipantQuerySet):
 
@@ -97,6 +172,9 @@ class RelayTeamQuerySet(QuerySet):
     def for_race_id(self, race_id: int) -> RelayTeamQuerySet:
         return self.filter(race_id=race_id)
 
+    def for_race_type_id(self, race_type_id: int) -> RelayTeamQuerySet:
+        return self.filter(race_type_id=race_type_id)
+
     def for_heat(self, heat_id: int) -> RelayTeamQuerySet:
         return self.filter(heat_id=heat_id)
 
@@ -113,3 +191,95 @@ class RelayTeamQuerySet(QuerySet):
 
     def select_all_related(self) -> ParticipantQuerySet:
         return self.select_related("race", "race_type", "heat")
+
+    def prefetch_heat_with_stats(self) -> RelayTeamQuerySet:
+        """
+        Prefetch the heats, with their race, race type and race type check ins, annotated by
+        HeatQuerySet.with_participant_stats. Use it instead of select_related on the heat, which would not have the
+        annotations.
+        """
+        return self.prefetch_related(get_heat_with_stats_prefetch(self.model))
+
+
+def get_heat_with_stats_prefetch(model) -> Prefetch:
+    # the Heat model is reached through the heat field, heats.models imports this module's models
+    heats = model._meta.get_field("heat").related_model.objects
+    return Prefetch(
+        "heat",
+        queryset=heats.select_related("race", "race_type")
+        .with_participant_stats()
+        .prefetch_race_type_checkins(),
+    )
+
+
+class ParticipationQuerySet(QuerySet):
+
+    def for_race_id(self, race_id: int) -> ParticipationQuerySet:
+        return self.filter(race_id=race_id)
+
+    def of_user(self, user_id: int) -> ParticipationQuerySet:
+        return self.filter(user_id=user_id)
+
+    def active(self) -> ParticipationQuerySet:
+        return self.filter(is_active=True)
+
+    def with_bib_number_prefix(self, prefix: int) -> ParticipationQuerySet:
+        return self.filter(get_bib_number_prefix_filter(prefix))
+
+    def order_by_bib_number(self) -> ParticipationQuerySet:
+        return self.order_by("bib_number", "id")
+
+    def sync_participants(self, participants: Iterable) -> None:
+        """
+        Create or update the Participation rows of participants with one upsert.
+        :param participants: Saved Participant instances
+        :return: None
+        """
+        self.bulk_create(
+            [
+                self.model(
+                    kind=self.model.Kinds.PARTICIPANT,
+                    participant_id=participant.id,
+                    race_id=participant.race_id,
+                    user_id=participant.user_id,
+                    bib_number=participant.bib_number,
+                    is_active=participant.is_active,
+                )
+                for participant in participants
+            ],
+            update_conflicts=True,
+            unique_fields=["participant"],
+            update_fields=["race", "user", "bib_number", "is_active"],
+        )
+
+    def sync_relay_participants(self, relay_participants: Iterable) -> None:
+        """
+        Create or update the Participation rows of relay participants with one upsert.
+        :param relay_participants: Saved RelayParticipant instances, their team is used for the race and bib number
+        :return: None
+        """
+        self.bulk_create(
+            [
+                self.model(
+                    kind=self.model.Kinds.RELAY_PARTICIPANT,
+                    relay_participant_id=relay_participant.id,
+                    race_id=relay_participant.team.race_id,
+                    user_id=relay_participant.user_id,
+                    bib_number=relay_participant.team.bib_number,
+                    is_active=relay_participant.is_active,
+                )
+                for relay_participant in relay_participants
+            ],
+            update_conflicts=True,
+            unique_fields=["relay_participant"],
+            update_fields=["race", "user", "bib_number", "is_active"],
+        )
+
+    def sync_relay_team(self, relay_team) -> int:
+        """
+        Update the race and bib number of the Participation rows of a relay team's participants.
+        :return: Number of rows updated
+        """
+        return self.filter(relay_participant__team_id=relay_team.id).update(
+            race_id=relay_team.race_id, bib_number=relay_team.bib_number
+        )
@@ -4,9 +4,9 @@ from typing import List
 
 from ninja import Field, ModelSchema, Schema
 
-from accounts.schema import UserSchema, DownloadUserSchema
+from accounts.schema import UserSchema, CompactUserSchema, DownloadUserSchema
 from checkins.schema import CheckInUserBaseSchema
-from heats.schema import HeatSchema, DownloadHeatSchema
+from heats.schema import HeatSchema, CompactHeatSchema, DownloadHeatSchema
 from locations.schema import LocationSchema, DownloadLocationSchema
 from participants.models import (
     Participant,
@@ -34,7 +34,7 @@ class ParticipationSchema(Schema):
     id: int
     race: RaceSchema
     type: ParticipationTypes
-    user: UserSchema
+    user: UserSchema | None = None
     bib_number: int
     swim_time: datetime.timedelta | None = None
 
@@ -63,6 +63,25 @@ class ParticipantSchema(ModelSchema):
         fields_optional = ("team", "swim_time", "location")
 
 
+class CompactParticipantSchema(ModelSchema):
+    """
+    The participant fields volunteers need in lists, without the race, race type and check ins of ParticipantSchema.
+    Load the participants with ParticipantQuerySet.only_compact_fields.
+    """
+
+    user: CompactUserSchema
+    heat: CompactHeatSchema | None = None
+
+    class Meta:
+        model = Participant
+        fields = (
+            "id",
+            "bib_number",
+            "is_active",
+            "race_type",
+        )
+
+
 class DownloadInfoParticipantSchema(ModelSchema):
     origin: DownloadLocationSchema | None = None
     race_type: DownloadRaceTypeSchema
@@ -0,0 +1,549 @@
+import datetime
+import functools
+import importlib
+import json
+import random
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from checkins.models import CheckIn
+from participants.api import participant_api
+from participants.api.comment_api import get_all_participant_comments
+from participants.models import (
+    Participant,
+    ParticipantCheckIn,
+    ParticipantComment,
+    Participation,
+    RelayParticipant,
+    RelayTeam,
+)
+from participants.participant_service import (
+    ParticipantImportResult,
+    import_participants,
+    import_participants_csv,
+    save_imported_participants,
+)
+from tridu_server.pagination import CursorPagination
+from tridu_server.testing import authorization_headers, create_race
+
+participation_index_migration = importlib.import_module(
+    "participants.migrations.0018_participation_index"
+)
+
+
+class BibNumberPrefixTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.race = create_race(participant_count=300, heat_count=3)
+        bib_numbers = random.Random(1).sample(range(0, 20000), 300)
+        # moved out of the way first, the bib numbers are unique within the race
+        Participant.objects.for_race_id(cls.race.id).update(
+            bib_number=F("bib_number") + 100000
+        )
+        participants = list(Participant.objects.for_race_id(cls.race.id).order_by("id"))
+        for participant, bib_number in zip(participants, bib_numbers):
+            participant.bib_number = bib_number
+        Participant.objects.bulk_update(participants, ["bib_number"])
+        Participation.objects.sync_participants(participants)
+        cls.bib_numbers = bib_numbers
+
+    def test_prefix(self):
+        for prefix in (0, 1, 7, 12, 123, 1999, 19999):
+            expected = sorted(
+                bib_number
+                for bib_number in self.bib_numbers
+                if str(bib_number).startswith(str(prefix))
+                and (prefix != 0 or bib_number == 0)
+            )
+
+            self.assertEqual(
+                list(
+                    Participant.objects.for_race_id(self.race.id)
+                    .with_bib_number_prefix(prefix)
+                    .order_by("bib_number")
+                    .values_list("bib_number", flat=True)
+                ),
+                expected,
+                prefix,
+            )
+            self.assertEqual(
+                list(
+                    Participation.objects.for_race_id(self.race.id)
+                    .with_bib_number_prefix(prefix)
+                    .order_by_bib_number()
+                    .values_list("bib_number", flat=True)
+                ),
+                expected,
+                prefix,
+            )
+
+
+def get_all_pages(view, limit: int, **params) -> list:
+    """:return: The items of every page of a CursorPagination view, following the cursors"""
+
+    items = []
+    cursor = None
+    while True:
+        page = view(
+            None,
+            ninja_pagination=CursorPagination.Input(cursor=cursor, limit=limit),
+            **params,
+        )
+        items += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+class ParticipantCommentPaginationTestCase(TestCase):
+
+    def test_comments_within_a_millisecond(self):
+        race = create_race(participant_count=1, heat_count=1)
+        participant = Participant.objects.for_race_id(race.id).get()
+        comments = ParticipantComment.objects.bulk_create(
+            [
+                ParticipantComment(
+                    participant=participant, writer=participant.user, comment=str(index)
+                )
+                for index in range(6)
+            ]
+        )
+        creation_date = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        for index, comment in enumerate(comments):
+            comment.creation_date = creation_date + datetime.timedelta(
+                microseconds=index * 100
+            )
+        ParticipantComment.objects.bulk_update(comments, ["creation_date"])
+
+        self.assertEqual(
+            [
+                comment.comment
+                for comment in get_all_pages(get_all_participant_comments, 2)
+            ],
+            ["5", "4", "3", "2", "1", "0"],
+        )
+
+
+class CheckInResponseTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="staff")
+        cls.race = create_race(participant_count=1, heat_count=1, relay_team_count=1)
+        cls.check_in = CheckIn.objects.create(
+            name="Packet pickup", positive_action="In", negative_action="Out"
+        )
+
+    def patch_check_in(self, path: str, value: bool = None) -> dict:
+        response = self.client.patch(
+            path if value is None else "{}?value={}".format(path, value),
+            headers=authorization_headers(self.user),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            checkin["check_in"]["id"]: checkin["is_checked_in"]
+            for checkin in response.json()["checkins"]
+        }
+
+    def test_participant(self):
+        participant = Participant.objects.for_race_id(self.race.id).get()
+        path = "/api/participants/{}/checkins/{}".format(
+            participant.id, self.check_in.id
+        )
+
+        self.assertEqual(self.patch_check_in(path), {self.check_in.id: True})
+        self.assertEqual(self.patch_check_in(path), {self.check_in.id: False})
+        self.assertEqual(self.patch_check_in(path, True), {self.check_in.id: True})
+        self.assertTrue(
+            ParticipantCheckIn.objects.get(participant=participant).is_checked_in
+        )
+
+    def test_missing_owner(self):
+        swim = CheckIn.objects.create(
+            name="Swim",
+            positive_action="In",
+            negative_action="Out",
+            depends_on=self.check_in,
+        )
+
+        # not a 409 for the prerequisite they could not have
+        for path in (
+            "/api/participants/0/checkins/{}",
+            "/api/participants/0/checkins/{}/state",
+            "/api/relay_teams/0/checkins/{}",
+            "/api/relay_teams/0/checkins/{}/state",
+        ):
+            response = self.client.patch(
+                path.format(swim.id), headers=authorization_headers(self.user)
+            )
+            self.assertEqual(response.status_code, 404, path)
+
+    def test_prerequisite_is_read_in_the_write_transaction(self):
+        participant = Participant.objects.for_race_id(self.race.id).get()
+        swim = CheckIn.objects.create(
+            name="Swim",
+            positive_action="In",
+            negative_action="Out",
+            depends_on=self.check_in,
+        )
+        ParticipantCheckIn.objects.create(
+            participant=participant, check_in=self.check_in, is_checked_in=True
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                "/api/participants/{}/checkins/{}/state".format(
+                    participant.id, swim.id
+                ),
+                headers=authorization_headers(self.user),
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["is_checked_in"])
+
+        queries = [query["sql"] for query in context.captured_queries]
+        savepoint = next(
+            position
+            for position, sql in enumerate(queries)
+            if sql.startswith("SAVEPOINT")
+        )
+        release = next(
+            position
+            for position, sql in enumerate(queries)
+            if sql.startswith("RELEASE SAVEPOINT")
+        )
+        prerequisite = next(
+            position
+            for position, sql in enumerate(queries)
+            if sql.startswith('SELECT "participants_participantcheckin"."check_in_id"')
+        )
+        upsert = next(
+            position
+            for position, sql in enumerate(queries)
+            if sql.startswith('INSERT INTO "participants_participantcheckin"')
+        )
+        self.assertLess(savepoint, prerequisite)
+        self.assertLess(prerequisite, upsert)
+        self.assertLess(upsert, release)
+
+    def test_relay_team(self):
+        relay_team = RelayTeam.objects.for_race_id(self.race.id).get()
+        path = "/api/relay_teams/{}/checkins/{}".format(relay_team.id, self.check_in.id)
+
+        self.assertEqual(self.patch_check_in(path), {self.check_in.id: True})
+        self.assertEqual(self.patch_check_in(path), {self.check_in.id: False})
+        self.assertEqual(self.patch_check_in(path, True), {self.check_in.id: True})
+
+
+class ImportParticipantsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.race = create_race(participant_count=3, heat_count=1)
+        cls.existing = Participant.objects.for_race_id(cls.race.id).order_by("id")[0]
+        cls.users = User.objects.bulk_create(
+            [User(username="importer{}".format(index)) for index in range(3)]
+        )
+
+    def get_row(self, user: User, bib_number: int, **data) -> dict:
+        return {
+            "bib_number": bib_number,
+            "race": self.race.id,
+            "race_type": self.existing.race_type_id,
+            "user": user.id,
+            "is_ftt": False,
+            "swim_time": "05:00",
+            **data,
+        }
+
+    def assertParticipationSynced(self, participant: Participant) -> None:
+        participation = Participation.objects.get(participant=participant)
+        self.assertEqual(participation.kind, Participation.Kinds.PARTICIPANT)
+        self.assertEqual(
+            (participation.race_id, participation.user_id, participation.bib_number),
+            (participant.race_id, participant.user_id, participant.bib_number),
+        )
+
+    def test_rows_are_created_and_matched(self):
+        result = import_participants(
+            [
+                self.get_row(self.users[0], 100),
+                self.get_row(
+                    self.existing.user,
+                    self.existing.bib_number,
+                    swim_time="09:30",
+                    team="Sharks",
+                ),
+            ]
+        )
+
+        self.assertEqual((result.created, result.duplicates), (1, 1))
+        self.assertEqual(result.errors, [])
+        self.assertEqual(
+            [participant.user_id for participant in result.participants],
+            [self.users[0].id, self.existing.user_id],
+        )
+        self.existing.refresh_from_db()
+        self.assertEqual(
+            self.existing.swim_time, datetime.timedelta(minutes=9, seconds=30)
+        )
+        self.assertEqual(self.existing.team, "Sharks")
+        self.assertParticipationSynced(result.participants[0])
+
+    def test_duplicates_within_a_batch(self):
+        result = import_participants(
+            [
+                self.get_row(self.users[0], 100, swim_time="05:00"),
+                self.get_row(self.users[0], 100, swim_time="06:00"),
+            ]
+        )
+
+        self.assertEqual((result.created, result.duplicates), (1, 1))
+        participant = Participant.objects.get(user=self.users[0])
+        # the last row wins, like a match of an existing participant
+        self.assertEqual(participant.swim_time, datetime.timedelta(minutes=6))
+        self.assertParticipationSynced(participant)
+
+    def test_row_errors(self):
+        result = import_participants(
+            [
+                self.get_row(self.users[0], 100),
+                self.get_row(self.users[1], 101, swim_time="5 minutes"),
+                self.get_row(self.users[1], self.existing.bib_number),
+                {**self.get_row(self.users[2], 102), "user": 0},
+                self.get_row(self.users[2], 102),
+            ]
+        )
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual(
+            result.errors,
+            [
+                "For row 3, error ['Invalid swim_time, not in formation MM:SS']",
+                "For row 4, error Another active participant is already using this bib number.",
+                "For row 5, error User with id 0 does not exist",
+            ],
+        )
+
+    def test_failed_batch_is_saved_row_by_row(self):
+        result = ParticipantImportResult()
+        row_errors = []
+        to_create = [
+            (
+                row_number,
+                Participant(
+                    race=self.race,
+                    race_type_id=self.existing.race_type_id,
+                    user=user,
+                    bib_number=bib_number,
+                ),
+            )
+            for row_number, user, bib_number in (
+                (2, self.users[0], 100),
+                # taken since the rows were matched
+                (3, self.users[1], self.existing.bib_number),
+                (4, self.users[2], 102),
+            )
+        ]
+
+        save_imported_participants([], to_create, result, row_errors)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual([row_number for row_number, _ in row_errors], [3])
+        self.assertIsNone(to_create[1][1].pk)
+        for _, participant in (to_create[0], to_create[2]):
+            self.assertParticipationSynced(participant)
+        self.assertFalse(Participant.objects.filter(user=self.users[1]).exists())
+
+
+class ParticipationSyncTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="staff")
+        cls.race = create_race(participant_count=3, heat_count=1, relay_team_count=2)
+        cls.participant = Participant.objects.for_race_id(cls.race.id).order_by("id")[0]
+        cls.relay_team = RelayTeam.objects.for_race_id(cls.race.id).order_by("id")[0]
+
+    def get_participations(self, **params) -> list:
+        response = self.client.get(
+            "/api/races/{}/participations".format(self.race.id),
+            {"limit": -1, **params},
+            headers=authorization_headers(self.user),
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (participation["type"], participation["id"], participation["bib_number"])
+            for participation in response.json()
+        ]
+
+    def test_relay_team_bib_number_change(self):
+        self.relay_team.bib_number = 500
+        self.relay_team.save()
+
+        self.assertEqual(
+            list(
+                Participation.objects.filter(
+                    relay_participant__team=self.relay_team
+                ).values_list("bib_number", flat=True)
+            ),
+            [500],
+        )
+
+    def test_deactivation(self):
+        self.participant.deactivate()
+        self.participant.save()
+
+        self.assertFalse(
+            Participation.objects.get(participant=self.participant).is_active
+        )
+        self.assertNotIn(
+            self.participant.id,
+            [
+                participation_id
+                for kind, participation_id, _ in self.get_participations(active=True)
+                if kind == Participation.Kinds.PARTICIPANT
+            ],
+        )
+
+    def test_deleted_participant(self):
+        participant_id = self.participant.id
+        self.participant.delete()
+
+        self.assertFalse(
+            Participation.objects.filter(participant_id=participant_id).exists()
+        )
+
+    def test_race_participations(self):
+        # a relay team before the participants, to check the ordering is by bib number and not by kind
+        self.relay_team.bib_number = 0
+        self.relay_team.save()
+
+        expected = sorted(
+            [
+                (
+                    Participation.Kinds.PARTICIPANT,
+                    participant.id,
+                    participant.bib_number,
+                )
+                for participant in Participant.objects.for_race_id(self.race.id)
+            ]
+            + [
+                (
+                    Participation.Kinds.RELAY_PARTICIPANT,
+                    relay_participant.id,
+                    relay_participant.team.bib_number,
+                )
+                for relay_participant in RelayParticipant.objects.filter(
+                    team__race=self.race
+                ).select_related("team")
+            ],
+            key=lambda participation: participation[2],
+        )
+        self.assertEqual(expected[0][0], Participation.Kinds.RELAY_PARTICIPANT)
+        self.assertEqual(self.get_participations(), expected)
+
+    def test_index_migration_backfill(self):
+        """The 0018 migration creates the same rows as the save methods."""
+
+        synced = set(
+            Participation.objects.values_list(
+                "kind",
+                "participant_id",
+                "relay_participant_id",
+                "race_id",
+                "user_id",
+                "bib_number",
+                "is_active",
+            )
+        )
+        Participation.objects.all().delete()
+
+        participation_index_migration.create_participations(django_apps, None)
+
+        self.assertEqual(
+            set(
+                Participation.objects.values_list(
+                    "kind",
+                    "participant_id",
+                    "relay_participant_id",
+                    "race_id",
+                    "user_id",
+                    "bib_number",
+                    "is_active",
+                )
+            ),
+            synced,
+        )
+
+
+class ImportParticipantsCsvTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="staff")
+        cls.race = create_race(participant_count=1, heat_count=1)
+        cls.race_type_id = (
+            Participant.objects.for_race_id(cls.race.id).get().race_type_id
+        )
+        cls.users = User.objects.bulk_create(
+            [User(username="importer{}".format(index)) for index in range(5)]
+        )
+
+    def test_chunks(self):
+        rows = [
+            "bib_number,is_ftt,race_id,race_type_id,user_id,swim_time",
+        ] + [
+            "{},false,{},{},{},{}".format(
+                100 + index,
+                self.race.id,
+                self.race_type_id,
+                user.id,
+                # a bad row in the second chunk
+                "5 minutes" if index == 2 else "05:00",
+            )
+            for index, user in enumerate(self.users)
+        ]
+        csv_file = SimpleUploadedFile(
+            "participants.csv", "\n".join(rows).encode(), content_type="text/csv"
+        )
+
+        with mock.patch.object(
+            participant_api,
+            "import_participants_csv",
+            functools.partial(import_participants_csv, chunk_size=2),
+        ):
+            response = self.client.post(
+                "/api/participants/import/csv",
+                {"file": csv_file},
+                headers=authorization_headers(self.user),
+            )
+            # chunks are imported while the response streams
+            content = b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        chunks = [json.loads(line) for line in content.decode().splitlines()]
+
+        self.assertEqual(
+            [
+                (chunk["rows_done"], chunk["created"], len(chunk["errors"]))
+                for chunk in chunks
+            ],
+            [(2, 2, 0), (4, 1, 1), (5, 1, 0)],
+        )
+        self.assertTrue(chunks[1]["errors"][0].startswith("For row 4, error"))
+        self.assertEqual(
+            sorted(
+                Participant.objects.filter(user__in=self.users).values_list(
+                    "bib_number", flat=True
+                )
+            ),
+            [100, 101, 103, 104],
+        )
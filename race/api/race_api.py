@@ -1,20 +1,35 @@
 from typing import List
 
 from django.db.models import Min, Max, Count, Q
+from django.http import StreamingHttpResponse
 from ninja import Router
 from ninja.pagination import paginate
 
+from checkins.checkin_service import (
+    check_in_batch,
+    get_check_in,
+    get_request_check_in_graph,
+)
+from checkins.models import CheckIn
+from checkins.schema import BatchCheckInResultSchema, BatchCheckInSchema
 from heats.heat_service import (
     check_auto_schedule_is_ready,
     auto_schedule_heats,
+    preview_auto_schedule_heats,
+    apply_heat_schedule_plan,
+    reschedule_participants,
     AutoSchedulerException,
+    AutoScheduleModes,
 )
-from heats.models import Heat
-from heats.schema import HeatSchema
-from participants.models import Participant, RelayParticipant, RelayTeam
+from heats.models import Heat, HeatRoster, HeatSchedulePlan
+from heats.roster_service import build_race_heat_rosters
+from heats.schema import HeatSchema, HeatSchedulePlanSchema
+from participants.models import Participant, Participation, RelayTeam
+from participants.participant_service import ExportFormats, export_participants
 from participants.schema.particiapnt import (
     ParticipantSchema,
     ParticipationSchema,
+    CompactParticipantSchema,
     MassPatchParticipantSchema,
     DownloadInfoParticipantSchema,
 )
@@ -26,6 +41,7 @@ from race.schema import (
     RaceTypeStatSchema,
     RaceTypeBibInfoSchema,
 )
+from tridu_server.pagination import CursorPagination
 from tridu_server.schemas import ErrorObjectSchema
 
 router = Router()
@@ -52,6 +68,8 @@ def get_race_heats(request, race_id: int, race_type_id: int = None):
     heats = (
         Heat.objects.filter(race_id=race_id)
         .select_related("race", "race_type")
+        .with_participant_stats()
+        .prefetch_race_type_checkins()
         .order_by("race_type__name", "termination")
     )
 
@@ -61,6 +79,12 @@ def get_race_heats(request, race_id: int, race_type_id: int = None):
     return 200, heats
 
 
+@router.post("/{race_id}/heats/rosters", tags=["heats", "races"], response={200: int})
+def build_race_heat_roster_snapshots(request, race_id: int):
+    """Builds the missing and stale heat roster snapshots of the race, returns how many were built."""
+    return 200, build_race_heat_rosters(race_id)
+
+
 @router.get(
     "/{race_id}/heats/auto_schedule/ready",
     tags=["heats", "races"],
@@ -76,9 +100,65 @@ def get_race_ready_for_auto_schedule_heats(request, race_id: int):
     tags=["heats", "races"],
     response={200: bool, 400: ErrorObjectSchema},
 )
-def auto_schedule_race_heats(request, race_id: int):
+def auto_schedule_race_heats(
+    request,
+    race_id: int,
+    mode: AutoScheduleModes = AutoScheduleModes.GREEDY,
+    balance_weight: float = 0.0,
+    race_type_id: int = None,
+):
+    try:
+        auto_schedule_heats(
+            race_id=race_id,
+            mode=mode,
+            balance_weight=balance_weight,
+            race_type_ids=[race_type_id] if race_type_id else None,
+        )
+        return 200, True
+    except AutoSchedulerException as e:
+        return 400, ErrorObjectSchema(
+            title="Automatic Scheduler Error", status=400, details=e.__str__()
+        )
+
+
+@router.post(
+    "/{race_id}/heats/auto_schedule/preview",
+    tags=["heats", "races"],
+    response={200: HeatSchedulePlanSchema, 400: ErrorObjectSchema},
+)
+def preview_auto_schedule_race_heats(
+    request,
+    race_id: int,
+    mode: AutoScheduleModes = AutoScheduleModes.GREEDY,
+    balance_weight: float = 0.0,
+):
+    """Runs the automatic scheduler without saving, returns the proposed changes as a plan."""
+    try:
+        return 200, preview_auto_schedule_heats(
+            race_id=race_id, mode=mode, balance_weight=balance_weight
+        )
+    except AutoSchedulerException as e:
+        return 400, ErrorObjectSchema(
+            title="Automatic Scheduler Error", status=400, details=e.__str__()
+        )
+
+
+@router.post(
+    "/{race_id}/heats/auto_schedule/plans/{plan_id}",
+    tags=["heats", "races"],
+    response={200: bool, 400: ErrorObjectSchema, 404: ErrorObjectSchema},
+)
+def apply_auto_schedule_race_heats_plan(request, race_id: int, plan_id: int):
+    """Saves a plan created by the preview endpoint."""
+    try:
+        plan = HeatSchedulePlan.objects.get(id=plan_id, race_id=race_id)
+    except HeatSchedulePlan.DoesNotExist:
+        return 404, ErrorObjectSchema.from_404_error(
+            details="Heat Schedule Plan with id {} does not exist".format(plan_id)
+        )
+
     try:
-        auto_schedule_heats(race_id=race_id)
+        apply_heat_schedule_plan(plan)
         return 200, True
     except AutoSchedulerException as e:
         return 400, ErrorObjectSchema(
@@ -86,6 +166,23 @@ def auto_schedule_race_heats(request, race_id: int):
         )
 
 
+@router.post(
+    "/{race_id}/heats/auto_schedule/participants",
+    tags=["heats", "races"],
+    response={200: int, 400: ErrorObjectSchema},
+)
+def reschedule_race_participants(request, race_id: int, participant_ids: List[int]):
+    """Moves only the given changed participants into the existing schedule, returns the number of updated rows."""
+    try:
+        return 200, reschedule_participants(
+            race_id=race_id, participant_ids=participant_ids
+        )
+    except AutoSchedulerException as e:
+        return 400, ErrorObjectSchema(
+            title="Automatic Scheduler Error", status=400, details=e.__str__()
+        )
+
+
 @router.get(
     "/{race_id}/participants/invalid_swim_time/",
     tags=["participant"],
@@ -102,7 +199,8 @@ def get_race_participants_with_invalid_swim_time(request, race_id: int):
         Participant.objects.active()
         .for_race_id(race_id)
         .not_in_race_types(race_type_ids_without_swim_time)
-        .with_invalid_swim_time(),
+        .with_invalid_swim_time()
+        .prefetch_all_related(),
     )
 
 
@@ -111,19 +209,36 @@ def get_race_participants_with_invalid_swim_time(request, race_id: int):
     tags=["participant", "races"],
     response={200: List[ParticipantSchema]},
 )
-@paginate
+@paginate(CursorPagination)
 def get_race_participants(
     request, race_id: int, bib_number: int = None, active: bool = False
 ):
+    return filter_race_participants(race_id, bib_number, active).prefetch_all_related()
+
+
+@router.get(
+    "/{race_id}/participants/compact",
+    tags=["participant", "races"],
+    response={200: List[CompactParticipantSchema]},
+)
+@paginate(CursorPagination)
+def get_race_participants_compact(
+    request, race_id: int, bib_number: int = None, active: bool = False
+):
+    """The same participants as get_race_participants, with only their name, bib number and heat."""
+    return filter_race_participants(race_id, bib_number, active).only_compact_fields()
+
+
+def filter_race_participants(race_id: int, bib_number: int | None, active: bool):
     participants = Participant.objects.for_race_id(race_id=race_id)
 
     if active:
         participants = participants.active()
 
     if bib_number is not None:
-        participants = participants.filter(
-            bib_number__regex=r"{}".format(bib_number)
-        ).order_by("bib_number")
+        participants = participants.with_bib_number_prefix(bib_number).order_by(
+            "bib_number"
+        )
 
     return participants
 
@@ -136,7 +251,8 @@ def get_race_participants(
 def get_race_participant_download_info(request, race_id: int, active: bool = False):
     participants = (
         Participant.objects.for_race_id(race_id=race_id)
-        .select_all_related()
+        .select_related("origin", "race_type", "user")
+        .prefetch_heat_with_stats()
         .order_by("heat__start_datetime__hour", "heat__start_datetime__minute")
     )
 
@@ -146,13 +262,40 @@ def get_race_participant_download_info(request, race_id: int, active: bool = Fal
     return 200, participants
 
 
+@router.get("/{race_id}/participants_export", tags=["participant", "races"])
+def export_race_participants(
+    request,
+    race_id: int,
+    active: bool = False,
+    export_format: ExportFormats = ExportFormats.CSV,
+):
+    """
+    Streams the participants download, as CSV with a header row or as NDJSON with one participant per line.
+    """
+    return StreamingHttpResponse(
+        export_participants(race_id, active=active, export_format=export_format),
+        content_type=(
+            "text/csv" if export_format == ExportFormats.CSV else "application/x-ndjson"
+        ),
+        headers={
+            "Content-Disposition": 'attachment; filename="race_{}_participants.{}"'.format(
+                race_id, export_format.value
+            )
+        },
+    )
+
+
 @router.get(
     "/{race_id}/Relay_team_download",
     tags=["participant", "races"],
     response={200: List[DownloadInfoRelayTeamSchema]},
 )
 def get_race_relay_team_download_info(request, race_id: int, active: bool = False):
-    relay_teams = RelayTeam.objects.for_race_id(race_id=race_id)
+    relay_teams = (
+        RelayTeam.objects.for_race_id(race_id=race_id)
+        .select_related("race_type")
+        .prefetch_heat_with_stats()
+    )
 
     if active:
         relay_teams = relay_teams.active()
@@ -183,6 +326,7 @@ def patch_race_participants(
     if heat_id:
         participants = participants.in_heat(heat_id)
 
+    HeatRoster.objects.mark_stale(participants.values("heat_id"))
     return 200, participants.update(**participant_details.dict())
 
 
@@ -200,53 +344,34 @@ def get_race_participations(
     offset: int = 0,
 ):
     """
-    Returns all the normal and Relay Participants for this race. A limit of -1 will return all participations.
+    Returns all the normal and Relay Participants for this race, ordered by bib number, from the Participation index.
+    A limit of -1 will return all participations.
     """
 
-    participants = Participant.objects.for_race_id(race_id=race_id)
-    relay_participants = RelayParticipant.objects.filter(team__race_id=race_id)
+    participations = (
+        Participation.objects.for_race_id(race_id)
+        .select_related("race", "user")
+        .order_by_bib_number()
+    )
 
     if bib_number is not None:
-        participants = participants.filter(
-            bib_number__regex=r"{}".format(bib_number)
-        ).order_by("bib_number")
-        relay_participants = relay_participants.filter(
-            team__bib_number__regex=r"{}".format(bib_number)
-        ).order_by("team__bib_number")
+        participations = participations.with_bib_number_prefix(bib_number)
 
     if active:
-        participants = participants.active()
-        relay_participants = relay_participants.active()
-
-    participations = []
-
-    for participant in (
-        participants[offset : offset + limit] if limit >= 0 else participants
-    ):
-        participations.append(
-            ParticipationSchema(
-                id=participant.id,
-                race=participant.race,
-                type=ParticipationSchema.ParticipationTypes.PARTICIPANT,
-                user=participant.user,
-                bib_number=participant.bib_number,
-            )
+        participations = participations.active()
+
+    participations = [
+        ParticipationSchema(
+            id=participation.participation_id,
+            race=participation.race,
+            type=participation.kind,
+            user=participation.user,
+            bib_number=participation.bib_number,
         )
-
-    for relay_participant in (
-        relay_participants[offset : offset + limit]
-        if limit >= 0
-        else relay_participants
-    ):
-        participations.append(
-            ParticipationSchema(
-                id=relay_participant.id,
-                race=relay_participant.team.race,
-                type=ParticipationSchema.ParticipationTypes.RELAY_PARTICIPANT,
-                user=relay_participant.user,
-                bib_number=relay_participant.team.bib_number,
-            )
+        for participation in (
+            participations[offset : offset + limit] if limit >= 0 else participations
         )
+    ]
 
     return 200, participations
 
@@ -310,7 +435,10 @@ def get_race_stats(request, race_id: int):
     response={200: List[ParticipantSchema]},
 )
 def get_race_participants_disabled(request, race_id: int):
-    return 200, Participant.objects.inactive().for_race_id(race_id)
+    return (
+        200,
+        Participant.objects.inactive().for_race_id(race_id).prefetch_all_related(),
+    )
 
 
 @router.get(
@@ -371,6 +499,36 @@ def get_race_bib_info_per_race_type(request, race_id: int):
     return 200, bib_info_schema_items
 
 
+@router.post(
+    "/{race_id}/checkins/{checkin_id}/batch",
+    tags=["checkins", "races"],
+    response={200: List[BatchCheckInResultSchema], 404: ErrorObjectSchema},
+)
+def checkin_race_participants_batch(
+    request, race_id: int, checkin_id: int, batch_schema: BatchCheckInSchema
+):
+    """
+    Sets the check in of many participants and relay teams at once, for example from scanned bib numbers.
+    Every item is validated against the check in prerequisites, the response has one status per item.
+    """
+    graph = get_request_check_in_graph(request)
+    try:
+        checkin = get_check_in(checkin_id, graph)
+    except CheckIn.DoesNotExist:
+        return 404, ErrorObjectSchema.from_404_error(
+            "CheckIn with id {} does not exist".format(checkin_id)
+        )
+
+    return 200, check_in_batch(
+        race_id=race_id,
+        check_in=checkin,
+        participant_ids=batch_schema.participant_ids,
+        bib_numbers=batch_schema.bib_numbers,
+        value=batch_schema.value,
+        graph=graph,
+    )
+
+
 @router.delete(
     "/{race_id}", tags=["races"], response={204: None, 404: ErrorObjectSchema}
 )
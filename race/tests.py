@@ -0,0 +1,72 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+from heats.heat_service import auto_schedule_heats
+from tridu_server.testing import authorization_headers, create_race
+
+
+class RaceHeatsQueryCountTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="staff")
+
+    def count_queries(self, path: str, heat_count: int) -> int:
+        race = create_race(
+            participant_count=60,
+            heat_count=heat_count,
+            race_type_count=2,
+            relay_team_count=4,
+            seed=heat_count,
+        )
+        auto_schedule_heats(race.id)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                path.format(race_id=race.id), headers=authorization_headers(self.user)
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertQueriesDoNotGrowWithHeats(self, path: str) -> None:
+        query_counts = [
+            self.count_queries(path, heat_count) for heat_count in (2, 6, 15)
+        ]
+        self.assertEqual(len(set(query_counts)), 1, query_counts)
+
+    def test_heats(self):
+        self.assertQueriesDoNotGrowWithHeats("/api/races/{race_id}/heats")
+
+    def test_participants_download(self):
+        self.assertQueriesDoNotGrowWithHeats(
+            "/api/races/{race_id}/participants_download"
+        )
+
+    def test_relay_teams_download(self):
+        self.assertQueriesDoNotGrowWithHeats("/api/races/{race_id}/Relay_team_download")
+
+    def test_heats_query_count(self):
+        race = create_race(participant_count=60, heat_count=6, race_type_count=2)
+        auto_schedule_heats(race.id)
+
+        # the authenticated user, the heats with their participant stats and their race type check ins
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/api/races/{}/heats".format(race.id),
+                headers=authorization_headers(self.user),
+            )
+        self.assertEqual(len(response.json()), 12)
+
+    def test_participants_download_query_count(self):
+        race = create_race(participant_count=60, heat_count=6, race_type_count=2)
+        auto_schedule_heats(race.id)
+
+        # the authenticated user, the participants, their heats with participant stats and race type check ins
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                "/api/races/{}/participants_download".format(race.id),
+                headers=authorization_headers(self.user),
+            )
+        self.assertEqual(len(response.json()), 60)
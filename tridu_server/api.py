@@ -1,10 +1,18 @@
-from ninja import NinjaAPI
-
 from tridu_server.api_security import GlobalJWTAuth
+from tridu_server.renderers import (
+    MsgPackRenderer,
+    NegotiatedNinjaAPI,
+    NegotiatedRenderer,
+    ORJSONRenderer,
+)
 
 jwt_auth = GlobalJWTAuth()
-api = NinjaAPI(
-    auth=jwt_auth, title="Tridu API", version="1.0", description="API for Tridu Server"
+api = NegotiatedNinjaAPI(
+    auth=jwt_auth,
+    title="Tridu API",
+    version="1.0",
+    description="API for Tridu Server",
+    renderer=NegotiatedRenderer([ORJSONRenderer(), MsgPackRenderer()]),
 )
 
 api.add_router("/users/", "accounts.api.router")
@@ -15,3 +23,4 @@ api.add_router("/participants/", "participants.api.participant_api.router")
 api.add_router("/relay_teams/", "participants.api.relay_team_api.router")
 api.add_router("/check_ins/", "checkins.api.router")
 api.add_router("/wetbags/", "wetbags.api.router")
+api.add_router("/jobs/", "jobs.api.router")
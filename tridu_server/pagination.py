@@ -0,0 +1,145 @@
+import base64
+import binascii
+import datetime
+import json
+from typing import Any, List
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from ninja import Field, Schema
+from ninja.conf import settings
+from ninja.errors import HttpError
+from ninja.pagination import PaginationBase
+
+
+class CursorPagination(PaginationBase):
+    """
+    Keyset pagination, a page starts after the cursor of the previous page instead of at an offset.
+    The cursor holds the order by values of the last item of a page, the next page is found with a WHERE clause on
+    them, so a deep page costs the same as the first one and the total count is only run when asked for.
+
+    The queryset is ordered by its order_by fields, then by pk so every item has a unique position. The order by
+    fields must not be null.
+    """
+
+    class Input(Schema):
+        cursor: str | None = None
+        limit: int = Field(settings.PAGINATION_PER_PAGE, ge=1)
+        include_count: bool = False
+
+    class Output(Schema):
+        items: List[Any]
+        next_cursor: str | None = None
+        count: int | None = None
+
+    def paginate_queryset(
+        self,
+        queryset: QuerySet,
+        pagination: Input,
+        **params: Any,
+    ) -> Any:
+        limit = min(pagination.limit, settings.PAGINATION_MAX_LIMIT)
+        ordering = get_cursor_ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+
+        page = queryset
+        if pagination.cursor is not None:
+            page = page.filter(
+                get_cursor_filter(ordering, decode_cursor(pagination.cursor, ordering))
+            )
+
+        # one more item than the limit tells if there is a next page
+        items = list(page[: limit + 1])
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            names = [field.lstrip("-") for field in ordering]
+            if any("__" in name for name in names):
+                # related and transformed fields are not attributes of the item
+                values = queryset.filter(pk=items[-1].pk).values_list(*names).get()
+            else:
+                values = tuple(getattr(items[-1], name) for name in names)
+            next_cursor = encode_cursor(values)
+
+        return {
+            "items": items,
+            "next_cursor": next_cursor,
+            "count": self._items_count(queryset) if pagination.include_count else None,
+        }
+
+
+def get_cursor_ordering(queryset: QuerySet) -> List[str]:
+    """
+    The order by fields of a queryset, ending with pk.
+    :return: Field names, descending fields start with a -
+    """
+
+    ordering = [
+        field
+        for field in (queryset.query.order_by or queryset.model._meta.ordering)
+        if isinstance(field, str)
+    ]
+    if not any(field.lstrip("-") in ("pk", "id") for field in ordering):
+        ordering.append("pk")
+    return ordering
+
+
+def get_cursor_filter(ordering: List[str], values: List[Any]) -> Q:
+    """
+    Match the items after values in ordering, (a, b) > (1, 2) is a > 1 or (a = 1 and b > 2).
+    """
+
+    cursor_filter = Q()
+    for index, field in enumerate(ordering):
+        name = field.lstrip("-")
+        after = Q(
+            **{
+                "{}__{}".format(name, "lt" if field.startswith("-") else "gt"): values[
+                    index
+                ]
+            }
+        )
+        for previous_field, previous_value in zip(ordering[:index], values[:index]):
+            after &= Q(**{previous_field.lstrip("-"): previous_value})
+        cursor_filter |= after
+    return cursor_filter
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder without its truncation of datetimes and times to milliseconds, a cursor value must be exact or
+    items created within the same millisecond are skipped or repeated.
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values: tuple) -> str:
+    """
+    Floats are encoded by their shortest repr, which reads back as the same float.
+    """
+    return (
+        base64.urlsafe_b64encode(json.dumps(values, cls=CursorJSONEncoder).encode())
+        .decode()
+        .rstrip("=")
+    )
+
+
+def decode_cursor(cursor: str, ordering: List[str]) -> List[Any]:
+    """
+    :raises HttpError: If the cursor was not made for this ordering
+    """
+
+    try:
+        values = json.loads(
+            base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        )
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HttpError(400, "Invalid pagination cursor")
+
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise HttpError(400, "Invalid pagination cursor")
+    return values
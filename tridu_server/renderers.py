@@ -0,0 +1,114 @@
+import datetime
+from typing import Any, List
+
+import msgpack
+import orjson
+from django.http import HttpRequest, HttpResponse
+from django.utils.duration import duration_iso_string
+from ninja import NinjaAPI
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+from pydantic import BaseModel
+
+ninja_json_encoder = NinjaJSONEncoder()
+
+RENDER_JSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def encode_default(value: Any) -> Any:
+    """
+    Encode the values orjson and msgpack do not support like the default ninja renderer does.
+    Swim times are durations, they are checked first as they are in most payloads.
+    """
+    if isinstance(value, datetime.timedelta):
+        return duration_iso_string(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return encode_datetime(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    return ninja_json_encoder.default(value)
+
+
+def encode_datetime(value: datetime.datetime | datetime.date | datetime.time) -> str:
+    """
+    The datetime string of render_json, made by orjson itself so every renderer writes the same datetimes: ISO 8601
+    with the microseconds and Z for UTC. The default ninja renderer truncates them to milliseconds.
+    """
+    return orjson.dumps(value, option=RENDER_JSON_OPTIONS)[1:-1].decode()
+
+
+def render_json(data: Any) -> bytes:
+    """
+    The JSON of the API responses, for responses built outside of the API like the heat rosters.
+    """
+    return orjson.dumps(
+        data,
+        default=encode_default,
+        option=RENDER_JSON_OPTIONS,
+    )
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Render JSON with orjson, the output matches the default ninja JSON renderer except for datetimes, see
+    encode_datetime.
+    """
+
+    media_type = "application/json"
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> Any:
+        return render_json(data)
+
+
+class MsgPackRenderer(BaseRenderer):
+    """
+    Render MessagePack, with the same values as ORJSONRenderer.
+    """
+
+    media_type = "application/msgpack"
+    charset = None
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> Any:
+        return msgpack.packb(data, default=encode_default, datetime=False)
+
+
+class NegotiatedRenderer(BaseRenderer):
+    """
+    Render with the first renderer whose media type is in the request's Accept header, else the first renderer.
+    """
+
+    def __init__(self, renderers: List[BaseRenderer]):
+        self.renderers = renderers
+        self.media_type = renderers[0].media_type
+        self.charset = renderers[0].charset
+
+    def get_renderer(self, request: HttpRequest) -> BaseRenderer:
+        accept = request.headers.get("Accept", "")
+        for renderer in self.renderers:
+            if renderer.media_type in accept:
+                return renderer
+        return self.renderers[0]
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> Any:
+        return self.get_renderer(request).render(
+            request, data, response_status=response_status
+        )
+
+
+class NegotiatedNinjaAPI(NinjaAPI):
+    """
+    A NinjaAPI whose response content type is the one of the renderer picked for the request.
+    """
+
+    def create_response(
+        self, request: HttpRequest, data: Any, **kwargs
+    ) -> HttpResponse:
+        response = super().create_response(request, data, **kwargs)
+        if isinstance(self.renderer, NegotiatedRenderer):
+            renderer = self.renderer.get_renderer(request)
+            response["Content-Type"] = (
+                renderer.media_type
+                if renderer.charset is None
+                else "{}; charset={}".format(renderer.media_type, renderer.charset)
+            )
+        return response
@@ -16,6 +16,74 @@ class BulkCreateResponseSchema(Schema):
     message: str
     items: List[str]
 
+    @staticmethod
+    def for_import(
+        instance_name: str,
+        created: int,
+        duplicates: int,
+        errors: List[str],
+        items: List[str],
+    ) -> "BulkCreateResponseSchema":
+        """
+        Create the response of an import, with a message summarizing the counts.
+        :param instance_name: The plural name of the imported instances, used in the message
+        :param created: Number of instances created
+        :param duplicates: Number of instances that already existed
+        :param errors: Errors limiting specific instances from being created
+        :param items: The serialized instances
+        :return: A new bulk create response schema instance
+        """
+        return BulkCreateResponseSchema(
+            created=created,
+            duplicates=duplicates,
+            errors=errors,
+            items=items,
+            message=get_import_message(instance_name, created, duplicates, errors),
+        )
+
+
+class BulkImportResponseSchema(Schema):
+    """
+    Schema for an import response that identifies the imported instances by id, the full instances are only
+    added by endpoints that are asked for them.
+    """
+
+    created: int
+    duplicates: int
+    errors: List[str]
+    message: str
+    ids: List[int]
+
+
+def get_import_message(
+    instance_name: str, created: int, duplicates: int, errors: List[str]
+) -> str:
+    """
+    Summarize the counts of an import.
+    :param instance_name: The plural name of the imported instances
+    :return: The message for an import response
+    """
+
+    if len(errors) == 0:
+        return "{} {} created, {} were already found, no errors encountered.".format(
+            created, instance_name, duplicates
+        )
+    return "{} {} created, {} were already found but {} errors encountered!".format(
+        created, instance_name, duplicates, len(errors)
+    )
+
+
+class BulkImportChunkSchema(Schema):
+    """
+    Schema for the result of one chunk of a streamed import, sent as one line of NDJSON.
+    """
+
+    rows_done: int
+    created: int
+    duplicates: int
+    errors: List[str]
+    items: List[int]
+
 
 class ErrorObjectSchema(Schema):
     """
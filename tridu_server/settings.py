@@ -56,6 +56,7 @@ INSTALLED_APPS = [
     "participants",
     "race",
     "checkins",
+    "jobs",
 ]
 
 MIDDLEWARE = [
@@ -0,0 +1,124 @@
+import datetime
+import itertools
+import random
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from heats.models import Heat
+from participants.models import (
+    Participant,
+    Participation,
+    RelayParticipant,
+    RelayTeam,
+)
+from race.models import Race, RaceType
+
+_race_counter = itertools.count(1)
+
+
+def create_race(
+    participant_count: int = 50,
+    heat_count: int = 5,
+    race_type_count: int = 1,
+    relay_team_count: int = 0,
+    seed: int = 1,
+) -> Race:
+    """
+    Create a synthetic race for tests and benchmarks.
+    Participants are spread evenly over race_type_count race types, every 7th has no swim time and the others a random
+    one. Each race type gets heat_count heats five minutes apart, with just enough ideal capacity for its participants.
+    Relay teams get their own race type, two heats and one relay participant each.
+    :param participant_count: Number of participants
+    :param heat_count: Number of heats per participant race type
+    :param race_type_count: Number of participant race types
+    :param relay_team_count: Number of relay teams
+    :param seed: Seed of the swim times
+    :return: The race
+    """
+
+    generator = random.Random(seed)
+    prefix = "race{}".format(next(_race_counter))
+
+    race = Race.objects.create(name=prefix)
+    race_types = [
+        RaceType.objects.create(name="{} type {}".format(prefix, index))
+        for index in range(race_type_count)
+    ]
+    users = User.objects.bulk_create(
+        [
+            User(
+                username="{}_user{}".format(prefix, index),
+                first_name="First{}".format(index),
+                last_name="Last{}".format(index),
+            )
+            for index in range(participant_count + relay_team_count)
+        ]
+    )
+
+    participants = Participant.objects.bulk_create(
+        [
+            Participant(
+                user=users[index],
+                race=race,
+                race_type=race_types[index % race_type_count],
+                bib_number=index + 1,
+                swim_time=(
+                    datetime.timedelta(seconds=generator.randint(200, 900))
+                    if index % 7
+                    else None
+                ),
+            )
+            for index in range(participant_count)
+        ]
+    )
+    Participation.objects.sync_participants(participants)
+
+    start_datetime = datetime.datetime(2024, 1, 1, 7, 0, tzinfo=datetime.timezone.utc)
+    participants_per_race_type = -(-participant_count // race_type_count)
+    heats = [
+        Heat(
+            race=race,
+            race_type=race_type,
+            termination=str(index),
+            color="0x1",
+            start_datetime=start_datetime + datetime.timedelta(minutes=5 * index),
+            ideal_capacity=-(-participants_per_race_type // heat_count) + 1,
+        )
+        for race_type in race_types
+        for index in range(heat_count)
+    ]
+
+    if relay_team_count > 0:
+        relay_race_type = RaceType.objects.create(name="{} relay".format(prefix))
+        for index in range(relay_team_count):
+            relay_team = RelayTeam.objects.create(
+                race=race,
+                race_type=relay_race_type,
+                bib_number=participant_count + index + 1,
+                name="Team {}".format(index),
+            )
+            RelayParticipant.objects.create(
+                team=relay_team, user=users[participant_count + index]
+            )
+        heats += [
+            Heat(
+                race=race,
+                race_type=relay_race_type,
+                termination="R{}".format(index),
+                color="0x2",
+                start_datetime=start_datetime
+                + datetime.timedelta(minutes=5 * (heat_count + index)),
+                ideal_capacity=relay_team_count,
+            )
+            for index in range(2)
+        ]
+
+    Heat.objects.bulk_create(heats)
+    return race
+
+
+def authorization_headers(user: User) -> dict:
+    """:return: The headers of an API request authenticated as user, for the test client"""
+
+    return {"Authorization": "Bearer {}".format(AccessToken.for_user(user))}
@@ -0,0 +1,57 @@
+import datetime
+import json
+import zoneinfo
+
+import msgpack
+from django.test import RequestFactory, SimpleTestCase
+
+from tridu_server.renderers import MsgPackRenderer, ORJSONRenderer
+
+
+class RenderersTestCase(SimpleTestCase):
+
+    def render(self, data):
+        request = RequestFactory().get("/")
+        return (
+            json.loads(ORJSONRenderer().render(request, data, response_status=200)),
+            msgpack.unpackb(
+                MsgPackRenderer().render(request, data, response_status=200)
+            ),
+        )
+
+    def test_datetimes(self):
+        values = [
+            datetime.datetime(
+                2024, 1, 1, 7, 0, 0, 123456, tzinfo=datetime.timezone.utc
+            ),
+            datetime.datetime(2024, 1, 1, 7, 0, tzinfo=datetime.timezone.utc),
+            datetime.datetime(
+                2024, 6, 1, 7, 0, 0, 500, tzinfo=zoneinfo.ZoneInfo("America/Vancouver")
+            ),
+            datetime.datetime(2024, 1, 1, 7, 0, 0, 1),
+            datetime.date(2024, 1, 1),
+            datetime.time(7, 0, 0, 42),
+        ]
+
+        orjson_data, msgpack_data = self.render({"values": values})
+
+        self.assertEqual(orjson_data, msgpack_data)
+        self.assertEqual(
+            orjson_data["values"],
+            [
+                "2024-01-01T07:00:00.123456Z",
+                "2024-01-01T07:00:00Z",
+                "2024-06-01T07:00:00.000500-07:00",
+                "2024-01-01T07:00:00.000001",
+                "2024-01-01",
+                "07:00:00.000042",
+            ],
+        )
+
+    def test_durations(self):
+        orjson_data, msgpack_data = self.render(
+            {"swim_time": datetime.timedelta(minutes=15, seconds=4)}
+        )
+
+        self.assertEqual(orjson_data, msgpack_data)
+        self.assertEqual(orjson_data["swim_time"], "P0DT00H15M04S")